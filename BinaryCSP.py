@@ -1,10 +1,19 @@
 from collections import deque
+import hashlib
+import heapq
+import resource
 import sys
+import threading
+import time
 """
 	Base class for unary constraints
 	Implement isSatisfied in subclass to use
+	Constraint classes declare __slots__ so that large problems do not pay for a __dict__ per
+	constraint. Subclasses without __slots__ still work; they just get a __dict__ again.
 """
-class UnaryConstraint:
+class UnaryConstraint(object):
+	__slots__ = ('var',)
+
 	def __init__(self, var):
 		self.var = var
 
@@ -15,6 +24,8 @@ class UnaryConstraint:
 		return var == self.var
 
 class LazySchedule(UnaryConstraint):
+	__slots__ = ()
+
 	def isSatisfied(self, value):
 		start = float(value[1:].split(',')[0])
 		end = float(value[1:].split(',')[1])
@@ -28,6 +39,8 @@ class LazySchedule(UnaryConstraint):
 	Satisfied if value does not match passed in paramater
 """
 class BadValueConstraint(UnaryConstraint):
+	__slots__ = ('badValue',)
+
 	def __init__(self, var, badValue):
 		self.var = var
 		self.badValue = badValue
@@ -44,6 +57,8 @@ class BadValueConstraint(UnaryConstraint):
 	Satisfied if value matches passed in paramater
 """
 class GoodValueConstraint(UnaryConstraint):
+	__slots__ = ('goodValue',)
+
 	def __init__(self, var, goodValue):
 		self.var = var
 		self.goodValue = goodValue
@@ -59,7 +74,9 @@ class GoodValueConstraint(UnaryConstraint):
 	Base class for binary constraints
 	Implement isSatisfied in subclass to use
 """
-class BinaryConstraint:
+class BinaryConstraint(object):
+	__slots__ = ('var1', 'var2')
+
 	def __init__(self, var1, var2):
 		self.var1 = var1
 		self.var2 = var2
@@ -75,6 +92,8 @@ class BinaryConstraint:
 			return self.var2
 		return self.var1
 class NotOverlapConstraint(BinaryConstraint):
+	__slots__ = ()
+
 	def isSatisfied(self, value1, value2):
 		if (value1[0] != value2[0]):
 			return True
@@ -89,6 +108,8 @@ class NotOverlapConstraint(BinaryConstraint):
 				return False
 			return True
 class NotAffectedConstraint(BinaryConstraint):
+	__slots__ = ()
+
 	def isSatisfied(self, value1, value2):
 		if (int(value1[0]) == int(value2[0])):
 			return False
@@ -98,38 +119,316 @@ class NotAffectedConstraint(BinaryConstraint):
 			return False
 		return True
 
+"""
+	Implementation of BinaryConstraint for the one-queen-per-row N-queens model.
+	Values are column numbers and distance is how many rows apart the two queens are.
+	Satisfied if the queens share neither a column nor a diagonal.
+"""
+class QueensConstraint(BinaryConstraint):
+	__slots__ = ('distance',)
+
+	def __init__(self, var1, var2, distance):
+		self.var1 = var1
+		self.var2 = var2
+		self.distance = int(distance)
+
+	def isSatisfied(self, value1, value2):
+		column1 = int(value1)
+		column2 = int(value2)
+		if (column1 == column2):
+			return False
+		if (abs(column1 - column2) == self.distance):
+			return False
+		return True
+
+	def __repr__(self):
+		return 'QueensConstraint (%s, %s) {distance: %d}' % (str(self.var1), str(self.var2), self.distance)
+
+"""
+	Implementation of BinaryConstraint given by a table of forbidden value pairs.
+	Pairs are passed as 'value1,value2' strings or as tuples. Like the other constraints in this
+	file it is treated as symmetric, so (a, b) also forbids (b, a).
+"""
+class ForbiddenPairsConstraint(BinaryConstraint):
+	__slots__ = ('forbidden',)
+
+	def __init__(self, var1, var2, *pairs):
+		self.var1 = var1
+		self.var2 = var2
+		self.forbidden = set([])
+		for pair in pairs:
+			if isinstance(pair, str):
+				pair = tuple(pair.split(','))
+			self.forbidden.add((pair[0], pair[1]))
+			self.forbidden.add((pair[1], pair[0]))
+
+	def isSatisfied(self, value1, value2):
+		return (value1, value2) not in self.forbidden
+
+	def __repr__(self):
+		return 'ForbiddenPairsConstraint (%s, %s) {forbidden: %d}' % (str(self.var1), str(self.var2), len(self.forbidden))
+
 """
 	Implementation of BinaryConstraint
 	Satisfied if both values assigned are different
 """
 class NotEqualConstraint(BinaryConstraint):
+	__slots__ = ()
+
 	def isSatisfied(self, value1, value2):
 		if value1 == value2:
 			return False
 		return True
 
 	def __repr__(self):
-	    return 'BadValueConstraint (%s, %s)' % (str(self.var1), str(self.var2))
+		return 'NotEqualConstraint (%s, %s)' % (str(self.var1), str(self.var2))
 
 
-class ConstraintSatisfactionProblem:
+"""
+	A group of binary constraints of one type between every pair of a list of variables, such as
+	the NotEqualConstraint clique of a sudoku row. Groups are kept unexpanded by
+	ConstraintSatisfactionProblem until its binary constraints are first used.
+"""
+class PairwiseConstraints(object):
+	__slots__ = ('constraintClass', 'variables', 'args')
+
+	def __init__(self, constraintClass, variables, *args):
+		self.constraintClass = constraintClass
+		self.variables = list(variables)
+		self.args = args
+
+	"""
+	Gets the pairs of variables constrained by this group, in order.
+	"""
+	def pairs(self):
+		variables = self.variables
+		for i in xrange(len(variables)):
+			for j in xrange(i + 1, len(variables)):
+				yield (variables[i], variables[j])
+
+	def __repr__(self):
+		return 'PairwiseConstraints (%s) {variables: %d}' % (self.constraintClass.__name__, len(self.variables))
+
+
+"""
+	Stands in for the binaryConstraints attribute of a ConstraintSatisfactionProblem while it has
+	constraint groups that are not expanded yet. Reading it expands them, after which the plain
+	instance attribute takes over, so hot loops do not pay for a property.
+"""
+class PendingConstraints(object):
+	def __get__(self, csp, owner):
+		if csp is None:
+			return self
+		csp.expandGroups()
+		return csp.binaryConstraints
+
+
+class ConstraintSatisfactionProblem(object):
 	"""
 	Structure of a constraint satisfaction problem.
 	Variables and domains should be lists of equal length that have the same order.
 	varDomains is a dictionary mapping variables to possible domains.
 
+	Constraint groups are expanded into binaryConstraints the first time it is read. Among groups
+	expanded together, a pair of variables already constrained by an earlier group of the same type
+	and arguments is skipped, so overlapping cliques such as sudoku rows and boxes do not produce
+	duplicate constraints.
+
+	savedPhases maps variables to their values in the last solution that solve found for this
+	problem with phaseSaving set to True.
+
 	Args:
 		variables (list<string>): a list of variable names
 		domains (list<set<value>>): a list of sets of domains for each variable
 		binaryConstraints (list<BinaryConstraint>): a list of binary constraints to satisfy
 		unaryConstraints (list<BinaryConstraint>): a list of unary constraints to satisfy
+		constraintGroups (list<PairwiseConstraints>): groups of binary constraints, expanded lazily
 	"""
-	def __init__(self, variables, domains, binaryConstraints = [], unaryConstraints = []):
+	def __init__(self, variables, domains, binaryConstraints = None, unaryConstraints = None, constraintGroups = None):
 		self.varDomains = {}
 		for i in xrange(len(variables)):
 			self.varDomains[variables[i]] = domains[i]
-		self.binaryConstraints = binaryConstraints
+		if binaryConstraints is None:
+			binaryConstraints = []
+		if unaryConstraints is None:
+			unaryConstraints = []
+		self.pendingGroups = list(constraintGroups or [])
+		self.constraintList = binaryConstraints
+		if not self.pendingGroups:
+			self.binaryConstraints = binaryConstraints
 		self.unaryConstraints = unaryConstraints
+		self.constraintIndex = None
+		self.indexedConstraints = None
+		self.indexedCount = 0
+		self.unaryIndex = None
+		self.indexedUnaryConstraints = None
+		self.indexedUnaryCount = 0
+		self.rootStates = {}
+		self.savedPhases = {}
+
+	binaryConstraints = PendingConstraints()
+
+	"""
+	Adds a group of binary constraints, to be expanded when the binary constraints are next used.
+
+	Args:
+		group (PairwiseConstraints): the group to add
+	"""
+	def addConstraintGroup(self, group):
+		self.constraintList = self.__dict__.pop('binaryConstraints', self.constraintList)
+		self.pendingGroups.append(group)
+		self.rootStates = {}
+
+	"""
+	Expands the pending constraint groups into the binary constraint list and makes it the
+	binaryConstraints attribute again.
+	"""
+	def expandGroups(self):
+		groups = self.pendingGroups
+		self.pendingGroups = []
+		seen = {}
+		for group in groups:
+			constrained = seen.setdefault((group.constraintClass, group.args), set([]))
+			for var1, var2 in group.pairs():
+				key = (var1, var2) if var1 < var2 else (var2, var1)
+				if key not in constrained:
+					constrained.add(key)
+					self.constraintList.append(group.constraintClass(var1, var2, *group.args))
+		self.binaryConstraints = self.constraintList
+
+	"""
+	Gets the binary constraints that involve a variable.
+	The index is built on first use and rebuilt when binaryConstraints is replaced or resized.
+
+	Args:
+		var (string): the variable
+	Returns:
+		list<BinaryConstraint>
+		the constraints affecting var
+	"""
+	def constraintsOf(self, var):
+		if (self.indexedConstraints is not self.binaryConstraints or self.indexedCount != len(self.binaryConstraints)):
+			self.constraintIndex = {}
+			for cons in self.binaryConstraints:
+				self.constraintIndex.setdefault(cons.var1, []).append(cons)
+				if (cons.var2 != cons.var1):
+					self.constraintIndex.setdefault(cons.var2, []).append(cons)
+			self.indexedConstraints = self.binaryConstraints
+			self.indexedCount = len(self.binaryConstraints)
+		return self.constraintIndex.get(var, [])
+
+	"""
+	Gets the unary constraints on a variable, indexed the same way as constraintsOf.
+
+	Args:
+		var (string): the variable
+	Returns:
+		list<UnaryConstraint>
+		the unary constraints affecting var
+	"""
+	def unaryConstraintsOf(self, var):
+		if (self.indexedUnaryConstraints is not self.unaryConstraints or self.indexedUnaryCount != len(self.unaryConstraints)):
+			self.unaryIndex = {}
+			for cons in self.unaryConstraints:
+				self.unaryIndex.setdefault(cons.var, []).append(cons)
+			self.indexedUnaryConstraints = self.unaryConstraints
+			self.indexedUnaryCount = len(self.unaryConstraints)
+		return self.unaryIndex.get(var, [])
+
+	"""
+	Adds a unary or binary constraint, updating the constraint indexes in place instead of
+	letting the next lookup rebuild them. Cached root states are dropped.
+
+	Args:
+		constraint (UnaryConstraint or BinaryConstraint): the constraint to add
+	"""
+	def addConstraint(self, constraint):
+		if isinstance(constraint, UnaryConstraint):
+			inSync = self.indexedUnaryConstraints is self.unaryConstraints and self.indexedUnaryCount == len(self.unaryConstraints)
+			self.unaryConstraints.append(constraint)
+			if inSync:
+				self.unaryIndex.setdefault(constraint.var, []).append(constraint)
+				self.indexedUnaryCount += 1
+		else:
+			inSync = self.indexedConstraints is self.binaryConstraints and self.indexedCount == len(self.binaryConstraints)
+			self.binaryConstraints.append(constraint)
+			if inSync:
+				self.constraintIndex.setdefault(constraint.var1, []).append(constraint)
+				if (constraint.var2 != constraint.var1):
+					self.constraintIndex.setdefault(constraint.var2, []).append(constraint)
+				self.indexedCount += 1
+		self.rootStates = {}
+
+	"""
+	Removes a constraint added to this problem, keeping the constraint indexes in sync like
+	addConstraint. Raises ValueError if the constraint is not part of the problem.
+
+	Args:
+		constraint (UnaryConstraint or BinaryConstraint): the constraint to remove
+	"""
+	def removeConstraint(self, constraint):
+		if isinstance(constraint, UnaryConstraint):
+			inSync = self.indexedUnaryConstraints is self.unaryConstraints and self.indexedUnaryCount == len(self.unaryConstraints)
+			self.unaryConstraints.remove(constraint)
+			if inSync:
+				self.unaryIndex[constraint.var].remove(constraint)
+				self.indexedUnaryCount -= 1
+		else:
+			inSync = self.indexedConstraints is self.binaryConstraints and self.indexedCount == len(self.binaryConstraints)
+			self.binaryConstraints.remove(constraint)
+			if inSync:
+				self.constraintIndex[constraint.var1].remove(constraint)
+				if (constraint.var2 != constraint.var1):
+					self.constraintIndex[constraint.var2].remove(constraint)
+				self.indexedCount -= 1
+		self.rootStates = {}
+
+	"""
+	Gets the RootState of this problem, computing it once per useAC3 setting.
+	The cached state is recomputed if the constraint lists are replaced or resized. With a
+	domainCache, a state not cached in memory is looked up on disk by fingerprint, and stored
+	there once computed.
+
+	Args:
+		useAC3 (boolean): whether AC3 is part of the root reductions
+		domainCache (DomainCache): optional persistent cache of root states
+	Returns:
+		RootState
+		the reduced root domains to create assignments from
+	"""
+	def rootState(self, useAC3=True, domainCache=None):
+		key = (id(self.binaryConstraints), len(self.binaryConstraints), id(self.unaryConstraints), len(self.unaryConstraints))
+		cached = self.rootStates.get(useAC3)
+		if (cached is None or cached[0] != key):
+			root = None
+			if (domainCache is not None):
+				fingerprint = self.fingerprint()
+				root = domainCache.load(fingerprint, useAC3)
+			if (root is None):
+				root = RootState(self, useAC3)
+				if (domainCache is not None):
+					domainCache.store(fingerprint, root)
+			cached = (key, root)
+			self.rootStates[useAC3] = cached
+		return cached[1]
+
+	"""
+	Gets a content fingerprint of the problem: a hash of its variables, their domains, and the
+	types and attributes of its constraints, independent of the order they were given in.
+	Problems with the same fingerprint have the same root reductions, so it can key caches that
+	outlive the process, such as DomainCache.
+
+	Returns:
+		string
+		a hex SHA-1 digest
+	"""
+	def fingerprint(self):
+		parts = sorted('%s %s' % (canonicalValue(var), canonicalValue(self.varDomains[var])) for var in self.varDomains)
+		parts.append('|')
+		parts.extend(sorted(constraintKey(cons) for cons in self.binaryConstraints))
+		parts.append('|')
+		parts.extend(sorted(constraintKey(cons) for cons in self.unaryConstraints))
+		return hashlib.sha1('\n'.join(parts)).hexdigest()
 
 	def __repr__(self):
 	    return '---Variable Domains\n%s---Binary Constraints\n%s---Unary Constraints\n%s' % ( \
@@ -138,20 +437,78 @@ class ConstraintSatisfactionProblem:
 	        ''.join([str(e) + '\n' for e in self.binaryConstraints]))
 
 
-class Assignment:
+"""
+	A string for a value that does not depend on set ordering, for fingerprint.
+"""
+def canonicalValue(value):
+	if isinstance(value, (set, frozenset)):
+		return '{%s}' % ','.join(sorted(canonicalValue(item) for item in value))
+	if isinstance(value, (list, tuple)):
+		return '(%s)' % ','.join(canonicalValue(item) for item in value)
+	return repr(value)
+
+"""
+	A string for a constraint made of its class and the values of its slots and attributes, for
+	fingerprint.
+"""
+def constraintKey(cons):
+	names = set([])
+	for cls in type(cons).__mro__:
+		slots = getattr(cls, '__slots__', ())
+		names.update((slots,) if isinstance(slots, str) else slots)
+	if hasattr(cons, '__dict__'):
+		names.update(cons.__dict__)
+	names.discard('__dict__')
+	names.discard('__weakref__')
+	cls = type(cons)
+	return '%s.%s %s' % (cls.__module__, cls.__name__, ' '.join('%s=%s' % (name, canonicalValue(getattr(cons, name))) for name in sorted(names) if hasattr(cons, name)))
+
+
+class Assignment(object):
 	"""
 	Representation of a partial assignment.
 	Has the same varDomains dictionary stucture as ConstraintSatisfactionProblem.
 	Keeps a second dictionary from variables to assigned values, with None being no assignment.
+	The search bookkeeping (stats, listeners, limits, supportCounts) is None unless solve sets it.
+
+	When created from a RootState the domains are the root's frozensets, shared copy-on-write:
+	a domain is only copied when writableDomain is first called for its variable.
 
 	Args:
 		csp (ConstraintSatisfactionProblem): the problem definition for this assignment
+		rootState (RootState): optional reduced root domains to start from instead of csp.varDomains
 	"""
-	def __init__(self, csp):
-		self.varDomains = {}
-		for var in csp.varDomains:
-			self.varDomains[var] = set(csp.varDomains[var])
+	__slots__ = ('varDomains', 'assignedValues', 'stats', 'listeners', 'limits', 'supportCounts')
+
+	def __init__(self, csp, rootState=None):
+		if rootState is not None:
+			self.varDomains = dict(rootState.domains)
+		else:
+			self.varDomains = {}
+			for var in csp.varDomains:
+				self.varDomains[var] = set(csp.varDomains[var])
 		self.assignedValues = { var: None for var in self.varDomains }
+		self.stats = None
+		self.listeners = None
+		self.limits = None
+		self.supportCounts = None
+
+	"""
+	Gets the domain of a variable for modification, copying it first if it is still shared
+	with a RootState. Functions that remove or restore values go through this method.
+
+	Args:
+		var (string): the variable whose domain will be modified
+	Returns:
+		set<value>
+		the mutable domain of var
+	"""
+	def writableDomain(self, var):
+		domain = self.varDomains[var]
+		if (domain.__class__ is frozenset):
+			domain = set(domain)
+			self.varDomains[var] = domain
+		return domain
 
 	"""
 	Determines whether this variable has been assigned.
@@ -197,6 +554,295 @@ class Assignment:
 
 
 
+class RootState(object):
+	"""
+	Snapshot of a problem's domains after eliminateUnaryConstraints and, optionally, AC3.
+	Assignments created from it share its frozen domains copy-on-write, so solving the same base
+	problem repeatedly skips the root reductions and only copies the domains a search modifies.
+	Get one with ConstraintSatisfactionProblem.rootState.
+
+	Args:
+		csp (ConstraintSatisfactionProblem): the problem to reduce
+		useAC3 (boolean): whether AC3 is part of the root reductions
+		domains (dictionary<string, frozenset<value>>): already reduced domains to wrap instead of
+				computing them, or None
+	"""
+	__slots__ = ('domains', 'useAC3')
+
+	def __init__(self, csp, useAC3=True, domains=None):
+		self.useAC3 = useAC3
+		if domains is not None:
+			self.domains = domains
+			return
+		assignment = eliminateUnaryConstraints(Assignment(csp), csp)
+		if (assignment != None and useAC3):
+			assignment = AC3(assignment, csp)
+		if (assignment == None):
+			self.domains = None
+		else:
+			self.domains = dict((var, frozenset(assignment.varDomains[var])) for var in assignment.varDomains)
+
+	"""
+	Determines whether the root reductions left every domain non-empty.
+	"""
+	def isConsistent(self):
+		return self.domains is not None
+
+
+class SearchStatistics:
+	"""
+	Opt-in counters for a solve. Pass an instance to solve, or set it as the stats attribute of an
+	Assignment, and the search, inference and propagation functions update it as they run.
+	Nothing is counted when the assignment has no statistics object.
+
+	Attributes:
+		nodes (int): values assigned to variables during search
+		backtracks (int): search nodes that failed and were undone
+		constraintChecks (int): calls to isSatisfied on unary and binary constraints
+		valuesPruned (int): values removed from domains by inferences and propagation
+		revisions (int): calls to revise
+		phaseTimes (dictionary<string, float>): seconds spent in 'unary', 'ac3', 'preprocess' and 'search'
+	"""
+	def __init__(self):
+		self.nodes = 0
+		self.backtracks = 0
+		self.constraintChecks = 0
+		self.valuesPruned = 0
+		self.revisions = 0
+		self.phaseTimes = {}
+
+	def addPhaseTime(self, phase, seconds):
+		self.phaseTimes[phase] = self.phaseTimes.get(phase, 0.0) + seconds
+
+	def asDict(self):
+		return {
+			'nodes': self.nodes,
+			'backtracks': self.backtracks,
+			'constraintChecks': self.constraintChecks,
+			'valuesPruned': self.valuesPruned,
+			'revisions': self.revisions,
+			'phaseTimes': dict(self.phaseTimes)
+		}
+
+	def __repr__(self):
+		return 'SearchStatistics %s' % str(self.asDict())
+
+
+class SearchListener:
+	"""
+	Base class for search event listeners. Override the events of interest and pass instances to
+	solve in its listeners list. Events are only dispatched when at least one listener is registered.
+	Built-in listeners are in SearchListeners.py.
+
+	Events:
+		onAssign(var, value): value has been assigned to var
+		onUnassign(var, value): the assignment of value to var has been retracted
+		onPrune(var, value): value has been removed from the domain of var
+		onWipeout(var): propagation would leave the domain of var empty
+		onSolution(assignment): a complete consistent assignment has been found
+		onRestart(): search restarts from the root (for engines with restart strategies)
+		onPhaseStart(phase), onPhaseEnd(phase): solve enters or leaves 'unary', 'ac3', 'preprocess' or 'search';
+				every phase is ended, also when a limit stops it
+	"""
+	def onAssign(self, var, value):
+		pass
+
+	def onUnassign(self, var, value):
+		pass
+
+	def onPrune(self, var, value):
+		pass
+
+	def onWipeout(self, var):
+		pass
+
+	def onSolution(self, assignment):
+		pass
+
+	def onRestart(self):
+		pass
+
+	def onPhaseStart(self, phase):
+		pass
+
+	def onPhaseEnd(self, phase):
+		pass
+
+
+class CancellationToken:
+	"""
+	Lets another thread cancel a running solve. Pass the token in SearchLimits and call cancel;
+	the search stops at its next limit check.
+	"""
+	def __init__(self):
+		self.event = threading.Event()
+
+	def cancel(self):
+		self.event.set()
+
+	def isCancelled(self):
+		return self.event.is_set()
+
+
+class SearchLimitExceeded(Exception):
+	"""
+	Raised inside the search when a SearchLimits bound is hit. solve catches it and returns a
+	LimitReached result.
+	"""
+	def __init__(self, reason):
+		Exception.__init__(self, reason)
+		self.reason = reason
+
+
+class SearchLimits:
+	"""
+	Bounds for a solve. Node counts are checked on every node; the clock, memory, constraint
+	checks and the cancellation token only every checkInterval nodes or revisions to keep the
+	checks cheap. The deepest partial assignment reached is kept for the LimitReached result.
+
+	Args:
+		timeLimit (float): seconds allowed from the start of the solve
+		deadline (float): absolute time.time() value by which the solve must stop
+		maxNodes (int): maximum number of search nodes
+		maxMemory (int): ceiling in bytes on the resident memory of the process, see residentMemory
+		cancelToken (CancellationToken): token another thread can use to cancel the solve
+		checkInterval (int): nodes or revisions between clock, memory, checks and cancellation checks
+		maxChecks (int): maximum number of constraint checks counted in the SearchStatistics
+				given to start
+	"""
+	def __init__(self, timeLimit=None, deadline=None, maxNodes=None, maxMemory=None, cancelToken=None, checkInterval=64, maxChecks=None):
+		self.timeLimit = timeLimit
+		self.deadline = deadline
+		self.maxNodes = maxNodes
+		self.maxMemory = maxMemory
+		self.cancelToken = cancelToken
+		self.checkInterval = checkInterval
+		self.maxChecks = maxChecks
+		self.start()
+
+	"""
+	Resets the counters and fixes the deadline. solve calls this when it begins, with the
+	statistics that maxChecks is checked against.
+	"""
+	def start(self, stats=None):
+		self.stats = stats
+		self.peakAtStart = peakMemory() if self.maxMemory is not None else None
+		self.nodes = 0
+		self.work = 0
+		self.depth = 0
+		self.bestDepth = -1
+		self.bestAssignment = None
+		self.stopAt = self.deadline
+		if self.timeLimit is not None:
+			stopAt = time.time() + self.timeLimit
+			if self.stopAt is None or stopAt < self.stopAt:
+				self.stopAt = stopAt
+
+	"""
+	Checks the clock, memory, constraint checks and cancellation token.
+	Raises SearchLimitExceeded if one of them is exceeded.
+	"""
+	def checkNow(self):
+		if self.cancelToken is not None and self.cancelToken.isCancelled():
+			raise SearchLimitExceeded('cancelled')
+		if self.stopAt is not None and time.time() >= self.stopAt:
+			raise SearchLimitExceeded('time')
+		if self.maxMemory is not None and residentMemory(self.peakAtStart) > self.maxMemory:
+			raise SearchLimitExceeded('memory')
+		if self.maxChecks is not None and self.stats is not None and self.stats.constraintChecks > self.maxChecks:
+			raise SearchLimitExceeded('checks')
+
+	"""
+	Counts one unit of propagation work, checking the other limits every checkInterval units.
+	"""
+	def checkWork(self):
+		self.work += 1
+		if self.work % self.checkInterval == 0:
+			self.checkNow()
+
+	"""
+	Counts one search node against maxNodes, checking the other limits every checkInterval nodes.
+	For engines that keep their own state instead of an Assignment, such as local search and the
+	columnar search; the others call enterNode.
+	"""
+	def countNode(self):
+		self.nodes += 1
+		if self.maxNodes is not None and self.nodes > self.maxNodes:
+			raise SearchLimitExceeded('nodes')
+		if self.nodes % self.checkInterval == 0:
+			self.checkNow()
+
+	"""
+	Called by the search engines after a value is assigned.
+	Records the deepest partial assignment and raises SearchLimitExceeded when a limit is hit.
+	"""
+	def enterNode(self, assignment):
+		self.depth += 1
+		if self.depth > self.bestDepth:
+			self.bestDepth = self.depth
+			self.bestAssignment = dict(assignment.assignedValues)
+		self.countNode()
+
+	"""
+	Called by the search engines when an assigned value is retracted.
+	"""
+	def leaveNode(self):
+		self.depth -= 1
+
+
+"""
+	The resident memory of the process in bytes, for SearchLimits.maxMemory. On Linux this is the
+	current resident set size from /proc/self/statm, so memory a previous solve in the same
+	process used and freed does not count. Other platforms only report the peak (ru_maxrss, in
+	bytes on macOS and kilobytes elsewhere); there the growth of the peak since peakAtStart, the
+	peak when the solve started, is returned instead.
+"""
+def residentMemory(peakAtStart=0):
+	try:
+		with open('/proc/self/statm') as statm:
+			return int(statm.read().split()[1]) * resource.getpagesize()
+	except (IOError, ValueError, IndexError):
+		return peakMemory() - peakAtStart
+
+def peakMemory():
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == 'darwin':
+		return peak
+	return peak * 1024
+
+
+class LimitReached:
+	"""
+	Result of solve when a SearchLimits bound stopped the search before it finished.
+	It is false in boolean context, like a failed solve.
+
+	Attributes:
+		reason (string): 'time', 'nodes', 'memory', 'checks' or 'cancelled'
+		partialAssignment (dictionary<string, value>): the deepest partial assignment reached,
+			unassigned variables map to None. None if the search never assigned a value
+		stats (SearchStatistics): statistics of the interrupted solve
+	"""
+	def __init__(self, reason, partialAssignment, stats):
+		self.reason = reason
+		self.partialAssignment = partialAssignment
+		self.stats = stats
+
+	def __nonzero__(self):
+		return False
+
+	def __repr__(self):
+		return 'LimitReached (%s)' % self.reason
+
+
+"""
+	Calls the named event on every listener. Callers check that listeners is not None first,
+	so nothing is dispatched when no listener is registered.
+"""
+def notifyListeners(listeners, event, *args):
+	for listener in listeners:
+		getattr(listener, event)(*args)
+
+
 ####################################################################################################
 
 
@@ -215,11 +861,13 @@ class Assignment:
 		True if the value would be consistent with all currently assigned values, False otherwise
 """
 def consistent(assignment, csp, var, value):
-	for cons in csp.binaryConstraints:
-		if (cons.affects(var)):
-			if (assignment.isAssigned(cons.otherVariable(var))):
-				if (not (cons.isSatisfied(value, assignment.assignedValues[cons.otherVariable(var)]))):
-					return False
+	stats = assignment.stats
+	for cons in csp.constraintsOf(var):
+		if (assignment.isAssigned(cons.otherVariable(var))):
+			if (stats is not None):
+				stats.constraintChecks += 1
+			if (not (cons.isSatisfied(value, assignment.assignedValues[cons.otherVariable(var)]))):
+				return False
 	return True
 
 
@@ -244,22 +892,38 @@ def consistent(assignment, csp, var, value):
 		A completed and consistent assignment. None if no solution exists.
 """
 def recursiveBacktracking(assignment, csp, orderValuesMethod, selectVariableMethod):
+	stats = assignment.stats
+	listeners = assignment.listeners
+	limits = assignment.limits
 	next = selectVariableMethod(assignment, csp)
 	avaliableVal = orderValuesMethod(assignment, csp, next)
 	for nextval in avaliableVal:
 		if (consistent(assignment, csp, next, nextval)):
 			assignment.assignedValues[next] = nextval
+			if (stats is not None):
+				stats.nodes += 1
+			if (listeners is not None):
+				notifyListeners(listeners, 'onAssign', next, nextval)
+			if (limits is not None):
+				limits.enterNode(assignment)
 			if (assignment.isComplete()):
 				return assignment
 			result = recursiveBacktracking(assignment, csp, orderValuesMethod, selectVariableMethod)
 			if (result):
 				return result
+			if (listeners is not None):
+				notifyListeners(listeners, 'onUnassign', next, nextval)
+			if (limits is not None):
+				limits.leaveNode()
 	assignment.assignedValues[next] = None
+	if (stats is not None):
+		stats.backtracks += 1
 	return None
 
 
 """
 	Uses unary constraints to eleminate values from an assignment.
+	Constraints are looked up per variable and applied with applyUnaryConstraints.
 
 	Args:
 		assignment (Assignment): a partial assignment to expand upon
@@ -269,17 +933,80 @@ def recursiveBacktracking(assignment, csp, orderValuesMethod, selectVariableMeth
 		An assignment with domains restricted by unary constraints. None if no solution exists.
 """
 def eliminateUnaryConstraints(assignment, csp):
-	domains = assignment.varDomains
-	for var in domains:
-		for constraint in (c for c in csp.unaryConstraints if c.affects(var)):
-			for value in (v for v in list(domains[var]) if not constraint.isSatisfied(v)):
-				domains[var].remove(value)
-				if len(domains[var]) == 0:
-				 	# Failure due to invalid assignment
-				 	return None
+	for var in assignment.varDomains:
+		constraints = csp.unaryConstraintsOf(var)
+		if (constraints and applyUnaryConstraints(assignment, var, constraints) == None):
+			return None
 	return assignment
 
 
+"""
+	Restricts the domain of one variable by a list of unary constraints on it.
+	GoodValueConstraint and BadValueConstraint are applied directly to the domain; all other unary
+	constraints are checked together in one pass over the remaining values. The domain is only
+	copied (see Assignment.writableDomain) when a value is actually removed.
+
+	Args:
+		assignment (Assignment): a partial assignment to expand upon
+		var (string): the variable to restrict
+		constraints (list<UnaryConstraint>): the unary constraints on var
+	Returns:
+		list<value>
+		the values removed, or None if the domain of var is wiped out
+"""
+def applyUnaryConstraints(assignment, var, constraints):
+	stats = assignment.stats
+	listeners = assignment.listeners
+	domain = assignment.varDomains[var]
+	if (not domain):
+		return []
+	removed = []
+	custom = []
+	for constraint in constraints:
+		if (constraint.__class__ is GoodValueConstraint):
+			if (stats is not None):
+				stats.constraintChecks += 1
+			if (constraint.goodValue not in domain):
+				removed.extend(domain)
+				domain = assignment.writableDomain(var)
+				domain.clear()
+			elif (len(domain) > 1):
+				removed.extend(value for value in domain if value != constraint.goodValue)
+				domain = assignment.writableDomain(var)
+				domain.intersection_update((constraint.goodValue,))
+		elif (constraint.__class__ is BadValueConstraint):
+			if (stats is not None):
+				stats.constraintChecks += 1
+			if (constraint.badValue in domain):
+				domain = assignment.writableDomain(var)
+				domain.remove(constraint.badValue)
+				removed.append(constraint.badValue)
+		else:
+			custom.append(constraint)
+	if (custom and domain):
+		if (stats is not None):
+			stats.constraintChecks += len(domain) * len(custom)
+		failed = [value for value in domain if not all(constraint.isSatisfied(value) for constraint in custom)]
+		if (failed):
+			domain = assignment.writableDomain(var)
+			domain.difference_update(failed)
+			removed.extend(failed)
+	if (stats is not None):
+		stats.valuesPruned += len(removed)
+	if (listeners is not None):
+		for value in removed:
+			notifyListeners(listeners, 'onPrune', var, value)
+	if (assignment.supportCounts is not None):
+		for value in removed:
+			assignment.supportCounts.removed(var, value)
+	if len(domain) == 0:
+		# Failure due to invalid assignment
+		if (listeners is not None):
+			notifyListeners(listeners, 'onWipeout', var)
+		return None
+	return removed
+
+
 """
 	Trivial method for choosing the next variable to assign.
 	Uses no heuristics.
@@ -321,11 +1048,7 @@ def minimumRemainingValuesHeuristic(assignment, csp):
 	return nextVar
 
 def calculateDegree(var, csp):
-	count = 0
-	for cons in csp.binaryConstraints:
-		if (cons.affects(var)):
-			count = count + 1
-	return count
+	return len(csp.constraintsOf(var))
 
 """
 	Trivial method for ordering values to assign.
@@ -335,10 +1058,97 @@ def orderValues(assignment, csp, var):
 	return list(assignment.varDomains[var])
 
 
+class SupportCounts:
+	"""
+	Conflict counts behind leastConstrainingValuesHeuristic.
+	For every (variable, value) it keeps how many values in the neighbouring domains conflict with
+	it, summed over the constraints on the variable. The conflicting pairs are tabulated once, and
+	the counts are updated through removed and restored as inferences shrink and restore domains,
+	so ordering a variable's values is a single sort over cached counts.
+
+	Domain changes made outside the functions in this file are not seen. A neighbour whose domain
+	size no longer matches the tracked size triggers a full rebuild.
+
+	Args:
+		assignment (Assignment): the assignment whose domains are counted
+		csp (ConstraintSatisfactionProblem): the problem description
+	"""
+	def __init__(self, assignment, csp):
+		self.csp = csp
+		self.rebuild(assignment)
+
+	def rebuild(self, assignment):
+		domains = assignment.varDomains
+		stats = assignment.stats
+		self.conflicts = {}
+		self.counts = {}
+		self.sizes = {}
+		for var in domains:
+			self.sizes[var] = len(domains[var])
+			for value in domains[var]:
+				self.counts[(var, value)] = 0
+				self.conflicts[(var, value)] = []
+		for cons in self.csp.binaryConstraints:
+			if (stats is not None):
+				stats.constraintChecks += len(domains[cons.var1]) * len(domains[cons.var2])
+			for value1 in domains[cons.var1]:
+				for value2 in domains[cons.var2]:
+					if (not cons.isSatisfied(value1, value2)):
+						self.counts[(cons.var1, value1)] += 1
+						self.counts[(cons.var2, value2)] += 1
+						self.conflicts[(cons.var1, value1)].append((cons.var2, value2))
+						self.conflicts[(cons.var2, value2)].append((cons.var1, value1))
+
+	"""
+	Updates the counts after value has been removed from the domain of var.
+	"""
+	def removed(self, var, value):
+		counts = self.counts
+		for key in self.conflicts.get((var, value), ()):
+			counts[key] -= 1
+		self.sizes[var] -= 1
+
+	"""
+	Updates the counts after value has been put back into the domain of var.
+	"""
+	def restored(self, var, value):
+		counts = self.counts
+		for key in self.conflicts.get((var, value), ()):
+			counts[key] += 1
+		self.sizes[var] += 1
+
+	"""
+	Rebuilds the counts if the domains around var changed without being reported.
+	"""
+	def refresh(self, assignment, csp, var):
+		domains = assignment.varDomains
+		for cons in csp.constraintsOf(var):
+			other = cons.otherVariable(var)
+			if (len(domains[other]) != self.sizes[other]):
+				self.rebuild(assignment)
+				return
+		counts = self.counts
+		for value in domains[var]:
+			if ((var, value) not in counts):
+				self.rebuild(assignment)
+				return
+
+	"""
+	Orders the values of var from least to most constraining, keeping domain order among ties.
+	"""
+	def order(self, assignment, csp, var):
+		self.refresh(assignment, csp, var)
+		counts = self.counts
+		values = list(assignment.varDomains[var])
+		values.sort(key=lambda value: counts[(var, value)])
+		return values
+
+
 """
 	Creates an ordered list of the remaining values left for a given variable.
 	Values should be attempted in the order returned.
 	The least constraining value should be at the front of the list.
+	The conflict counts are kept incrementally in a SupportCounts attached to the assignment.
 
 	Args:
 		assignment (Assignment): the partial assignment to expand
@@ -349,32 +1159,49 @@ def orderValues(assignment, csp, var):
 		a list of the possible values ordered by the least constraining value heuristic
 """
 def leastConstrainingValuesHeuristic(assignment, csp, var):
-	values = []
-	prior = []
-	involved = []
-	for cons in csp.binaryConstraints:
-		if (cons.affects(var)):
-			involved.append(cons)
-	for value in assignment.varDomains[var]:
-		count = 0
-		for cons in involved:
-			if (cons.affects(var)):
-				for otherValue in assignment.varDomains[cons.otherVariable(var)]:
-					if (not cons.isSatisfied(value, otherValue)):
-						count = count + 1
-		if (not values):
-			values.append(value)
-			prior.append(count)
-		else:
-			ind = 0
-			while (ind < len(values)):
-				if (count < prior[ind]):
-					break
-				else:
-					ind = ind + 1
-			values.insert(ind, value)
-			prior.insert(ind, count)
-	return values
+	return getSupportCounts(assignment, csp).order(assignment, csp, var)
+
+
+"""
+	Gets the SupportCounts of an assignment, creating it on first use.
+"""
+def getSupportCounts(assignment, csp):
+	support = assignment.supportCounts
+	if (support is None or support.csp is not csp):
+		support = SupportCounts(assignment, csp)
+		assignment.supportCounts = support
+	return support
+
+
+"""
+	Lazy version of leastConstrainingValuesHeuristic that yields the same values in the same order.
+	The least constraining value is found with one pass over the domain and yielded at once; the
+	remaining values are only put in a heap if the search asks for a second value. The backtracking
+	engines consume value orderings one value at a time, so any ordering method may return an
+	iterator like this one.
+
+	Args:
+		assignment (Assignment): the partial assignment to expand
+		csp (ConstraintSatisfactionProblem): the problem description
+		var (string): the variable to be assigned the values
+	Returns:
+		iterator<values>
+		the possible values ordered by the least constraining value heuristic
+"""
+def lazyLeastConstrainingValuesHeuristic(assignment, csp, var):
+	support = getSupportCounts(assignment, csp)
+	support.refresh(assignment, csp, var)
+	counts = support.counts
+	values = list(assignment.varDomains[var])
+	if (not values):
+		return
+	first = min(xrange(len(values)), key=lambda i: counts[(var, values[i])])
+	yield values[first]
+	# The inferences of the first branch have been undone by now, so the counts are as before
+	rest = [(counts[(var, values[i])], i) for i in xrange(len(values)) if i != first]
+	heapq.heapify(rest)
+	while (rest):
+		yield values[heapq.heappop(rest)[1]]
 
 
 """
@@ -401,20 +1228,33 @@ def noInferences(assignment, csp, var, value):
 		the inferences made in this call or None if inconsistent assignment
 """
 def forwardChecking(assignment, csp, var, value):
+	stats = assignment.stats
+	listeners = assignment.listeners
 	inferences = set([])
 	domains = assignment.varDomains
-	for cons in csp.binaryConstraints:
-		if (cons.affects(var)):
-			if (not assignment.isAssigned(cons.otherVariable(var))):
-				tempdomain = domains[cons.otherVariable(var)]
-				for possibleVal in tempdomain:
-					if (not cons.isSatisfied(possibleVal, value)):
-						if (len(domains[cons.otherVariable(var)]) <= 1):
-							return None
-						else:
-							inferences.add((cons.otherVariable(var), possibleVal))
+	for cons in csp.constraintsOf(var):
+		if (not assignment.isAssigned(cons.otherVariable(var))):
+			tempdomain = domains[cons.otherVariable(var)]
+			if (stats is not None):
+				stats.constraintChecks += len(tempdomain)
+			for possibleVal in tempdomain:
+				if (not cons.isSatisfied(possibleVal, value)):
+					if (len(domains[cons.otherVariable(var)]) <= 1):
+						if (listeners is not None):
+							notifyListeners(listeners, 'onWipeout', cons.otherVariable(var))
+						return None
+					else:
+						inferences.add((cons.otherVariable(var), possibleVal))
 	for change in inferences:
-		domains[change[0]].remove(change[1])
+		assignment.writableDomain(change[0]).remove(change[1])
+	if (stats is not None):
+		stats.valuesPruned += len(inferences)
+	if (listeners is not None):
+		for change in inferences:
+			notifyListeners(listeners, 'onPrune', change[0], change[1])
+	if (assignment.supportCounts is not None):
+		for change in inferences:
+			assignment.supportCounts.removed(change[0], change[1])
 	return inferences
 
 """
@@ -444,12 +1284,21 @@ def forwardChecking(assignment, csp, var, value):
 		A completed and consistent assignment. None if no solution exists.
 """
 def recursiveBacktrackingWithInferences(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod):
+	stats = assignment.stats
+	listeners = assignment.listeners
+	limits = assignment.limits
 	next = selectVariableMethod(assignment, csp)
 	avaliableVal = orderValuesMethod(assignment, csp, next)
 	for nextval in avaliableVal:
 		if (consistent(assignment, csp, next, nextval)):
 			# print ('Var: ' + next + ' ' + 'Val: ' + nextval)
 			assignment.assignedValues[next] = nextval
+			if (stats is not None):
+				stats.nodes += 1
+			if (listeners is not None):
+				notifyListeners(listeners, 'onAssign', next, nextval)
+			if (limits is not None):
+				limits.enterNode(assignment)
 			if (assignment.isComplete()):
 				return assignment
 			inference = inferenceMethod(assignment, csp, next, nextval)
@@ -457,18 +1306,130 @@ def recursiveBacktrackingWithInferences(assignment, csp, orderValuesMethod, sele
 				# print assignment.varDomains
 				result = recursiveBacktrackingWithInferences(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod)
 			else:
+				if (listeners is not None):
+					notifyListeners(listeners, 'onUnassign', next, nextval)
+				if (limits is not None):
+					limits.leaveNode()
 				continue
 			if (result):
 				return result
 			else:
 				for recover in inference:
-					assignment.varDomains[recover[0]].add(recover[1])
+					assignment.writableDomain(recover[0]).add(recover[1])
+				if (assignment.supportCounts is not None):
+					for recover in inference:
+						assignment.supportCounts.restored(recover[0], recover[1])
+				if (listeners is not None):
+					notifyListeners(listeners, 'onUnassign', next, nextval)
+				if (limits is not None):
+					limits.leaveNode()
 	# print assignment.assignedValues
 	assignment.assignedValues[next] = None
 	# print assignment.assignedValues
+	if (stats is not None):
+		stats.backtracks += 1
 	return None
 
 
+"""
+	The default search method of solve: recursiveBacktracking without inferences, otherwise
+	recursiveBacktrackingWithInferences.
+
+	Args:
+		assignment (Assignment): a partial assignment to expand upon
+		csp (ConstraintSatisfactionProblem): the problem definition
+		orderValuesMethod, selectVariableMethod, inferenceMethod: as for recursiveBacktrackingWithInferences
+	Returns:
+		Assignment
+		A completed and consistent assignment. None if no solution exists.
+"""
+def backtrackingSearch(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod):
+	if inferenceMethod is None or inferenceMethod==noInferences:
+		return recursiveBacktracking(assignment, csp, orderValuesMethod, selectVariableMethod)
+	return recursiveBacktrackingWithInferences(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod)
+
+
+"""
+	Backtracking search with an explicit stack instead of recursion, written as a generator so that
+	the caller can interleave it with other work. It visits the same nodes in the same order as
+	recursiveBacktracking (inferenceMethod None or noInferences) and recursiveBacktrackingWithInferences.
+	Every stepNodes nodes it yields (False, None) to hand control back; it finishes by yielding
+	(True, assignment), with assignment None if no solution exists.
+
+	Args:
+		assignment (Assignment): a partial assignment to expand upon
+		csp (ConstraintSatisfactionProblem): the problem definition
+		orderValuesMethod (function<assignment, csp, variable> returns list<value>): a function to decide the next value to try
+		selectVariableMethod (function<assignment, csp> returns variable): a function to decide which variable to assign next
+		inferenceMethod (function<assignment, csp, variable, value> returns set<variable, value>): inferences to make, or None
+		stepNodes (int): nodes to search between yields
+	Returns:
+		generator<tuple<boolean, Assignment>>
+"""
+def iterativeBacktracking(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod, stepNodes=256):
+	stats = assignment.stats
+	listeners = assignment.listeners
+	limits = assignment.limits
+	if inferenceMethod == noInferences:
+		inferenceMethod = None
+	nodes = 0
+	var = selectVariableMethod(assignment, csp)
+	# Frames are [variable, value iterator, assigned value, inferences, whether a value is assigned]
+	stack = [[var, iter(orderValuesMethod(assignment, csp, var)), None, None, False]]
+	while stack:
+		frame = stack[-1]
+		var = frame[0]
+		if frame[4]:
+			if frame[3]:
+				restoreInferences(assignment, frame[3])
+			if (listeners is not None):
+				notifyListeners(listeners, 'onUnassign', var, frame[2])
+			if (limits is not None):
+				limits.leaveNode()
+			frame[4] = False
+		advanced = False
+		for nextval in frame[1]:
+			if (not consistent(assignment, csp, var, nextval)):
+				continue
+			assignment.assignedValues[var] = nextval
+			nodes += 1
+			if (stats is not None):
+				stats.nodes += 1
+			if (listeners is not None):
+				notifyListeners(listeners, 'onAssign', var, nextval)
+			if (limits is not None):
+				limits.enterNode(assignment)
+			if (assignment.isComplete()):
+				yield (True, assignment)
+				return
+			inference = None
+			if (inferenceMethod is not None):
+				inference = inferenceMethod(assignment, csp, var, nextval)
+				if (inference == None):
+					if (listeners is not None):
+						notifyListeners(listeners, 'onUnassign', var, nextval)
+					if (limits is not None):
+						limits.leaveNode()
+					continue
+			frame[2] = nextval
+			frame[3] = inference
+			frame[4] = True
+			advanced = True
+			break
+		if (not advanced):
+			assignment.assignedValues[var] = None
+			if (stats is not None):
+				stats.backtracks += 1
+			stack.pop()
+			continue
+		if (nodes >= stepNodes):
+			nodes = 0
+			yield (False, None)
+		var = selectVariableMethod(assignment, csp)
+		stack.append([var, iter(orderValuesMethod(assignment, csp, var)), None, None, False])
+	yield (True, None)
+
+
 """
 	Helper funciton to maintainArcConsistency and AC3.
 	Remove values from var2 domain if constraint cannot be satisfied.
@@ -488,6 +1449,11 @@ def recursiveBacktrackingWithInferences(assignment, csp, orderValuesMethod, sele
 		the inferences made in this call or None if inconsistent assignment
 """
 def revise(assignment, csp, var1, var2, constraint):
+	stats = assignment.stats
+	listeners = assignment.listeners
+	if (stats is not None):
+		stats.revisions += 1
+		stats.constraintChecks += len(assignment.varDomains[var1]) * len(assignment.varDomains[var2])
 	inferences = set([])
 	for var2Val in assignment.varDomains[var2]:
 		con = False
@@ -497,10 +1463,20 @@ def revise(assignment, csp, var1, var2, constraint):
 		if (not con):
 			inferences.add((var2, var2Val))
 	if (len(inferences) >= len(assignment.varDomains[var2])):
+		if (listeners is not None):
+			notifyListeners(listeners, 'onWipeout', var2)
 		return None
 	else:
 		for change in inferences:
-			assignment.varDomains[change[0]].remove(change[1])
+			assignment.writableDomain(change[0]).remove(change[1])
+		if (stats is not None):
+			stats.valuesPruned += len(inferences)
+		if (listeners is not None):
+			for change in inferences:
+				notifyListeners(listeners, 'onPrune', change[0], change[1])
+		if (assignment.supportCounts is not None):
+			for change in inferences:
+				assignment.supportCounts.removed(change[0], change[1])
 	return inferences
 
 
@@ -518,6 +1494,8 @@ def revise(assignment, csp, var1, var2, constraint):
  rences made in this call or None if inconsistent assignment
 """
 def maintainArcConsistency(assignment, csp, var, value):
+	stats = assignment.stats
+	listeners = assignment.listeners
 	inferences = set([])
 	MACqueue = set([])
 	domains = assignment.varDomains
@@ -525,15 +1503,27 @@ def maintainArcConsistency(assignment, csp, var, value):
 		if (cons.affects(var)):
 			if (not assignment.isAssigned(cons.otherVariable(var))):
 				tempdomain = domains[cons.otherVariable(var)]
+				if (stats is not None):
+					stats.constraintChecks += len(tempdomain)
 				for possibleVal in tempdomain:
 					if (not cons.isSatisfied(possibleVal, value)):
 						if (len(domains[cons.otherVariable(var)]) <= 1):
+							if (listeners is not None):
+								notifyListeners(listeners, 'onWipeout', cons.otherVariable(var))
 							return None
 						else:
 							inferences.add((cons.otherVariable(var), possibleVal))
 							MACqueue.add((var, cons.otherVariable(var), cons))
 	for change in inferences:
-		domains[change[0]].remove(change[1])
+		assignment.writableDomain(change[0]).remove(change[1])
+	if (stats is not None):
+		stats.valuesPruned += len(inferences)
+	if (listeners is not None):
+		for change in inferences:
+			notifyListeners(listeners, 'onPrune', change[0], change[1])
+	if (assignment.supportCounts is not None):
+		for change in inferences:
+			assignment.supportCounts.removed(change[0], change[1])
 	MACqueue = list(MACqueue)
 	while (len(MACqueue) > 0):
 		curr = MACqueue.pop()
@@ -546,7 +1536,10 @@ def maintainArcConsistency(assignment, csp, var, value):
 			revised = revise(assignment, csp, curr[0], curr[1], curr[2])
 			if (revised == None):
 				for recover in inferences:
-					assignment.varDomains[recover[0]].add(recover[1])
+					assignment.writableDomain(recover[0]).add(recover[1])
+				if (assignment.supportCounts is not None):
+					for recover in inferences:
+						assignment.supportCounts.restored(recover[0], recover[1])
 				return None
 			elif (len(revised) > 0):
 				inferences.update(revised)
@@ -570,12 +1563,15 @@ def maintainArcConsistency(assignment, csp, var, value):
 		the updated assignment after inferences are made or None if an inconsistent assignment
 """
 def AC3(assignment, csp):
+	limits = assignment.limits
 	inferences = set([])
 	MACqueue = []
 	for cons in csp.binaryConstraints:
 		MACqueue.insert(0,(cons.var1, cons.var2, cons))
 		MACqueue.insert(0,(cons.var2, cons.var1, cons))
 	while (len(MACqueue) > 0):
+		if (limits is not None):
+			limits.checkWork()
 		curr = MACqueue.pop()
 		revised = revise(assignment, csp, curr[0], curr[1], curr[2])
 		if (revised == None):
@@ -589,6 +1585,283 @@ def AC3(assignment, csp):
 	return assignment
 
 
+"""
+	Removes one value from the domain of a variable, updating the statistics, listeners and
+	support counts of the assignment like the inference functions do.
+"""
+def removeValue(assignment, var, value):
+	assignment.writableDomain(var).remove(value)
+	if (assignment.stats is not None):
+		assignment.stats.valuesPruned += 1
+	if (assignment.listeners is not None):
+		notifyListeners(assignment.listeners, 'onPrune', var, value)
+	if (assignment.supportCounts is not None):
+		assignment.supportCounts.removed(var, value)
+
+
+"""
+	Puts back a set of inferences in the (variable, value) format returned by the inference functions.
+"""
+def restoreInferences(assignment, inferences):
+	for recover in inferences:
+		assignment.writableDomain(recover[0]).add(recover[1])
+	if (assignment.supportCounts is not None):
+		for recover in inferences:
+			assignment.supportCounts.restored(recover[0], recover[1])
+
+
+"""
+	Arc consistency propagation from a queue of arcs, shared by the stronger preprocessing levels.
+	Each arc is a (var1, var2, constraint) tuple; var2 is revised against var1 as in revise.
+	Revised variables enqueue their other arcs. Values removed are added to inferences so the caller
+	can undo them with restoreInferences.
+
+	Args:
+		assignment (Assignment): the partial assignment to propagate in
+		csp (ConstraintSatisfactionProblem): the problem description
+		queue (deque<tuple<variable, variable, BinaryConstraint>>): the arcs to revise
+		inferences (set<tuple<variable, value>>): collects the values removed
+	Returns:
+		boolean
+		False if a domain would be wiped out, True otherwise
+"""
+def propagateArcs(assignment, csp, queue, inferences):
+	limits = assignment.limits
+	queued = set(queue)
+	while (queue):
+		if (limits is not None):
+			limits.checkWork()
+		curr = queue.popleft()
+		queued.discard(curr)
+		revised = revise(assignment, csp, curr[0], curr[1], curr[2])
+		if (revised == None):
+			return False
+		if (len(revised) > 0):
+			inferences.update(revised)
+			for cons in csp.constraintsOf(curr[1]):
+				other = cons.otherVariable(curr[1])
+				arc = (curr[1], other, cons)
+				if (other != curr[0] and not assignment.isAssigned(other) and arc not in queued):
+					queue.append(arc)
+					queued.add(arc)
+	return True
+
+
+"""
+	Arcs along which a change to the domain of var has to be propagated.
+"""
+def arcsFrom(assignment, csp, var):
+	return deque((var, cons.otherVariable(var), cons) for cons in csp.constraintsOf(var)
+		if not assignment.isAssigned(cons.otherVariable(var)))
+
+
+"""
+	Singleton arc consistency preprocessing. Stronger than AC3 and used in the same place.
+	Every value is probed by reducing its variable's domain to that value and propagating arc
+	consistency from it; values whose probe wipes out a domain are removed. Probes work on the
+	current arc consistent domains and undo their own inferences instead of copying the assignment.
+	Repeats until no probe fails.
+
+	Args:
+		assignment (Assignment): the partial assignment to expand
+		csp (ConstraintSatisfactionProblem): the problem description
+	Returns:
+		Assignment
+		the updated assignment after inferences are made or None if an inconsistent assignment
+"""
+def singletonArcConsistency(assignment, csp):
+	if (AC3(assignment, csp) == None):
+		return None
+	domains = assignment.varDomains
+	changed = True
+	while (changed):
+		changed = False
+		for var in domains:
+			if (assignment.isAssigned(var) or len(domains[var]) <= 1):
+				continue
+			for value in list(domains[var]):
+				# An earlier removal may have propagated back into var and pruned this value already
+				if (value not in domains[var]):
+					continue
+				full = domains[var]
+				domains[var] = set([value])
+				probe = set([])
+				consistentProbe = propagateArcs(assignment, csp, arcsFrom(assignment, csp, var), probe)
+				restoreInferences(assignment, probe)
+				domains[var] = full
+				if (consistentProbe):
+					continue
+				if (len(domains[var]) <= 1):
+					if (assignment.listeners is not None):
+						notifyListeners(assignment.listeners, 'onWipeout', var)
+					return None
+				removeValue(assignment, var, value)
+				if (not propagateArcs(assignment, csp, arcsFrom(assignment, csp, var), set([]))):
+					return None
+				changed = True
+	return assignment
+
+
+"""
+	Helper for restrictedPathConsistency.
+	Checks that value of var keeps a support on every constraint where its support is unique,
+	and that each such unique pair (value, support) extends to every variable constrained with
+	both ends.
+"""
+def pathSupported(assignment, csp, var, value):
+	domains = assignment.varDomains
+	stats = assignment.stats
+	withVar = {}
+	for cons in csp.constraintsOf(var):
+		withVar.setdefault(cons.otherVariable(var), []).append(cons)
+	for cons in csp.constraintsOf(var):
+		other = cons.otherVariable(var)
+		if (stats is not None):
+			stats.constraintChecks += len(domains[other])
+		supports = [otherValue for otherValue in domains[other] if cons.isSatisfied(value, otherValue)]
+		if (len(supports) == 0):
+			return False
+		if (len(supports) > 1):
+			continue
+		support = supports[0]
+		withOther = {}
+		for otherCons in csp.constraintsOf(other):
+			k = otherCons.otherVariable(other)
+			if (k != var and k != other and k in withVar):
+				withOther.setdefault(k, []).append(otherCons)
+		for k in withOther:
+			if (stats is not None):
+				stats.constraintChecks += len(domains[k])
+			found = False
+			for kValue in domains[k]:
+				if (all(c.isSatisfied(value, kValue) for c in withVar[k]) and all(c.isSatisfied(support, kValue) for c in withOther[k])):
+					found = True
+					break
+			if (not found):
+				return False
+	return True
+
+
+"""
+	Restricted path consistency preprocessing. Stronger than AC3 and used in the same place.
+	On top of arc consistency, a value is removed when it has a single support on some constraint
+	and that pair of values cannot be extended to a third variable constrained with both.
+	Removals are propagated with arc consistency from the changed variable until nothing changes.
+
+	Args:
+		assignment (Assignment): the partial assignment to expand
+		csp (ConstraintSatisfactionProblem): the problem description
+	Returns:
+		Assignment
+		the updated assignment after inferences are made or None if an inconsistent assignment
+"""
+def restrictedPathConsistency(assignment, csp):
+	if (AC3(assignment, csp) == None):
+		return None
+	domains = assignment.varDomains
+	changed = True
+	while (changed):
+		changed = False
+		for var in domains:
+			if (assignment.isAssigned(var)):
+				continue
+			for value in list(domains[var]):
+				if (value not in domains[var] or pathSupported(assignment, csp, var, value)):
+					continue
+				if (len(domains[var]) <= 1):
+					if (assignment.listeners is not None):
+						notifyListeners(assignment.listeners, 'onWipeout', var)
+					return None
+				removeValue(assignment, var, value)
+				if (not propagateArcs(assignment, csp, arcsFrom(assignment, csp, var), set([]))):
+					return None
+				changed = True
+	return assignment
+
+
+"""
+	Finds values that are interchangeable in an assignment: values that play identical roles in all
+	constraints, so that permuting them maps solutions to solutions. This holds when every binary
+	constraint is a NotEqualConstraint and the values are in exactly the same variable domains
+	(unary constraints are assumed already applied to the domains).
+
+	Args:
+		assignment (Assignment): the assignment the search starts from
+		csp (ConstraintSatisfactionProblem): the problem description
+	Returns:
+		list<list<value>>
+		the classes of two or more interchangeable values, each sorted; empty if there are none
+"""
+def interchangeableValues(assignment, csp):
+	for cons in csp.binaryConstraints:
+		if (cons.__class__ is not NotEqualConstraint):
+			return []
+	holders = {}
+	for var in assignment.varDomains:
+		for value in assignment.varDomains[var]:
+			holders.setdefault(value, []).append(var)
+	classes = {}
+	for value in holders:
+		classes.setdefault(frozenset(holders[value]), []).append(value)
+	return [sorted(values) for values in classes.values() if len(values) > 1]
+
+
+"""
+	Wraps a value ordering so that it breaks value symmetry. Within each class of interchangeable
+	values, only the values already used by an assigned variable and the first unused value are
+	tried; the other unused values would only lead to permutations of what that value leads to.
+	The values keep the order of orderValuesMethod, and a lazy ordering stays lazy.
+
+	Args:
+		orderValuesMethod (function<assignment, csp, variable> returns list<value>): the ordering to wrap
+		valueClasses (list<list<value>>): classes of interchangeable values from interchangeableValues
+	Returns:
+		function<assignment, csp, variable> returns iterable<value>
+"""
+def valueSymmetryBreaking(orderValuesMethod, valueClasses):
+	classOf = {}
+	for values in valueClasses:
+		for value in values:
+			classOf[value] = values
+	def orderSymmetricValues(assignment, csp, var):
+		used = set(assignment.assignedValues.itervalues())
+		domain = assignment.varDomains[var]
+		allowed = set(used)
+		for values in valueClasses:
+			for value in values:
+				if (value not in used and value in domain):
+					allowed.add(value)
+					break
+		return (value for value in orderValuesMethod(assignment, csp, var) if value not in classOf or value in allowed)
+	return orderSymmetricValues
+
+
+"""
+	Wraps a value ordering so that each variable's hinted value, such as its value in a solution of
+	a similar problem or in the best assignment a local search found, is tried first when it is
+	still in the domain. The other values keep the order of orderValuesMethod.
+
+	Args:
+		orderValuesMethod (function<assignment, csp, variable> returns list<value>): the ordering to wrap
+		hints (dictionary<string, value>): the value to try first for some or all variables
+	Returns:
+		function<assignment, csp, variable> returns iterable<value>
+"""
+def hintedValueOrdering(orderValuesMethod, hints):
+	def orderHintedValues(assignment, csp, var):
+		hint = hints.get(var)
+		if (hint is None or hint not in assignment.varDomains[var]):
+			return orderValuesMethod(assignment, csp, var)
+		return hintFirst(hint, orderValuesMethod(assignment, csp, var))
+	return orderHintedValues
+
+def hintFirst(hint, values):
+	yield hint
+	for value in values:
+		if (value != hint):
+			yield value
+
+
 """
 	Solves a binary constraint satisfaction problem.
 
@@ -598,25 +1871,157 @@ def AC3(assignment, csp):
 		selectVariableMethod (function): a function to decide which variable to assign next
 		inferenceMethod (function): a function to specify what type of inferences to use
 		useAC3 (boolean): specifies whether to use the AC3 preprocessing step or not
+		stats (SearchStatistics): optional collector filled in with counters and phase times
+		listeners (list<SearchListener>): optional listeners notified of search events
+		limits (SearchLimits): optional time, node, memory and cancellation bounds
+		preprocessMethod (function<assignment, csp> returns Assignment): optional stronger preprocessing
+				run after AC3, such as singletonArcConsistency or restrictedPathConsistency
+		extraUnaryConstraints (list<UnaryConstraint>): unary constraints added for this solve only
+		reuseRootState (boolean): start from the cached csp.rootState(useAC3) instead of redoing
+				unary elimination and AC3; extra unary constraints are then propagated incrementally
+		breakValueSymmetry (boolean): detect interchangeable values after preprocessing and only try
+				the first unused value of each class (see interchangeableValues)
+		searchMethod (function<assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod>
+				returns Assignment): the search run on the prepared assignment, backtrackingSearch by
+				default; see StructuredSearch for methods that exploit the shape of the constraint graph
+		hint (dictionary<string, value>): values to try first, such as the solution of a similar
+				problem (see hintedValueOrdering); values no longer in a domain are ignored
+		phaseSaving (boolean or dictionary<string, value>): True to try each variable's value in the
+				last solution found for csp with phaseSaving first, after the hint, and save the phases
+				of the solution found now in csp.savedPhases. A dictionary is used as the phase map
+				instead and updated in place, so phases carry over to other csp objects, such as a
+				reparsed or edited copy of the problem, that are solved with the same dictionary
+		domainCache (DomainCache): persistent cache of root domains to check before unary
+				elimination and AC3; the solve then starts from the root state as with reuseRootState
 	Returns:
 		dictionary<string, value>
 		A map from variables to their assigned values. None if no solution exists.
+		LimitReached if limits stopped the solve first.
 """
-def solve(csp, orderValuesMethod=leastConstrainingValuesHeuristic, selectVariableMethod=minimumRemainingValuesHeuristic, inferenceMethod=None, useAC3=True):
-	assignment = Assignment(csp)
-	assignment = eliminateUnaryConstraints(assignment, csp)
-	if assignment == None:
-		return assignment
+def solve(csp, orderValuesMethod=leastConstrainingValuesHeuristic, selectVariableMethod=minimumRemainingValuesHeuristic, inferenceMethod=None, useAC3=True, stats=None, listeners=None, limits=None, preprocessMethod=None, extraUnaryConstraints=None, reuseRootState=False, breakValueSymmetry=False, searchMethod=backtrackingSearch, hint=None, phaseSaving=False, domainCache=None):
+	if limits is not None and stats is None:
+		stats = SearchStatistics()
+	settings = (orderValuesMethod, selectVariableMethod, inferenceMethod, useAC3, stats, listeners, limits, preprocessMethod, extraUnaryConstraints, reuseRootState, breakValueSymmetry, searchMethod, hint, phaseSaving, domainCache)
+	if limits is not None:
+		limits.start(stats)
+		try:
+			return solveWithinLimits(csp, *settings)
+		except SearchLimitExceeded, e:
+			return LimitReached(e.reason, limits.bestAssignment, stats)
+	return solveWithinLimits(csp, *settings)
+
+
+"""
+	Runs one solve phase, timing it in stats and announcing it to listeners. The phase is ended
+	even when a limit stops it, so listeners such as PhaseTimer always see onPhaseEnd.
+"""
+def runPhase(phase, stats, listeners, method, *args):
+	start = time.time()
+	if listeners is not None:
+		notifyListeners(listeners, 'onPhaseStart', phase)
+	try:
+		return method(*args)
+	finally:
+		if stats is not None:
+			stats.addPhaseTime(phase, time.time() - start)
+		if listeners is not None:
+			notifyListeners(listeners, 'onPhaseEnd', phase)
+
+
+"""
+	Applies extra unary constraints to an assignment and, if useAC3 is set, propagates arc
+	consistency from the variables they changed only.
+	Returns the assignment, or None if a domain is wiped out.
+"""
+def addUnaryConstraints(assignment, csp, constraints, useAC3):
+	byVariable = {}
+	for constraint in constraints:
+		byVariable.setdefault(constraint.var, []).append(constraint)
+	queue = deque([])
+	for var in byVariable:
+		removed = applyUnaryConstraints(assignment, var, byVariable[var])
+		if (removed == None):
+			return None
+		if (removed):
+			queue.extend(arcsFrom(assignment, csp, var))
+	if (useAC3 and queue and not propagateArcs(assignment, csp, queue, set([]))):
+		return None
+	return assignment
+
 
-	if useAC3:
-		assignment = AC3(assignment, csp)
+"""
+	Builds the assignment the search starts from: root or fresh domains, unary elimination, extra
+	unary constraints, AC3 and preprocessing, each run as a phase. Returns None if one of them
+	wipes out a domain. With a domainCache the root state is looked up there first.
+"""
+def prepareSearch(csp, useAC3, stats, listeners, limits, preprocessMethod, extraUnaryConstraints, reuseRootState, domainCache=None):
+	if domainCache is not None:
+		reuseRootState = True
+	if reuseRootState:
+		root = csp.rootState(useAC3, domainCache)
+		if not root.isConsistent():
+			return None
+		assignment = Assignment(csp, root)
+	else:
+		assignment = Assignment(csp)
+	assignment.stats = stats
+	assignment.limits = limits
+	assignment.listeners = listeners
+
+	if not reuseRootState:
+		assignment = runPhase('unary', stats, listeners, eliminateUnaryConstraints, assignment, csp)
 		if assignment == None:
 			return assignment
-	if inferenceMethod is None or inferenceMethod==noInferences:
-		assignment = recursiveBacktracking(assignment, csp, orderValuesMethod, selectVariableMethod)
-	else:
-		assignment = recursiveBacktrackingWithInferences(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod)
+	if extraUnaryConstraints:
+		# With a fresh assignment AC3 below covers the extra constraints as well
+		assignment = runPhase('unary', stats, listeners, addUnaryConstraints, assignment, csp, extraUnaryConstraints, useAC3 and reuseRootState)
+		if assignment == None:
+			return assignment
+	if useAC3 and not reuseRootState:
+		assignment = runPhase('ac3', stats, listeners, AC3, assignment, csp)
+		if assignment == None:
+			return assignment
+	if preprocessMethod is not None:
+		assignment = runPhase('preprocess', stats, listeners, preprocessMethod, assignment, csp)
+	return assignment
+
+
+"""
+	Runs the solve pipeline for solve. SearchLimitExceeded propagates out of this function.
+"""
+def solveWithinLimits(csp, orderValuesMethod, selectVariableMethod, inferenceMethod, useAC3, stats, listeners, limits, preprocessMethod, extraUnaryConstraints, reuseRootState, breakValueSymmetry, searchMethod, hint, phaseSaving, domainCache):
+	if not listeners:
+		listeners = None
+	assignment = prepareSearch(csp, useAC3, stats, listeners, limits, preprocessMethod, extraUnaryConstraints, reuseRootState, domainCache)
 	if assignment == None:
 		return assignment
-
+	if breakValueSymmetry:
+		valueClasses = interchangeableValues(assignment, csp)
+		if valueClasses:
+			orderValuesMethod = valueSymmetryBreaking(orderValuesMethod, valueClasses)
+	phases = None
+	if isinstance(phaseSaving, dict):
+		phases = phaseSaving
+	elif phaseSaving:
+		phases = csp.savedPhases
+	if phases:
+		orderValuesMethod = hintedValueOrdering(orderValuesMethod, phases)
+	if hint:
+		orderValuesMethod = hintedValueOrdering(orderValuesMethod, hint)
+	start = time.time()
+	if listeners is not None:
+		notifyListeners(listeners, 'onPhaseStart', 'search')
+	try:
+		assignment = searchMethod(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod)
+		if listeners is not None and assignment != None:
+			notifyListeners(listeners, 'onSolution', assignment)
+	finally:
+		if stats is not None:
+			stats.addPhaseTime('search', time.time() - start)
+		if listeners is not None:
+			notifyListeners(listeners, 'onPhaseEnd', 'search')
+	if assignment == None:
+		return assignment
+	if phases is not None:
+		phases.update(assignment.assignedValues)
 	return assignment.extractSolution()
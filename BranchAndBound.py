@@ -0,0 +1,230 @@
+import BinaryCSP
+from BinaryCSP import SearchLimitExceeded, UnaryConstraint, notifyListeners
+
+
+class SoftConstraint(object):
+	"""
+	A weighted soft constraint. Wraps any unary or binary constraint; an assignment that violates
+	it is not rejected but costs weight. Override cost in a subclass for graded penalties.
+
+	Args:
+		constraint (UnaryConstraint or BinaryConstraint): the constraint to prefer
+		weight (number): the cost of violating it
+	"""
+	__slots__ = ('constraint', 'weight')
+
+	def __init__(self, constraint, weight=1):
+		self.constraint = constraint
+		self.weight = weight
+
+	def isUnary(self):
+		return isinstance(self.constraint, UnaryConstraint)
+
+	"""
+	Gets the cost of values for the constrained variables, in the order var (unary) or var1, var2.
+	"""
+	def cost(self, *values):
+		if self.constraint.isSatisfied(*values):
+			return 0
+		return self.weight
+
+	def __repr__(self):
+		return 'SoftConstraint (%s) {weight: %s}' % (repr(self.constraint), str(self.weight))
+
+
+class Optimum:
+	"""
+	Result of solveOptimal. False in boolean context when no assignment was found, which is either
+	because none satisfies the hard constraints (infeasible) or, with an upperBound, because none
+	is cheaper than the bound.
+
+	Attributes:
+		solution (dictionary<string, value>): the best complete assignment found, None if there is none
+		cost (number): its total soft constraint cost, None if there is no solution
+		optimal (boolean): True if the search finished, so no assignment is cheaper
+		reason (string): the SearchLimits reason when a limit stopped the search, otherwise None
+		stats (SearchStatistics): statistics of the search, if any were collected
+		infeasible (boolean): True if the search proved that no assignment satisfies the hard constraints
+	"""
+	def __init__(self, solution, cost, optimal, reason, stats, infeasible=False):
+		self.solution = solution
+		self.cost = cost
+		self.optimal = optimal
+		self.reason = reason
+		self.stats = stats
+		self.infeasible = infeasible
+
+	def __nonzero__(self):
+		return self.solution is not None
+
+	def __repr__(self):
+		return 'Optimum (cost: %s, optimal: %s, infeasible: %s)' % (str(self.cost), str(self.optimal), str(self.infeasible))
+
+
+class BranchAndBoundSearch:
+	"""
+	Depth-first branch and bound over the hard constraints of a csp and a list of soft constraints.
+
+	The hard constraints are handled like recursiveBacktrackingWithInferences does with
+	forwardChecking. For the soft constraints, costs[var][value] holds the cost value would add if
+	it were assigned to var now: its unary soft costs plus the binary soft costs against the
+	variables already assigned. These are updated as variables are assigned and retracted, the way
+	forward checking updates domains. The lower bound of a node is the cost of the assignment so far
+	plus, for each unassigned variable, the cheapest value left in its forward checked domain.
+	Values whose bound is not below the best cost found so far are pruned, and values are tried
+	cheapest first so that good incumbents are found early.
+	"""
+	def __init__(self, assignment, csp, softConstraints, selectVariableMethod):
+		self.assignment = assignment
+		self.csp = csp
+		self.selectVariableMethod = selectVariableMethod
+		self.softIndex = {}
+		self.costs = {}
+		for var in assignment.varDomains:
+			self.costs[var] = dict((value, 0) for value in assignment.varDomains[var])
+		for soft in softConstraints:
+			if soft.isUnary():
+				var = soft.constraint.var
+				for value in self.costs[var]:
+					self.costs[var][value] += soft.cost(value)
+			else:
+				self.softIndex.setdefault(soft.constraint.var1, []).append(soft)
+				if (soft.constraint.var2 != soft.constraint.var1):
+					self.softIndex.setdefault(soft.constraint.var2, []).append(soft)
+		self.cost = 0
+		self.best = None
+		self.bestCost = None
+
+	"""
+	Adds the soft costs of var being assigned value to the costs of its unassigned neighbours.
+	Returns the changes so that retract can undo them.
+	"""
+	def propagate(self, var, value):
+		changes = []
+		assignment = self.assignment
+		for soft in self.softIndex.get(var, []):
+			constraint = soft.constraint
+			other = constraint.otherVariable(var)
+			if assignment.isAssigned(other):
+				continue
+			otherCosts = self.costs[other]
+			for otherValue in otherCosts:
+				if constraint.var1 == var:
+					cost = soft.cost(value, otherValue)
+				else:
+					cost = soft.cost(otherValue, value)
+				if cost:
+					otherCosts[otherValue] += cost
+					changes.append((other, otherValue, cost))
+		return changes
+
+	def retract(self, changes):
+		for var, value, cost in changes:
+			self.costs[var][value] -= cost
+
+	"""
+	The cheapest cost each unassigned variable other than var can still add, or None if one of
+	them has no values left (forwardChecking can empty a domain without reporting it).
+	"""
+	def remainingBound(self, var):
+		assignment = self.assignment
+		bound = 0
+		for other in assignment.varDomains:
+			if other != var and not assignment.isAssigned(other):
+				domain = assignment.varDomains[other]
+				if not domain:
+					return None
+				otherCosts = self.costs[other]
+				bound += min(otherCosts[value] for value in domain)
+		return bound
+
+	def search(self):
+		assignment = self.assignment
+		csp = self.csp
+		stats = assignment.stats
+		listeners = assignment.listeners
+		limits = assignment.limits
+		var = self.selectVariableMethod(assignment, csp)
+		varCosts = self.costs[var]
+		remaining = self.remainingBound(var)
+		if remaining is None:
+			return
+		for value in sorted(assignment.varDomains[var], key=varCosts.get):
+			if self.bestCost is not None and self.cost + varCosts[value] + remaining >= self.bestCost:
+				break
+			if (not BinaryCSP.consistent(assignment, csp, var, value)):
+				continue
+			assignment.assignedValues[var] = value
+			if (stats is not None):
+				stats.nodes += 1
+			if (listeners is not None):
+				notifyListeners(listeners, 'onAssign', var, value)
+			if (limits is not None):
+				limits.enterNode(assignment)
+			added = varCosts[value]
+			self.cost += added
+			if (assignment.isComplete()):
+				self.best = dict(assignment.assignedValues)
+				self.bestCost = self.cost
+				if (listeners is not None):
+					notifyListeners(listeners, 'onSolution', assignment)
+			else:
+				inference = BinaryCSP.forwardChecking(assignment, csp, var, value)
+				if (inference != None):
+					changes = self.propagate(var, value)
+					self.search()
+					self.retract(changes)
+					BinaryCSP.restoreInferences(assignment, inference)
+			self.cost -= added
+			if (listeners is not None):
+				notifyListeners(listeners, 'onUnassign', var, value)
+			if (limits is not None):
+				limits.leaveNode()
+		assignment.assignedValues[var] = None
+		if (stats is not None):
+			stats.backtracks += 1
+
+
+"""
+	Finds an assignment that satisfies the hard constraints of csp with the least total cost of
+	violated soft constraints, by branch and bound (see BranchAndBoundSearch).
+	With limits, the best assignment found before a limit was hit is returned, with optimal False.
+	When the search finishes without a solution, the result is infeasible if the hard constraints
+	cannot be satisfied at all. With an upperBound the search only proves that when preprocessing
+	already fails, so otherwise a result without solution is not infeasible: it means no assignment
+	is cheaper than upperBound.
+
+	Args:
+		csp (ConstraintSatisfactionProblem): the problem definition, its constraints are hard
+		softConstraints (list<SoftConstraint>): the weighted soft constraints
+		selectVariableMethod (function<assignment, csp> returns variable): a function to decide which variable to assign next
+		useAC3 (boolean): specifies whether to use the AC3 preprocessing step or not
+		stats (SearchStatistics): optional collector filled in with counters and phase times
+		listeners (list<SearchListener>): optional listeners; onSolution is called for every new incumbent
+		limits (SearchLimits): optional time, node, memory and cancellation bounds
+		upperBound (number): only look for assignments cheaper than this, None for no bound
+	Returns:
+		Optimum
+		the best assignment and its cost
+"""
+def solveOptimal(csp, softConstraints, selectVariableMethod=BinaryCSP.minimumRemainingValuesHeuristic, useAC3=True, stats=None, listeners=None, limits=None, upperBound=None):
+	if not listeners:
+		listeners = None
+	if limits is not None:
+		if stats is None:
+			stats = BinaryCSP.SearchStatistics()
+		limits.start(stats)
+	search = None
+	reason = None
+	try:
+		assignment = BinaryCSP.prepareSearch(csp, useAC3, stats, listeners, limits, None, None, False)
+		if assignment != None:
+			search = BranchAndBoundSearch(assignment, csp, softConstraints, selectVariableMethod)
+			search.bestCost = upperBound
+			BinaryCSP.runPhase('search', stats, listeners, search.search)
+	except SearchLimitExceeded, e:
+		reason = e.reason
+	if search is None or search.best is None:
+		infeasible = reason is None and (search is None or upperBound is None)
+		return Optimum(None, None, reason is None, reason, stats, infeasible)
+	return Optimum(search.best, search.bestCost, reason is None, reason, stats)
@@ -0,0 +1,239 @@
+import heapq
+import itertools
+import BinaryCSP
+from BinaryCSP import notifyListeners
+from StructuredSearch import connectedComponents, constraintGraph, satisfiesAll
+
+"""
+	Bucket elimination, a search method for solve that exploits small treewidth.
+
+	Variables are eliminated in a min-fill order. Eliminating a variable joins the relations in its
+	bucket and projects the variable out, giving a relation over the variable's later neighbours
+	(its bag minus itself) that goes to the bucket of the next of them to be eliminated. The bags
+	form a tree decomposition of the constraint graph and the elimination is dynamic programming
+	over it. Once every variable is eliminated the assignment is built backwards, in reverse
+	elimination order, without backtracking.
+
+	A relation is a scope, a tuple of variables, and a bitset in a bytearray with one bit per tuple
+	of value indices, so a table of n tuples takes n / 8 bytes. Components whose largest join would
+	exceed maxTableSize tuples are left to backtrackingSearch.
+"""
+
+DEFAULT_MAX_TABLE_SIZE = 2 ** 20
+
+
+class Relation:
+	"""
+	The allowed tuples of a scope, as a bitset. The tuple (i1, ..., ik) of value indices is bit
+	i1 * strides[0] + ... + ik * strides[k - 1], with the last variable of the scope varying fastest.
+
+	Args:
+		scope (tuple<string>): the variables
+		sizes (list<int>): their domain sizes
+	"""
+	def __init__(self, scope, sizes):
+		self.scope = scope
+		self.strides = []
+		size = 1
+		for domainSize in reversed(sizes):
+			self.strides.append(size)
+			size *= domainSize
+		self.strides.reverse()
+		self.size = size
+		self.bits = bytearray((size + 7) // 8)
+
+	def allow(self, index):
+		self.bits[index >> 3] |= 1 << (index & 7)
+
+	def allows(self, index):
+		return self.bits[index >> 3] >> (index & 7) & 1
+
+	def isEmpty(self):
+		return not any(self.bits)
+
+
+"""
+	A min-fill elimination order for a connected component of the constraint graph: repeatedly
+	eliminates the variable whose neighbours need the fewest fill edges to become a clique, ties
+	going to fewer neighbours. The bag of a variable is the variable with its neighbours when it
+	is eliminated; the bags form a tree decomposition whose width is the largest bag less one.
+
+	Args:
+		graph: the constraint graph, see StructuredSearch.constraintGraph
+		variables (list<string>): the variables of the component
+	Returns:
+		tuple<list<string>, dictionary<string, list<string>>>
+		the elimination order, and the neighbours each variable has when it is eliminated
+"""
+def minFillOrder(graph, variables):
+	neighbours = dict((var, set(other for other in graph[var] if other in graph)) for var in variables)
+	def fill(var):
+		others = list(neighbours[var])
+		missing = 0
+		for i in xrange(len(others)):
+			for j in xrange(i + 1, len(others)):
+				if others[j] not in neighbours[others[i]]:
+					missing += 1
+		return missing
+	# Fill counts only change within two steps of an eliminated variable, so the rest stay cached
+	# in a heap whose stale entries are skipped
+	keys = dict((var, (fill(var), len(neighbours[var]), var)) for var in variables)
+	heap = keys.values()
+	heapq.heapify(heap)
+	order = []
+	bags = {}
+	while heap:
+		key = heapq.heappop(heap)
+		var = key[2]
+		if var not in neighbours or keys[var] != key:
+			continue
+		others = neighbours.pop(var)
+		affected = set(others)
+		for other in others:
+			neighbours[other].discard(var)
+			neighbours[other].update(others)
+			neighbours[other].discard(other)
+		for other in others:
+			affected.update(neighbours[other])
+		for other in affected:
+			keys[other] = (fill(other), len(neighbours[other]), other)
+			heapq.heappush(heap, keys[other])
+		order.append(var)
+		bags[var] = sorted(others)
+	return order, bags
+
+
+"""
+	Solves one connected component by bucket elimination and writes its values to the assignment.
+	Returns False if the component has no solution.
+"""
+def eliminateComponent(assignment, csp, graph, order, bags, domains):
+	stats = assignment.stats
+	listeners = assignment.listeners
+	limits = assignment.limits
+	position = dict((order[i], i) for i in xrange(len(order)))
+	buckets = dict((var, []) for var in order)
+	# One relation per constrained pair, joining all the constraints between them
+	for var in order:
+		for other in graph[var]:
+			if other not in position or position[other] < position[var]:
+				continue
+			relation = Relation((var, other), [len(domains[var]), len(domains[other])])
+			constraints = graph[var][other]
+			if stats is not None:
+				stats.constraintChecks += len(constraints) * relation.size
+			index = 0
+			for value in domains[var]:
+				for otherValue in domains[other]:
+					if satisfiesAll(constraints, var, value, otherValue):
+						relation.allow(index)
+					index += 1
+			buckets[var].append(relation)
+	for var in order:
+		bucket = buckets[var]
+		if not bucket:
+			continue
+		scope = tuple(bags[var])
+		projected = Relation(scope, [len(domains[other]) for other in scope])
+		# For each relation, the stride of each scope position and of the eliminated variable
+		lookups = []
+		for relation in bucket:
+			strides = [0] * len(scope)
+			varStride = 0
+			for i in xrange(len(relation.scope)):
+				if relation.scope[i] == var:
+					varStride = relation.strides[i]
+				else:
+					strides[scope.index(relation.scope[i])] = relation.strides[i]
+			lookups.append((relation, strides, varStride))
+		if stats is not None:
+			stats.revisions += 1
+			stats.constraintChecks += projected.size * len(domains[var]) * len(bucket)
+		varRange = xrange(len(domains[var]))
+		index = 0
+		for values in itertools.product(*[xrange(len(domains[other])) for other in scope]):
+			if limits is not None:
+				limits.checkWork()
+			bases = [sum(values[i] * lookupStrides[i] for i in xrange(len(values))) for _, lookupStrides, _ in lookups]
+			for value in varRange:
+				for i in xrange(len(lookups)):
+					if not lookups[i][0].allows(bases[i] + value * lookups[i][2]):
+						break
+				else:
+					projected.allow(index)
+					break
+			index += 1
+		if projected.isEmpty():
+			if listeners is not None:
+				notifyListeners(listeners, 'onWipeout', var)
+			return False
+		if scope:
+			buckets[min(scope, key=position.get)].append(projected)
+	indices = {}
+	for var in reversed(order):
+		for value in xrange(len(domains[var])):
+			for relation in buckets[var]:
+				index = 0
+				for i in xrange(len(relation.scope)):
+					other = relation.scope[i]
+					index += relation.strides[i] * (value if other == var else indices[other])
+				if not relation.allows(index):
+					break
+			else:
+				indices[var] = value
+				break
+	for var in order:
+		value = domains[var][indices[var]]
+		assignment.assignedValues[var] = value
+		if stats is not None:
+			stats.nodes += 1
+		if listeners is not None:
+			notifyListeners(listeners, 'onAssign', var, value)
+	return True
+
+
+"""
+	Search method for solve that solves each connected component of the constraint graph by bucket
+	elimination along a min-fill order, and leaves components whose largest join would exceed
+	maxTableSize tuples to backtrackingSearch with the given methods.
+
+	Args:
+		assignment (Assignment): the prepared assignment
+		csp (ConstraintSatisfactionProblem): the problem definition
+		orderValuesMethod, selectVariableMethod, inferenceMethod: used by the fallback search only
+		maxTableSize (int): the largest table, in tuples, that a component may need
+	Returns:
+		Assignment
+		A completed and consistent assignment. None if no solution exists.
+"""
+def bucketElimination(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod, maxTableSize=DEFAULT_MAX_TABLE_SIZE):
+	graph = constraintGraph(assignment, csp)
+	for component in connectedComponents(graph):
+		domains = {}
+		for var in component:
+			domains[var] = [value for value in assignment.varDomains[var] if BinaryCSP.consistent(assignment, csp, var, value)]
+			if not domains[var]:
+				return None
+		order, bags = minFillOrder(graph, component)
+		largest = 0
+		for var in order:
+			size = len(domains[var])
+			for other in bags[var]:
+				size *= len(domains[other])
+			largest = max(largest, size)
+		if largest > maxTableSize:
+			continue
+		if not eliminateComponent(assignment, csp, graph, order, bags, domains):
+			return None
+	if assignment.isComplete():
+		return assignment
+	return BinaryCSP.backtrackingSearch(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod)
+
+
+"""
+	Makes a bucketElimination with a different table size bound, for the searchMethod argument of solve.
+"""
+def eliminationSearch(maxTableSize):
+	def search(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod):
+		return bucketElimination(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod, maxTableSize)
+	return search
@@ -0,0 +1,584 @@
+from array import array
+from collections import deque
+import heapq
+import mmap
+import struct
+import sys
+import BinaryCSP
+from BinaryCSP import LimitReached, SearchLimitExceeded, SearchStatistics
+from Testing import expand_pattern, expand_patterns
+
+"""
+	Memory-mapped columnar instance format for problems too large to hold as one Python object per
+	constraint. Variables and values are integer ids; every table is a little-endian array of
+	unsigned 32 bit integers that is read in place with struct.unpack_from, so worker processes
+	that map the same file share its pages read-only and nothing is copied per constraint.
+
+	Sections, in file order, after the header (magic, version and an offset/size pair per section):
+		variableNames, valueNames, classNames	newline separated names
+		domainOffsets, domainValues	CSR table of the value ids of each variable
+		constraintVar1, constraintVar2, constraintType, constraintParameter	one column entry per binary constraint
+		adjacencyOffsets, adjacencyConstraints	CSR table of the constraint ids of each variable
+		tableOffsets, tablePairs	forbidden value pairs of each ForbiddenPairs table, as sorted pair codes
+		unaryVar, unaryType, unaryParameter	one column entry per unary constraint
+
+	Binary constraint types: NOT_EQUAL; FORBIDDEN_PAIRS, whose parameter is a table id; QUEENS,
+	whose parameter is the row distance; and OTHER_BINARY, whose parameter is the index of a
+	BinaryCSP constraint class in classNames. Classes of that last kind are evaluated through one
+	shared instance per class, so their isSatisfied must not depend on the constrained variables.
+	Unary types: GOOD_VALUE and BAD_VALUE, whose parameter is a value id, and OTHER_UNARY.
+"""
+
+MAGIC = 'CSPC'
+VERSION = 1
+SECTIONS = ('variableNames', 'valueNames', 'classNames', 'domainOffsets', 'domainValues',
+	'constraintVar1', 'constraintVar2', 'constraintType', 'constraintParameter',
+	'adjacencyOffsets', 'adjacencyConstraints', 'tableOffsets', 'tablePairs',
+	'unaryVar', 'unaryType', 'unaryParameter')
+HEADER = struct.Struct('<4sI' + 'QQ' * len(SECTIONS))
+
+NOT_EQUAL = 0
+FORBIDDEN_PAIRS = 1
+QUEENS = 2
+OTHER_BINARY = 3
+
+GOOD_VALUE = 0
+BAD_VALUE = 1
+OTHER_UNARY = 2
+
+
+class Column(object):
+	"""
+	A read-only array of unsigned 32 bit integers inside a mapped file.
+	"""
+	__slots__ = ('data', 'offset', 'length')
+
+	def __init__(self, data, offset, size):
+		self.data = data
+		self.offset = offset
+		self.length = size // 4
+
+	def __len__(self):
+		return self.length
+
+	def __getitem__(self, i):
+		return struct.unpack_from('<I', self.data, self.offset + 4 * i)[0]
+
+	"""
+	Reads entries i to j - 1 with a single unpack.
+	"""
+	def slice(self, i, j):
+		if j <= i:
+			return ()
+		return struct.unpack_from('<%dI' % (j - i), self.data, self.offset + 4 * i)
+
+
+class ColumnarWriter:
+	"""
+	Collects a problem as integer columns and writes it in the columnar format. Names are given
+	as strings and turned into ids here; the constraint arguments are the ones the BinaryCSP
+	constructors and .csp lines take after the variable names.
+	"""
+	def __init__(self):
+		self.variableIds = {}
+		self.variableNames = []
+		self.valueIds = {}
+		self.valueNames = []
+		self.classIds = {}
+		self.classNames = []
+		self.domains = []
+		self.var1 = array('I')
+		self.var2 = array('I')
+		self.types = array('I')
+		self.parameters = array('I')
+		self.tables = []
+		self.unaryVar = array('I')
+		self.unaryType = array('I')
+		self.unaryParameter = array('I')
+
+	def valueId(self, value):
+		if value not in self.valueIds:
+			self.valueIds[value] = len(self.valueNames)
+			self.valueNames.append(value)
+		return self.valueIds[value]
+
+	def classId(self, name, base):
+		if not issubclass(getattr(BinaryCSP, name), base):
+			raise ValueError('%s is not a %s' % (name, base.__name__))
+		if name not in self.classIds:
+			self.classIds[name] = len(self.classNames)
+			self.classNames.append(name)
+		return self.classIds[name]
+
+	def addVariable(self, name, values):
+		self.variableIds[name] = len(self.variableNames)
+		self.variableNames.append(name)
+		self.domains.append(sorted(self.valueId(value) for value in values))
+
+	def addBinary(self, name, var1, var2, args):
+		if name == 'NotEqualConstraint':
+			constraintType, parameter = NOT_EQUAL, 0
+		elif name == 'ForbiddenPairsConstraint':
+			codes = set([])
+			for pair in BinaryCSP.ForbiddenPairsConstraint(var1, var2, *args).forbidden:
+				codes.add((self.valueId(pair[0]), self.valueId(pair[1])))
+			constraintType, parameter = FORBIDDEN_PAIRS, len(self.tables)
+			self.tables.append(codes)
+		elif name == 'QueensConstraint':
+			constraintType, parameter = QUEENS, int(args[0])
+		else:
+			constraintType, parameter = OTHER_BINARY, self.classId(name, BinaryCSP.BinaryConstraint)
+		self.var1.append(self.variableIds[var1])
+		self.var2.append(self.variableIds[var2])
+		self.types.append(constraintType)
+		self.parameters.append(parameter)
+
+	def addUnary(self, name, var, args):
+		if name == 'GoodValueConstraint':
+			unaryType, parameter = GOOD_VALUE, self.valueId(args[0])
+		elif name == 'BadValueConstraint':
+			unaryType, parameter = BAD_VALUE, self.valueId(args[0])
+		else:
+			unaryType, parameter = OTHER_UNARY, self.classId(name, BinaryCSP.UnaryConstraint)
+		self.unaryVar.append(self.variableIds[var])
+		self.unaryType.append(unaryType)
+		self.unaryParameter.append(parameter)
+
+	def write(self, path):
+		numValues = len(self.valueNames)
+		domainOffsets = array('I', [0])
+		domainValues = array('I')
+		for domain in self.domains:
+			domainValues.extend(domain)
+			domainOffsets.append(len(domainValues))
+		adjacency = [[] for var in self.variableNames]
+		for constraint in xrange(len(self.var1)):
+			adjacency[self.var1[constraint]].append(constraint)
+			if self.var2[constraint] != self.var1[constraint]:
+				adjacency[self.var2[constraint]].append(constraint)
+		adjacencyOffsets = array('I', [0])
+		adjacencyConstraints = array('I')
+		for constraints in adjacency:
+			adjacencyConstraints.extend(constraints)
+			adjacencyOffsets.append(len(adjacencyConstraints))
+		tableOffsets = array('I', [0])
+		tablePairs = array('I')
+		for table in self.tables:
+			codes = sorted(value1 * numValues + value2 for value1, value2 in table)
+			if codes and codes[-1] >= 2 ** 32:
+				raise ValueError('Too many distinct values for ForbiddenPairs tables')
+			tablePairs.extend(codes)
+			tableOffsets.append(len(tablePairs))
+		columns = [domainOffsets, domainValues, self.var1, self.var2, self.types, self.parameters,
+			adjacencyOffsets, adjacencyConstraints, tableOffsets, tablePairs,
+			self.unaryVar, self.unaryType, self.unaryParameter]
+		sections = ['\n'.join(self.variableNames), '\n'.join(self.valueNames), '\n'.join(self.classNames)]
+		sections.extend(littleEndian(column) for column in columns)
+		layout = []
+		offset = HEADER.size
+		for data in sections:
+			offset += (-offset) % 4
+			layout.extend((offset, len(data)))
+			offset += len(data)
+		with open(path, 'wb') as outFile:
+			outFile.write(HEADER.pack(MAGIC, VERSION, *layout))
+			for i in xrange(len(sections)):
+				outFile.write('\0' * (layout[2 * i] - outFile.tell()))
+				outFile.write(sections[i])
+
+
+"""
+	The bytes of a column in the little-endian layout that Column reads, whatever the byte order
+	of this machine.
+"""
+def littleEndian(column):
+	if sys.byteorder == 'big':
+		column = array('I', column)
+		column.byteswap()
+	return column.tostring()
+
+
+"""
+	Writes a ConstraintSatisfactionProblem in the columnar format.
+
+	Args:
+		csp (ConstraintSatisfactionProblem): the problem to write
+		path (string): the file to write
+"""
+def writeColumnar(csp, path):
+	writer = ColumnarWriter()
+	for var in sorted(csp.varDomains):
+		writer.addVariable(var, csp.varDomains[var])
+	for cons in csp.binaryConstraints:
+		name = cons.__class__.__name__
+		if name == 'ForbiddenPairsConstraint':
+			args = list(cons.forbidden)
+		elif name == 'QueensConstraint':
+			args = [cons.distance]
+		else:
+			args = []
+		writer.addBinary(name, cons.var1, cons.var2, args)
+	for cons in csp.unaryConstraints:
+		name = cons.__class__.__name__
+		if name == 'GoodValueConstraint':
+			args = [cons.goodValue]
+		elif name == 'BadValueConstraint':
+			args = [cons.badValue]
+		else:
+			args = []
+		writer.addUnary(name, cons.var, args)
+	writer.write(path)
+
+
+"""
+	Converts a .csp file to the columnar format line by line, without building a
+	ConstraintSatisfactionProblem or any constraint objects. Supports the brace patterns and the
+	@domain and @pairwise directives of Testing.csp_parse.
+
+	Args:
+		cspPath (string): the .csp file to read
+		path (string): the columnar file to write
+"""
+def convertCspFile(cspPath, path):
+	writer = ColumnarWriter()
+	section = 0
+	sharedDomain = []
+	pairwiseSeen = {}
+	with open(cspPath) as cspFile:
+		for line in cspFile:
+			line = line.split()
+			if not line:
+				continue
+			if line[0] == '0' and len(line) == 1 and section < 2:
+				section += 1
+			elif section == 0:
+				if line[0] == '@domain':
+					sharedDomain = expand_patterns(line[1:])
+					continue
+				values = expand_patterns(line[1:]) if len(line) > 1 else sharedDomain
+				for var in expand_pattern(line[0]):
+					writer.addVariable(var, values)
+			elif section == 1:
+				if line[0] == '@pairwise':
+					variables = expand_patterns(line[2:])
+					seen = pairwiseSeen.setdefault(line[1], set([]))
+					for i in xrange(len(variables)):
+						for j in xrange(i + 1, len(variables)):
+							key = (variables[i], variables[j]) if variables[i] < variables[j] else (variables[j], variables[i])
+							if key not in seen:
+								seen.add(key)
+								writer.addBinary(line[1], variables[i], variables[j], [])
+				else:
+					writer.addBinary(line[0], line[1], line[2], line[3:])
+			else:
+				writer.addUnary(line[0], line[1], line[2:])
+	writer.write(path)
+
+
+class ColumnarInstance(object):
+	"""
+	A problem in the columnar format, mapped read-only. Only the names are decoded when it is
+	opened; domains, constraints and adjacency are read from the mapping when used.
+
+	Args:
+		path (string): the columnar file to map
+	"""
+	def __init__(self, path):
+		with open(path, 'rb') as inFile:
+			self.data = mmap.mmap(inFile.fileno(), 0, access=mmap.ACCESS_READ)
+		header = HEADER.unpack_from(self.data, 0)
+		if header[0] != MAGIC or header[1] != VERSION:
+			raise ValueError('%s is not a columnar CSP file of version %d' % (path, VERSION))
+		layout = header[2:]
+		for i in xrange(len(SECTIONS)):
+			offset, size = layout[2 * i], layout[2 * i + 1]
+			if i < 3:
+				blob = self.data[offset:offset + size]
+				setattr(self, SECTIONS[i], blob.split('\n') if blob else [])
+			else:
+				setattr(self, SECTIONS[i], Column(self.data, offset, size))
+		self.numVariables = len(self.variableNames)
+		self.numValues = len(self.valueNames)
+		self.numConstraints = len(self.constraintVar1)
+		self.prototypes = [object.__new__(getattr(BinaryCSP, name)) for name in self.classNames]
+		self.queenColumns = None
+		self.tableCache = {}
+
+	def close(self):
+		self.data.close()
+
+	"""
+	Gets the value ids of a variable's domain, before unary constraints.
+	"""
+	def domain(self, var):
+		return self.domainValues.slice(self.domainOffsets[var], self.domainOffsets[var + 1])
+
+	"""
+	Gets the ids of the binary constraints on a variable.
+	"""
+	def constraintsOf(self, var):
+		return self.adjacencyConstraints.slice(self.adjacencyOffsets[var], self.adjacencyOffsets[var + 1])
+
+	"""
+	Gets the (var1, var2, type, parameter) columns of a binary constraint.
+	"""
+	def constraint(self, constraint):
+		return (self.constraintVar1[constraint], self.constraintVar2[constraint],
+			self.constraintType[constraint], self.constraintParameter[constraint])
+
+	"""
+	The forbidden pair codes of a table. Decoded tables are kept in a small cache.
+	"""
+	def table(self, table):
+		pairs = self.tableCache.get(table)
+		if pairs is None:
+			if len(self.tableCache) >= 1024:
+				self.tableCache.clear()
+			pairs = frozenset(self.tablePairs.slice(self.tableOffsets[table], self.tableOffsets[table + 1]))
+			self.tableCache[table] = pairs
+		return pairs
+
+	"""
+	Determines whether value1 for var1 and value2 for var2 satisfy a constraint of the given type
+	and parameter, the values given as ids in the constraint's own variable order.
+	"""
+	def allowed(self, constraintType, parameter, value1, value2):
+		if constraintType == NOT_EQUAL:
+			return value1 != value2
+		if constraintType == FORBIDDEN_PAIRS:
+			return value1 * self.numValues + value2 not in self.table(parameter)
+		if constraintType == QUEENS:
+			if self.queenColumns is None:
+				self.queenColumns = [int(value) for value in self.valueNames]
+			column1 = self.queenColumns[value1]
+			column2 = self.queenColumns[value2]
+			return column1 != column2 and abs(column1 - column2) != parameter
+		return self.prototypes[parameter].isSatisfied(self.valueNames[value1], self.valueNames[value2])
+
+	"""
+	Builds the search domains, one set of value ids per variable, with the unary constraints applied.
+	Returns None if a domain is wiped out.
+	"""
+	def initialDomains(self):
+		domains = [set(self.domain(var)) for var in xrange(self.numVariables)]
+		for i in xrange(len(self.unaryVar)):
+			var = self.unaryVar[i]
+			unaryType = self.unaryType[i]
+			parameter = self.unaryParameter[i]
+			if unaryType == GOOD_VALUE:
+				domains[var].intersection_update((parameter,))
+			elif unaryType == BAD_VALUE:
+				domains[var].discard(parameter)
+			else:
+				prototype = self.prototypes[parameter]
+				domains[var] = set(value for value in domains[var] if prototype.isSatisfied(self.valueNames[value]))
+			if not domains[var]:
+				return None
+		return domains
+
+
+"""
+	Removes the values of var2 without support in var1 across one constraint, as revise does.
+	Returns the removed values.
+"""
+def columnarRevise(instance, domains, constraint, var1, var2, stats):
+	cons1, cons2, constraintType, parameter = instance.constraint(constraint)
+	allowed = instance.allowed
+	domain1 = domains[var1]
+	if stats is not None:
+		stats.revisions += 1
+		stats.constraintChecks += len(domain1) * len(domains[var2])
+	removed = []
+	for value2 in domains[var2]:
+		if cons1 == var1:
+			supported = any(allowed(constraintType, parameter, value1, value2) for value1 in domain1)
+		else:
+			supported = any(allowed(constraintType, parameter, value2, value1) for value1 in domain1)
+		if not supported:
+			removed.append(value2)
+	domains[var2].difference_update(removed)
+	return removed
+
+
+"""
+	AC3 over a columnar instance, in place on a list of domain sets.
+
+	Args:
+		instance (ColumnarInstance): the problem
+		domains (list<set<int>>): the domains to make arc consistent
+		variables (iterable<int>): the variables whose arcs are queued first, all of them by default
+		stats (SearchStatistics): optional counters
+		limits (SearchLimits): optional bounds, checked every revision
+		assigned (list): the assigned value id per variable, None if unassigned; assigned
+				variables are not revised
+	Returns:
+		list<tuple<int, int>>
+		the (variable, value) pairs removed, or None if a domain is wiped out. The removals are
+		left in place either way.
+"""
+def columnarAC3(instance, domains, variables=None, stats=None, limits=None, assigned=None):
+	if variables is None:
+		variables = xrange(instance.numVariables)
+	queue = deque([])
+	queued = set([])
+	for var in variables:
+		for constraint in instance.constraintsOf(var):
+			var1, var2 = instance.constraintVar1[constraint], instance.constraintVar2[constraint]
+			other = var2 if var1 == var else var1
+			arc = (constraint, var, other)
+			if arc not in queued and (assigned is None or assigned[other] is None):
+				queue.append(arc)
+				queued.add(arc)
+	removedAll = []
+	while queue:
+		if limits is not None:
+			limits.checkWork()
+		arc = queue.popleft()
+		queued.discard(arc)
+		constraint, var1, var2 = arc
+		removed = columnarRevise(instance, domains, constraint, var1, var2, stats)
+		if not removed:
+			continue
+		removedAll.extend((var2, value) for value in removed)
+		if stats is not None:
+			stats.valuesPruned += len(removed)
+		if not domains[var2]:
+			return None
+		for next in instance.constraintsOf(var2):
+			nextVar1, nextVar2 = instance.constraintVar1[next], instance.constraintVar2[next]
+			other = nextVar2 if nextVar1 == var2 else nextVar1
+			arc = (next, var2, other)
+			if other != var1 and arc not in queued and (assigned is None or assigned[other] is None):
+				queue.append(arc)
+				queued.add(arc)
+	return removedAll
+
+
+"""
+	Forward checking after var is assigned value: removes the values of unassigned neighbours that
+	conflict with it. Returns the (variable, value) pairs removed, or None on a wipeout, in which
+	case the removals are already undone.
+"""
+def columnarForwardChecking(instance, domains, assigned, var, value, stats):
+	removedAll = []
+	allowed = instance.allowed
+	for constraint in instance.constraintsOf(var):
+		var1, var2, constraintType, parameter = instance.constraint(constraint)
+		other = var2 if var1 == var else var1
+		if assigned[other] is not None:
+			continue
+		domain = domains[other]
+		if stats is not None:
+			stats.constraintChecks += len(domain)
+		if var1 == var:
+			removed = [otherValue for otherValue in domain if not allowed(constraintType, parameter, value, otherValue)]
+		else:
+			removed = [otherValue for otherValue in domain if not allowed(constraintType, parameter, otherValue, value)]
+		if removed:
+			domain.difference_update(removed)
+			removedAll.extend((other, otherValue) for otherValue in removed)
+			if not domain:
+				for pruned in removedAll:
+					domains[pruned[0]].add(pruned[1])
+				return None
+	if stats is not None:
+		stats.valuesPruned += len(removedAll)
+	return removedAll
+
+
+"""
+	Solves a columnar instance with backtracking, minimum remaining values and forward checking,
+	after unary constraints and, optionally, AC3. The search uses an explicit stack, so instances
+	with more variables than the recursion limit can be solved.
+
+	Args:
+		instance (ColumnarInstance): the problem
+		useAC3 (boolean): run AC3 before the search
+		stats (SearchStatistics): optional counters
+		limits (SearchLimits): optional bounds; the LimitReached result has no partial assignment
+	Returns:
+		dictionary<string, string>
+		A map from variable names to value names. None if no solution exists.
+		LimitReached if limits stopped the solve first.
+"""
+def columnarSolve(instance, useAC3=True, stats=None, limits=None):
+	if limits is not None:
+		if stats is None:
+			stats = SearchStatistics()
+		limits.start(stats)
+	try:
+		return columnarSearch(instance, useAC3, stats, limits)
+	except SearchLimitExceeded, e:
+		return LimitReached(e.reason, None, stats)
+
+def columnarSearch(instance, useAC3, stats, limits):
+	numVariables = instance.numVariables
+	domains = instance.initialDomains()
+	if domains is None:
+		return None
+	if useAC3 and columnarAC3(instance, domains, None, stats, limits) is None:
+		return None
+	if numVariables == 0:
+		return {}
+	assigned = [None] * numVariables
+	unassigned = numVariables
+	# Minimum remaining values through a heap of (domain size, variable) entries. An entry is
+	# pushed whenever a size changes, and stale entries are skipped when popped.
+	heap = [(len(domains[var]), var) for var in xrange(numVariables)]
+	heapq.heapify(heap)
+	# Frames are [variable, values left to try, removals of the current value or None]
+	stack = [newFrame(domains, assigned, heap)]
+	while stack:
+		frame = stack[-1]
+		var = frame[0]
+		if frame[2] is not None:
+			for pruned in frame[2]:
+				domains[pruned[0]].add(pruned[1])
+			touchVariables(domains, heap, frame[2])
+			frame[2] = None
+			assigned[var] = None
+			unassigned += 1
+		advanced = False
+		while frame[1]:
+			value = frame[1].pop()
+			if stats is not None:
+				stats.nodes += 1
+			if limits is not None:
+				limits.countNode()
+			assigned[var] = value
+			removed = columnarForwardChecking(instance, domains, assigned, var, value, stats)
+			if removed is None:
+				assigned[var] = None
+				continue
+			touchVariables(domains, heap, removed)
+			frame[2] = removed
+			unassigned -= 1
+			advanced = True
+			break
+		if not advanced:
+			if stats is not None:
+				stats.backtracks += 1
+			stack.pop()
+			heapq.heappush(heap, (len(domains[var]), var))
+			continue
+		if unassigned == 0:
+			return dict((instance.variableNames[i], instance.valueNames[assigned[i]]) for i in xrange(numVariables))
+		stack.append(newFrame(domains, assigned, heap))
+	return None
+
+"""
+	Pops the unassigned variable with the fewest values left, lowest id on ties, and makes its
+	search frame.
+"""
+def newFrame(domains, assigned, heap):
+	while True:
+		size, var = heapq.heappop(heap)
+		if assigned[var] is None and size == len(domains[var]):
+			return [var, sorted(domains[var], reverse=True), None]
+
+"""
+	Pushes the new domain sizes of the variables in a list of (variable, value) removals.
+"""
+def touchVariables(domains, heap, removals):
+	for var in set(pruned[0] for pruned in removals):
+		heapq.heappush(heap, (len(domains[var]), var))
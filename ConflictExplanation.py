@@ -0,0 +1,137 @@
+import BinaryCSP
+from BinaryCSP import ConstraintSatisfactionProblem, SearchLimitExceeded, UnaryConstraint
+
+
+class QuickXplain:
+	"""
+	QuickXplain over the constraints of a problem: finds a minimal set of candidate constraints that,
+	together with the background constraints, has no solution. Minimal means that dropping any one
+	of them makes the rest, with the background, satisfiable.
+
+	Each probe solves the problem restricted to a subset of the constraints. Unary elimination and
+	AC3 run first, so most infeasible subsets are rejected without search. Probe results are
+	cached: a subset is known satisfiable if an earlier probe's solution satisfies it, or if it is
+	contained in a subset already found satisfiable, and known unsatisfiable if it contains a
+	subset already found unsatisfiable.
+
+	Args:
+		csp (ConstraintSatisfactionProblem): the problem to explain
+		background (list<constraint>): constraints that are always kept and never blamed
+		inferenceMethod (function<assignment, csp, variable, value> returns set<variable, value>): inferences
+				made by the search in each probe
+		stats (SearchStatistics): optional collector, summed over all probes
+		limits (SearchLimits): optional bounds, over all probes together; started by the caller
+	"""
+	def __init__(self, csp, background, inferenceMethod, stats, limits):
+		self.variables = list(csp.varDomains)
+		self.domains = [csp.varDomains[var] for var in self.variables]
+		self.background = list(background)
+		self.inferenceMethod = inferenceMethod
+		self.stats = stats
+		self.limits = limits
+		self.satisfiable = []
+		self.unsatisfiable = []
+		self.solutions = []
+		self.probes = 0
+		self.cacheHits = 0
+
+	"""
+	Whether the background constraints together with constraints have a solution.
+	"""
+	def isSatisfiable(self, constraints):
+		key = frozenset(id(cons) for cons in constraints)
+		for known in self.unsatisfiable:
+			if known <= key:
+				self.cacheHits += 1
+				return False
+		for known in self.satisfiable:
+			if key <= known:
+				self.cacheHits += 1
+				return True
+		for solution in self.solutions:
+			if all(satisfiedBy(cons, solution) for cons in constraints):
+				self.cacheHits += 1
+				self.satisfiable.append(key)
+				return True
+		self.probes += 1
+		everything = self.background + list(constraints)
+		csp = ConstraintSatisfactionProblem(self.variables, self.domains,
+			[cons for cons in everything if not isinstance(cons, UnaryConstraint)],
+			[cons for cons in everything if isinstance(cons, UnaryConstraint)])
+		assignment = BinaryCSP.prepareSearch(csp, True, self.stats, None, self.limits, None, None, False)
+		if assignment != None and self.variables:
+			assignment = BinaryCSP.backtrackingSearch(assignment, csp, BinaryCSP.leastConstrainingValuesHeuristic,
+				BinaryCSP.minimumRemainingValuesHeuristic, self.inferenceMethod)
+		if assignment == None:
+			self.unsatisfiable.append(key)
+			return False
+		self.satisfiable.append(key)
+		self.solutions.append(dict(assignment.assignedValues))
+		return True
+
+	"""
+	The recursion of QuickXplain: a minimal subset of constraints that is unsatisfiable together
+	with the background and the candidates in kept, of which added were the last ones kept.
+	"""
+	def explain(self, kept, added, constraints):
+		if added and not self.isSatisfiable(kept):
+			return []
+		if len(constraints) == 1:
+			return list(constraints)
+		middle = len(constraints) // 2
+		first = constraints[:middle]
+		second = constraints[middle:]
+		blamedSecond = self.explain(kept + first, first, second)
+		blamedFirst = self.explain(kept + blamedSecond, blamedSecond, first)
+		return blamedFirst + blamedSecond
+
+
+"""
+	Whether a complete assignment satisfies a unary or binary constraint.
+"""
+def satisfiedBy(cons, solution):
+	if isinstance(cons, UnaryConstraint):
+		return cons.isSatisfied(solution[cons.var])
+	return cons.isSatisfied(solution[cons.var1], solution[cons.var2])
+
+
+"""
+	Finds a minimal unsatisfiable core of a problem that has no solution: a set of its constraints
+	that has no solution by itself, and that has one if any of them is dropped (see QuickXplain).
+	Constraints that are not candidates are kept in every probe and are never blamed. When there
+	are several cores, the order of the candidates decides which one is found.
+
+	Args:
+		csp (ConstraintSatisfactionProblem): the problem to explain
+		candidates (list<constraint>): the constraints that may be blamed, all unary and binary
+				constraints of csp by default
+		inferenceMethod (function<assignment, csp, variable, value> returns set<variable, value>): inferences
+				made by the search in each probe
+		stats (SearchStatistics): optional collector, summed over all probes
+		limits (SearchLimits): optional bounds on the whole extraction
+	Returns:
+		list<constraint>
+		A minimal unsatisfiable core; empty if the constraints that are not candidates, or an empty
+		domain, already leave no solution. None if the problem has a solution.
+		LimitReached if limits stopped the extraction first, without a partial assignment.
+"""
+def unsatisfiableCore(csp, candidates=None, inferenceMethod=BinaryCSP.forwardChecking, stats=None, limits=None):
+	everything = list(csp.binaryConstraints) + list(csp.unaryConstraints)
+	if candidates is None:
+		candidates = everything
+	candidates = list(candidates)
+	chosen = set(id(cons) for cons in candidates)
+	background = [cons for cons in everything if id(cons) not in chosen]
+	if limits is not None:
+		if stats is None:
+			stats = BinaryCSP.SearchStatistics()
+		limits.start(stats)
+	explainer = QuickXplain(csp, background, inferenceMethod, stats, limits)
+	try:
+		if explainer.isSatisfiable(candidates):
+			return None
+		if not candidates or not explainer.isSatisfiable([]):
+			return []
+		return explainer.explain([], [], candidates)
+	except SearchLimitExceeded, e:
+		return BinaryCSP.LimitReached(e.reason, None, stats)
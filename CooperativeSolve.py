@@ -0,0 +1,196 @@
+import threading
+import time
+import BinaryCSP
+from BinaryCSP import CancellationToken, LimitReached, SearchLimitExceeded, SearchLimits, SearchListener, SearchStatistics
+
+
+class SteppedSolve:
+	"""
+	A solve that runs in slices of stepNodes search nodes so that it can share a thread with an
+	event loop and with other solves. Each call to step runs one slice and returns whether the
+	solve has finished; result then holds what solve would have returned. The search itself is
+	BinaryCSP.iterativeBacktracking, so it visits the same nodes as the recursive engines.
+	Unary elimination, AC3 and preprocessing run in the first slice.
+
+	Schedule step from the embedding loop (an idle or periodic callback), or drive several solves
+	with runCooperatively. progress is called with the SearchStatistics after every slice.
+
+	Args:
+		csp (ConstraintSatisfactionProblem): the problem definition
+		orderValuesMethod, selectVariableMethod, inferenceMethod, useAC3: as for solve
+		stepNodes (int): search nodes per slice
+		progress (function<SearchStatistics>): optional callback after each slice
+		limits (SearchLimits): optional bounds, as for solve
+	"""
+	def __init__(self, csp, orderValuesMethod=BinaryCSP.leastConstrainingValuesHeuristic, selectVariableMethod=BinaryCSP.minimumRemainingValuesHeuristic, inferenceMethod=None, useAC3=True, stepNodes=256, progress=None, limits=None):
+		self.csp = csp
+		self.orderValuesMethod = orderValuesMethod
+		self.selectVariableMethod = selectVariableMethod
+		self.inferenceMethod = inferenceMethod
+		self.useAC3 = useAC3
+		self.stepNodes = stepNodes
+		self.progress = progress
+		self.limits = limits
+		self.stats = SearchStatistics()
+		self.steps = None
+		self.done = False
+		self.cancelled = False
+		self.result = None
+
+	"""
+	Runs one slice of the solve.
+
+	Returns:
+		boolean
+		True once the solve has finished, False if more slices are needed
+	"""
+	def step(self):
+		if self.done:
+			return True
+		if self.cancelled:
+			return self.finish(LimitReached('cancelled', self.bestAssignment(), self.stats))
+		try:
+			if self.steps is None:
+				if self.limits is not None:
+					self.limits.start(self.stats)
+				assignment = BinaryCSP.prepareSearch(self.csp, self.useAC3, self.stats, None, self.limits, None, None, False)
+				if assignment == None:
+					return self.finish(None)
+				self.steps = BinaryCSP.iterativeBacktracking(assignment, self.csp, self.orderValuesMethod, self.selectVariableMethod, self.inferenceMethod, self.stepNodes)
+			start = time.time()
+			try:
+				finished, assignment = next(self.steps)
+			finally:
+				self.stats.addPhaseTime('search', time.time() - start)
+		except SearchLimitExceeded, e:
+			return self.finish(LimitReached(e.reason, self.bestAssignment(), self.stats))
+		if finished:
+			return self.finish(None if assignment == None else assignment.extractSolution())
+		if self.progress is not None:
+			self.progress(self.stats)
+		return False
+
+	"""
+	Stops the solve at the next call to step, which finishes it with a LimitReached result.
+	"""
+	def cancel(self):
+		self.cancelled = True
+
+	def bestAssignment(self):
+		if self.limits is None:
+			return None
+		return self.limits.bestAssignment
+
+	def finish(self, result):
+		if self.steps is not None:
+			self.steps.close()
+		self.result = result
+		self.done = True
+		if self.progress is not None:
+			self.progress(self.stats)
+		return True
+
+
+"""
+	Runs several SteppedSolves round-robin in the calling thread until all have finished, one slice
+	each in turn, so that no solve stalls the others.
+
+	Args:
+		solves (list<SteppedSolve>): the solves to run
+	Returns:
+		list
+		the result of each solve, in the same order
+"""
+def runCooperatively(solves):
+	pending = list(solves)
+	while pending:
+		pending = [solve for solve in pending if not solve.step()]
+	return [solve.result for solve in solves]
+
+
+class ProgressListener(SearchListener):
+	"""
+	Calls progress with the SearchStatistics of a solve every interval assigned values.
+	"""
+	def __init__(self, stats, progress, interval):
+		self.stats = stats
+		self.progress = progress
+		self.interval = interval
+		self.assigned = 0
+
+	def onAssign(self, var, value):
+		self.assigned += 1
+		if self.assigned % self.interval == 0:
+			self.progress(self.stats)
+
+
+class BackgroundSolve:
+	"""
+	Runs solve on a background thread so that the calling thread, such as an event loop, is not
+	blocked. cancel stops the search through a CancellationToken and the result is then a
+	LimitReached with reason 'cancelled'. progress and the done callbacks run on the background
+	thread; an event loop should hand them over to its own thread.
+
+	Args:
+		csp (ConstraintSatisfactionProblem): the problem definition
+		orderValuesMethod, selectVariableMethod, inferenceMethod, useAC3: as for solve
+		progress (function<SearchStatistics>): optional callback every progressNodes nodes
+		progressNodes (int): assigned values between progress calls
+		limits (SearchLimits): optional bounds, as for solve
+	"""
+	def __init__(self, csp, orderValuesMethod=BinaryCSP.leastConstrainingValuesHeuristic, selectVariableMethod=BinaryCSP.minimumRemainingValuesHeuristic, inferenceMethod=None, useAC3=True, progress=None, progressNodes=1024, limits=None):
+		if limits is None:
+			limits = SearchLimits()
+		if limits.cancelToken is None:
+			limits.cancelToken = CancellationToken()
+		self.limits = limits
+		self.stats = SearchStatistics()
+		listeners = []
+		if progress is not None:
+			listeners.append(ProgressListener(self.stats, progress, progressNodes))
+		self.result = None
+		self.callbacks = []
+		self.finished = threading.Event()
+		self.lock = threading.Lock()
+		self.thread = threading.Thread(target=self.run, args=(csp, orderValuesMethod, selectVariableMethod, inferenceMethod, useAC3, listeners))
+		self.thread.daemon = True
+		self.thread.start()
+
+	def run(self, csp, orderValuesMethod, selectVariableMethod, inferenceMethod, useAC3, listeners):
+		try:
+			self.result = BinaryCSP.solve(csp, orderValuesMethod, selectVariableMethod, inferenceMethod, useAC3, self.stats, listeners, self.limits)
+		finally:
+			with self.lock:
+				self.finished.set()
+				callbacks = self.callbacks
+				self.callbacks = []
+			for callback in callbacks:
+				callback(self)
+
+	def cancel(self):
+		self.limits.cancelToken.cancel()
+
+	def isDone(self):
+		return self.finished.is_set()
+
+	"""
+	Waits for the solve to finish.
+
+	Args:
+		timeout (float): seconds to wait, None to wait until it finishes
+	Returns:
+		the result of solve, or None if the timeout passed first
+	"""
+	def wait(self, timeout=None):
+		self.finished.wait(timeout)
+		return self.result
+
+	"""
+	Calls callback with this BackgroundSolve when the solve finishes, right away if it already has.
+	"""
+	def addDoneCallback(self, callback):
+		with self.lock:
+			if not self.finished.is_set():
+				self.callbacks.append(callback)
+				return
+		callback(self)
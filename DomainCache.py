@@ -0,0 +1,126 @@
+import cPickle
+import os
+import stat
+import tempfile
+from BinaryCSP import RootState
+
+# Part of every entry's file name. Bump it whenever RootState, the fingerprint or the root
+# reductions change, so that entries written by older code are never loaded; they age out by eviction
+CACHE_VERSION = 1
+
+
+class DomainCache:
+	"""
+	Persistent cache of root states: the domains left by eliminateUnaryConstraints and, with
+	useAC3, AC3. Entries are keyed by ConstraintSatisfactionProblem.fingerprint, so a process that
+	solves a problem another process has already reduced skips straight to search. Pass it to solve
+	as domainCache, or to ConstraintSatisfactionProblem.rootState.
+
+	Each entry is a pickled RootState in its own file, written to a temporary file and renamed into
+	place so that concurrent processes never read a partial entry. A file's modification time is
+	refreshed when it is read, and after every store the least recently used entries are deleted
+	until the cache is within maxBytes. Entries that cannot be read are treated as missing.
+
+	Loading an entry unpickles it, which can run arbitrary code, so the directory must only be
+	writable by the user running the solver. It is created with mode 0700, and on POSIX systems an
+	existing directory that belongs to another user or that group or others can write to is
+	rejected with a ValueError. Share a cache between processes of one user only, never through a
+	world-writable directory such as /tmp itself.
+
+	Args:
+		directory (string): the directory holding the entries, created if missing
+		maxBytes (int): the size the entries may take in total
+	"""
+	def __init__(self, directory, maxBytes=64 * 1024 * 1024):
+		self.directory = directory
+		self.maxBytes = maxBytes
+		self.hits = 0
+		self.misses = 0
+		if not os.path.isdir(directory):
+			os.makedirs(directory, 0700)
+		info = os.stat(directory)
+		if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+			raise ValueError('%s must belong to the current user and not be writable by others' % directory)
+
+	def path(self, fingerprint, useAC3):
+		return os.path.join(self.directory, 'v%d-%s-%s.root' % (CACHE_VERSION, fingerprint, 'ac3' if useAC3 else 'unary'))
+
+	"""
+	Gets the cached root state of a problem.
+
+	Args:
+		fingerprint (string): the problem's fingerprint
+		useAC3 (boolean): whether AC3 is part of the root reductions
+	Returns:
+		RootState
+		the cached root state, or None if there is none
+	"""
+	def load(self, fingerprint, useAC3):
+		path = self.path(fingerprint, useAC3)
+		try:
+			with open(path, 'rb') as entry:
+				root = cPickle.load(entry)
+			os.utime(path, None)
+		except (IOError, OSError):
+			self.misses += 1
+			return None
+		except Exception:
+			self.discard(path)
+			self.misses += 1
+			return None
+		if not isinstance(root, RootState) or root.useAC3 != useAC3:
+			self.discard(path)
+			self.misses += 1
+			return None
+		self.hits += 1
+		return root
+
+	"""
+	Stores the root state of a problem, then evicts the least recently used entries if the cache
+	has grown past maxBytes.
+
+	Args:
+		fingerprint (string): the problem's fingerprint
+		root (RootState): its root state
+	"""
+	def store(self, fingerprint, root):
+		handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+		try:
+			with os.fdopen(handle, 'wb') as entry:
+				cPickle.dump(root, entry, cPickle.HIGHEST_PROTOCOL)
+			os.rename(temporary, self.path(fingerprint, root.useAC3))
+		except (IOError, OSError):
+			self.discard(temporary)
+			return
+		self.evict()
+
+	def evict(self):
+		entries = []
+		total = 0
+		for name in os.listdir(self.directory):
+			if not name.endswith('.root'):
+				continue
+			path = os.path.join(self.directory, name)
+			try:
+				info = os.stat(path)
+			except OSError:
+				continue
+			entries.append((info.st_mtime, path, info.st_size))
+			total += info.st_size
+		entries.sort()
+		for modified, path, size in entries:
+			if total <= self.maxBytes:
+				break
+			self.discard(path)
+			total -= size
+
+	def discard(self, path):
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+
+	def clear(self):
+		for name in os.listdir(self.directory):
+			if name.endswith('.root'):
+				self.discard(os.path.join(self.directory, name))
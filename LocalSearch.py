@@ -0,0 +1,332 @@
+import random
+import BinaryCSP
+from BinaryCSP import SearchLimitExceeded, notifyListeners
+
+
+class LocalSearchResult:
+	"""
+	Result of minConflicts. Local search cannot prove that a problem has no solution, so a result
+	without one only means that none was found. False in boolean context in that case.
+
+	Attributes:
+		solution (dictionary<string, value>): a complete consistent assignment, None if none was found
+		best (dictionary<string, value>): the complete assignment with the fewest violated constraints
+				seen, None if unary elimination or AC3 already showed there is no solution
+		violations (int): the number of binary constraints best violates
+		restarts (int): restarts made
+		reason (string): the SearchLimits reason when a limit stopped the search, otherwise None
+		stats (SearchStatistics): statistics of the search, if any were collected
+	"""
+	def __init__(self, solution, best, violations, restarts, reason, stats):
+		self.solution = solution
+		self.best = best
+		self.violations = violations
+		self.restarts = restarts
+		self.reason = reason
+		self.stats = stats
+
+	def __nonzero__(self):
+		return self.solution is not None
+
+	def __repr__(self):
+		return 'LocalSearchResult (violations: %s, restarts: %d)' % (str(self.violations), self.restarts)
+
+
+class MinConflictsSearch:
+	"""
+	Min-conflicts local search with a tabu list, over complete assignments of a prepared Assignment.
+
+	Variables are numbered and their domains and constraints kept in lists. conflicts[var] counts
+	the violated constraints on var and is updated through the constraint graph on every move, so a
+	move costs a pass over the neighbours of one variable. Each step picks a random conflicted
+	variable and moves it to the value with the fewest conflicts, ties broken at random. The value
+	it leaves is tabu for tabuTenure steps unless moving back would beat the best assignment so
+	far. With probability walkProbability the step moves to a random value instead.
+
+	The best assignment is kept over all runs. While it lies on the current run, changes logs the
+	moves made since it was reached, so that a better one is recorded without copying every value;
+	changes is None when the best assignment comes from an earlier run.
+
+	Args:
+		assignment (Assignment): the assignment whose domains the search uses
+		csp (ConstraintSatisfactionProblem): the problem definition
+		rng (random.Random): the source of randomness
+		walkProbability (float): chance of a random walk step
+		tabuTenure (int): steps a value that was left stays tabu
+	"""
+	def __init__(self, assignment, csp, rng, walkProbability, tabuTenure):
+		self.assignment = assignment
+		self.rng = rng
+		self.walkProbability = walkProbability
+		self.tabuTenure = tabuTenure
+		self.variables = list(assignment.varDomains)
+		index = dict((self.variables[i], i) for i in xrange(len(self.variables)))
+		self.domains = [list(assignment.varDomains[var]) for var in self.variables]
+		# Entries are (other variable, isSatisfied, whether this variable is the constraint's var1)
+		self.neighbours = [[] for var in self.variables]
+		for cons in csp.binaryConstraints:
+			var1 = index[cons.var1]
+			var2 = index[cons.var2]
+			if var1 != var2:
+				self.neighbours[var1].append((var2, cons.isSatisfied, True))
+				self.neighbours[var2].append((var1, cons.isSatisfied, False))
+		self.values = [None] * len(self.variables)
+		self.conflicts = [0] * len(self.variables)
+		self.conflicted = []
+		self.position = [-1] * len(self.variables)
+		self.violations = 0
+		self.bestValues = None
+		self.bestViolations = None
+		self.changes = []
+
+	"""
+	Assigns every variable its hint when the hint is in its domain, and otherwise, in a random
+	order, the value with the fewest conflicts with the variables assigned before it. The result
+	becomes the best assignment if it beats the best of the earlier runs.
+	"""
+	def initialize(self, hints):
+		rng = self.rng
+		variables = self.variables
+		order = range(len(variables))
+		rng.shuffle(order)
+		self.values = [None] * len(variables)
+		self.conflicts = [0] * len(variables)
+		self.conflicted = []
+		self.position = [-1] * len(variables)
+		self.violations = 0
+		for var in order:
+			hint = None if hints is None else hints.get(variables[var])
+			if hint is not None and hint in self.domains[var]:
+				value = hint
+			else:
+				value = self.leastConflicting(var, None, None)
+			self.values[var] = value
+			for other, satisfied, first in self.neighbours[var]:
+				otherValue = self.values[other]
+				if otherValue is not None and not (satisfied(value, otherValue) if first else satisfied(otherValue, value)):
+					self.addConflict(var, 1)
+					self.addConflict(other, 1)
+					self.violations += 1
+		if self.bestViolations is None or self.violations < self.bestViolations:
+			self.bestValues = list(self.values)
+			self.bestViolations = self.violations
+			self.changes = []
+		else:
+			self.changes = None
+
+	"""
+	The conflicts value would have with the assigned neighbours of var.
+	"""
+	def conflictsOf(self, var, value):
+		values = self.values
+		count = 0
+		for other, satisfied, first in self.neighbours[var]:
+			otherValue = values[other]
+			if otherValue is not None and not (satisfied(value, otherValue) if first else satisfied(otherValue, value)):
+				count += 1
+		return count
+
+	"""
+	The value of var with the fewest conflicts, ties broken at random, leaving out current and the
+	values tabu at step unless they beat the best assignment. None if every other value is tabu.
+	"""
+	def leastConflicting(self, var, current, step):
+		stats = self.assignment.stats
+		best = []
+		bestCount = None
+		if step is not None:
+			aspiration = self.bestViolations - (self.violations - self.conflicts[var])
+		for value in self.domains[var]:
+			if value == current and current is not None:
+				continue
+			count = self.conflictsOf(var, value)
+			if step is not None and self.tabu.get((var, value), -1) > step and count >= aspiration:
+				continue
+			if bestCount is None or count < bestCount:
+				best = [value]
+				bestCount = count
+			elif count == bestCount:
+				best.append(value)
+		if stats is not None:
+			stats.constraintChecks += len(self.domains[var]) * len(self.neighbours[var])
+		if not best:
+			return None
+		return best[self.rng.randrange(len(best))] if len(best) > 1 else best[0]
+
+	def addConflict(self, var, delta):
+		self.conflicts[var] += delta
+		if self.conflicts[var] > 0:
+			if self.position[var] < 0:
+				self.position[var] = len(self.conflicted)
+				self.conflicted.append(var)
+		elif self.position[var] >= 0:
+			last = self.conflicted.pop()
+			if last != var:
+				self.conflicted[self.position[var]] = last
+				self.position[last] = self.position[var]
+			self.position[var] = -1
+
+	"""
+	Moves var to value, updating the conflict counts of var and its neighbours.
+	"""
+	def move(self, var, value):
+		values = self.values
+		old = values[var]
+		for other, satisfied, first in self.neighbours[var]:
+			otherValue = values[other]
+			if first:
+				before = satisfied(old, otherValue)
+				after = satisfied(value, otherValue)
+			else:
+				before = satisfied(otherValue, old)
+				after = satisfied(otherValue, value)
+			if before != after:
+				delta = 1 if before else -1
+				self.addConflict(var, delta)
+				self.addConflict(other, delta)
+				self.violations += delta
+		values[var] = value
+		if self.changes is not None:
+			self.changes.append((var, value))
+		if self.violations < self.bestViolations:
+			if self.changes is None:
+				self.bestValues = list(values)
+			else:
+				for changed, changedValue in self.changes:
+					self.bestValues[changed] = changedValue
+			self.changes = []
+			self.bestViolations = self.violations
+
+	"""
+	Runs up to maxSteps steps from the current assignment.
+
+	Returns:
+		boolean
+		True once no constraint is violated
+	"""
+	def run(self, maxSteps):
+		stats = self.assignment.stats
+		listeners = self.assignment.listeners
+		limits = self.assignment.limits
+		rng = self.rng
+		self.tabu = {}
+		for step in xrange(maxSteps):
+			if not self.conflicted:
+				return True
+			if limits is not None:
+				limits.countNode()
+			var = self.conflicted[rng.randrange(len(self.conflicted))]
+			current = self.values[var]
+			domain = self.domains[var]
+			if len(domain) < 2:
+				continue
+			if rng.random() < self.walkProbability:
+				value = domain[rng.randrange(len(domain))]
+				if value == current:
+					continue
+			else:
+				value = self.leastConflicting(var, current, step)
+				if value is None:
+					continue
+			self.tabu[(var, current)] = step + self.tabuTenure
+			self.move(var, value)
+			if stats is not None:
+				stats.nodes += 1
+			if listeners is not None:
+				notifyListeners(listeners, 'onAssign', self.variables[var], value)
+		return not self.conflicted
+
+	def best(self):
+		return dict((self.variables[i], self.bestValues[i]) for i in xrange(len(self.variables)))
+
+
+"""
+	Min-conflicts local search with tabu moves, random walk and restarts (see MinConflictsSearch).
+	It suits large, loosely constrained problems that have many solutions; it cannot show that a
+	problem has none. The domains come from unary elimination and, with useAC3, AC3, as in solve.
+	Each restart starts from a fresh greedy assignment; the first one starts from initial if given.
+
+	Args:
+		csp (ConstraintSatisfactionProblem): the problem definition
+		maxSteps (int): steps per run before a restart
+		maxRestarts (int): restarts before giving up
+		walkProbability (float): chance of a random walk step
+		tabuTenure (int): steps a value that was left stays tabu
+		seed (hashable): seed for the random choices, None for a random seed
+		initial (dictionary<string, value>): values to start from, such as a previous solution
+		useAC3 (boolean): reduce the domains with AC3 first
+		stats (SearchStatistics): optional collector; nodes counts moves
+		listeners (list<SearchListener>): optional listeners, notified of moves (onAssign), restarts
+				(onRestart) and the solution (onSolution)
+		limits (SearchLimits): optional bounds; maxNodes bounds the moves over all runs
+	Returns:
+		LocalSearchResult
+		the solution if one was found, and the best assignment seen
+"""
+def minConflicts(csp, maxSteps=100000, maxRestarts=10, walkProbability=0.02, tabuTenure=10, seed=None, initial=None, useAC3=False, stats=None, listeners=None, limits=None):
+	if not listeners:
+		listeners = None
+	if limits is not None:
+		if stats is None:
+			stats = BinaryCSP.SearchStatistics()
+		limits.start(stats)
+	search = None
+	restarts = 0
+	solved = False
+	reason = None
+	try:
+		assignment = BinaryCSP.prepareSearch(csp, useAC3, stats, listeners, limits, None, None, False)
+		if assignment == None:
+			return LocalSearchResult(None, None, None, 0, None, stats)
+		search = MinConflictsSearch(assignment, csp, random.Random(seed), walkProbability, tabuTenure)
+		hints = initial
+		while True:
+			search.initialize(hints)
+			solved = BinaryCSP.runPhase('search', stats, listeners, search.run, maxSteps)
+			if solved or restarts >= maxRestarts:
+				break
+			restarts += 1
+			hints = None
+			if listeners is not None:
+				notifyListeners(listeners, 'onRestart')
+	except SearchLimitExceeded, e:
+		reason = e.reason
+	if search is None or search.bestViolations is None:
+		return LocalSearchResult(None, None, None, restarts, reason, stats)
+	best = search.best()
+	if not solved:
+		return LocalSearchResult(None, best, search.bestViolations, restarts, reason, stats)
+	if listeners is not None:
+		assignment.assignedValues = dict(best)
+		notifyListeners(listeners, 'onSolution', assignment)
+	return LocalSearchResult(best, best, 0, restarts, None, stats)
+
+
+"""
+	Runs minConflicts and, if it finds no solution, solve with the best assignment it found as
+	value ordering hints (see BinaryCSP.hintedValueOrdering). The systematic search settles the
+	problem either way. limits apply to each of the two phases separately.
+
+	Args:
+		csp (ConstraintSatisfactionProblem): the problem definition
+		orderValuesMethod, selectVariableMethod, inferenceMethod, useAC3: as for solve
+		maxSteps, maxRestarts, seed: as for minConflicts
+		stats (SearchStatistics): optional collector, shared by both phases
+		listeners (list<SearchListener>): optional listeners, shared by both phases
+		limits (SearchLimits): optional bounds
+	Returns:
+		dictionary<string, value>
+		A map from variables to their assigned values. None if no solution exists.
+		LimitReached if limits stopped the solve first.
+"""
+def solveWithLocalSearch(csp, orderValuesMethod=BinaryCSP.leastConstrainingValuesHeuristic, selectVariableMethod=BinaryCSP.minimumRemainingValuesHeuristic, inferenceMethod=BinaryCSP.forwardChecking, useAC3=True, maxSteps=100000, maxRestarts=10, seed=None, stats=None, listeners=None, limits=None):
+	if limits is not None and stats is None:
+		stats = BinaryCSP.SearchStatistics()
+	result = minConflicts(csp, maxSteps, maxRestarts, seed=seed, useAC3=useAC3, stats=stats, listeners=listeners, limits=limits)
+	if result.solution is not None:
+		return result.solution
+	if result.reason is not None:
+		return BinaryCSP.LimitReached(result.reason, None, stats)
+	if result.best is None:
+		return None
+	return BinaryCSP.solve(csp, BinaryCSP.hintedValueOrdering(orderValuesMethod, result.best), selectVariableMethod, inferenceMethod, useAC3, stats, listeners, limits)
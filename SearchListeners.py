@@ -0,0 +1,133 @@
+import cProfile
+import gzip
+import time
+from BinaryCSP import SearchListener
+
+
+class SearchTraceListener(SearchListener):
+	"""
+	Writes a sampled trace of the search tree to a compact tab-separated file, gzipped when the
+	file name ends in .gz. Every search node gets an id; only nodes whose id is a multiple of
+	sampleRate and whose depth is at most maxDepth are written. Lines have the form:
+		a id parentId depth var value	value assigned to var in a new node
+		u id pruned	node retracted, with the number of values its inferences pruned
+		w id var	domain wipeout of var inside node id
+		s id	solution found at node id
+
+	The file is only open during search phases: it is created when the first one starts, appended
+	to by later ones, such as the next solve with the same listener, and closed when each ends.
+	Nothing is left open if a solve stops before its search, and events outside a search phase
+	are not written.
+
+	Args:
+		fileName (string): the trace file to write
+		sampleRate (int): write every sampleRate-th node
+		maxDepth (int): deepest level written, None for no limit
+	"""
+	def __init__(self, fileName, sampleRate=1, maxDepth=None):
+		self.fileName = fileName
+		self.traceFile = None
+		self.created = False
+		self.sampleRate = sampleRate
+		self.maxDepth = maxDepth
+		self.nextId = 1
+		self.stack = [(0, 0)]
+
+	def _sampled(self, nodeId, depth):
+		return nodeId % self.sampleRate == 0 and (self.maxDepth is None or depth <= self.maxDepth)
+
+	def onAssign(self, var, value):
+		nodeId = self.nextId
+		self.nextId += 1
+		parentId = self.stack[-1][0]
+		depth = len(self.stack)
+		self.stack.append((nodeId, 0))
+		if self._sampled(nodeId, depth):
+			self._write('a\t%d\t%d\t%d\t%s\t%s\n' % (nodeId, parentId, depth, var, value))
+
+	def onUnassign(self, var, value):
+		nodeId, pruned = self.stack.pop()
+		if self._sampled(nodeId, len(self.stack)):
+			self._write('u\t%d\t%d\n' % (nodeId, pruned))
+
+	def onPrune(self, var, value):
+		nodeId, pruned = self.stack[-1]
+		self.stack[-1] = (nodeId, pruned + 1)
+
+	def onWipeout(self, var):
+		nodeId = self.stack[-1][0]
+		if self._sampled(nodeId, len(self.stack) - 1):
+			self._write('w\t%d\t%s\n' % (nodeId, var))
+
+	def onSolution(self, assignment):
+		self._write('s\t%d\n' % self.stack[-1][0])
+
+	def onPhaseStart(self, phase):
+		if phase == 'search':
+			self.open()
+
+	def onPhaseEnd(self, phase):
+		if phase == 'search':
+			self.close()
+
+	def open(self):
+		self.close()
+		mode = 'a' if self.created else 'w'
+		if self.fileName.endswith('.gz'):
+			self.traceFile = gzip.open(self.fileName, mode + 'b')
+		else:
+			self.traceFile = open(self.fileName, mode)
+		self.created = True
+		self.stack = [(0, 0)]
+
+	def close(self):
+		if self.traceFile is not None:
+			self.traceFile.close()
+			self.traceFile = None
+
+	def _write(self, line):
+		if self.traceFile is not None:
+			self.traceFile.write(line)
+
+
+class PhaseTimer(SearchListener):
+	"""
+	Accumulates wall time per solve phase ('unary', 'ac3', 'preprocess' and 'search').
+	With profile set, each phase also runs under its own cProfile.Profile, so a phase can be
+	inspected with pstats without profiling the rest of the program.
+
+	Args:
+		profile (boolean): also collect a cProfile profile per phase
+	"""
+	def __init__(self, profile=False):
+		self.profile = profile
+		self.phaseTimes = {}
+		self.profiles = {}
+		self.started = {}
+
+	def onPhaseStart(self, phase):
+		if self.profile:
+			profiler = self.profiles.setdefault(phase, cProfile.Profile())
+			profiler.enable()
+		self.started[phase] = time.time()
+
+	def onPhaseEnd(self, phase):
+		elapsed = time.time() - self.started.pop(phase)
+		if self.profile:
+			self.profiles[phase].disable()
+		self.phaseTimes[phase] = self.phaseTimes.get(phase, 0.0) + elapsed
+
+	"""
+	Writes one pstats-readable file per profiled phase, named prefix.phase.prof.
+
+	Returns:
+		list<string>
+		the names of the files written
+	"""
+	def dumpStats(self, prefix):
+		fileNames = []
+		for phase in self.profiles:
+			fileName = '%s.%s.prof' % (prefix, phase)
+			self.profiles[phase].dump_stats(fileName)
+			fileNames.append(fileName)
+		return fileNames
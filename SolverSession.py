@@ -0,0 +1,218 @@
+from collections import deque
+import BinaryCSP
+from BinaryCSP import Assignment, SearchLimits, SearchLimitExceeded, UnaryConstraint
+
+
+class SolverSession:
+	"""
+	Mutable solver session around a ConstraintSatisfactionProblem for problems that are edited
+	and re-solved, such as schedules that gain or lose a few constraints at a time.
+
+	The session keeps the root domains (after unary elimination and, with useAC3, arc consistency)
+	and the last solution. Added constraints are applied to the root domains and propagated only
+	from the variables they touch. solve then repairs the last solution: variables that violate
+	an added constraint are unassigned, every other variable keeps its value, and only the
+	unassigned region is searched. If that fails the region grows by one ring of neighbours, up to
+	repairRadius rings, before solve falls back to a full search from fresh root domains.
+
+	Removing a constraint cannot invalidate the last solution, so it is kept as is. The root
+	domains may then be tighter than necessary; they are only used for repairs, and are
+	recomputed before the next full search.
+
+	The csp is modified in place through addConstraint and removeConstraint.
+
+	Args:
+		csp (ConstraintSatisfactionProblem): the problem to solve and edit
+		orderValuesMethod (function<assignment, csp, variable> returns list<value>): value ordering
+		inferenceMethod (function<assignment, csp, variable, value> returns set<variable, value>): inferences
+				made during search, None for plain backtracking
+		useAC3 (boolean): keep the root domains arc consistent
+		repairNodeLimit (int): search nodes allowed per repair attempt
+		repairRadius (int): rings of neighbours a repair region may grow by before the full search
+	"""
+	def __init__(self, csp, orderValuesMethod=BinaryCSP.orderValues, inferenceMethod=BinaryCSP.forwardChecking, useAC3=True, repairNodeLimit=1000, repairRadius=2):
+		self.csp = csp
+		self.orderValuesMethod = orderValuesMethod
+		self.inferenceMethod = inferenceMethod
+		self.useAC3 = useAC3
+		self.repairNodeLimit = repairNodeLimit
+		self.repairRadius = repairRadius
+		self.root = None
+		self.solution = None
+		self.added = []
+		self.changed = set([])
+		self.lastMethod = None
+
+	"""
+	Adds a unary or binary constraint to the problem and propagates it through the root domains.
+
+	Args:
+		constraint (UnaryConstraint or BinaryConstraint): the constraint to add
+	"""
+	def addConstraint(self, constraint):
+		self.csp.addConstraint(constraint)
+		self.added.append(constraint)
+		if self.root is None or not self.root.isConsistent():
+			return
+		assignment = Assignment(self.csp, self.root)
+		inferences = set([])
+		if isinstance(constraint, UnaryConstraint):
+			removed = BinaryCSP.applyUnaryConstraints(assignment, constraint.var, [constraint])
+			if removed == None:
+				self.root = None
+				return
+			inferences.update((constraint.var, value) for value in removed)
+			queue = deque([])
+			if removed:
+				queue = BinaryCSP.arcsFrom(assignment, self.csp, constraint.var)
+		else:
+			queue = deque([(constraint.var1, constraint.var2, constraint), (constraint.var2, constraint.var1, constraint)])
+		if self.useAC3 and queue and not BinaryCSP.propagateArcs(assignment, self.csp, queue, inferences):
+			self.root = None
+			return
+		self.updateRoot(assignment, set(var for var, value in inferences))
+
+	"""
+	Removes a constraint from the problem. The last solution stays valid.
+
+	Args:
+		constraint (UnaryConstraint or BinaryConstraint): a constraint of the problem
+	"""
+	def removeConstraint(self, constraint):
+		self.csp.removeConstraint(constraint)
+		if constraint in self.added:
+			self.added.remove(constraint)
+		if self.root is not None and not self.root.isConsistent():
+			self.root = None
+
+	"""
+	Solves the current problem, repairing the last solution when there is one.
+
+	Returns:
+		dictionary<string, value>
+		A map from variables to their assigned values. None if no solution exists.
+	"""
+	def solve(self):
+		if self.solution is not None:
+			region = self.conflicts()
+			if not region:
+				self.lastMethod = 'unchanged'
+				return dict(self.solution)
+			if self.root is not None and self.root.isConsistent():
+				for radius in xrange(self.repairRadius + 1):
+					solution = self.repair(region)
+					if solution is not None:
+						self.lastMethod = 'repair'
+						return self.finish(solution)
+					grown = self.neighbours(region)
+					if len(grown) == len(region):
+						break
+					region = grown
+		self.lastMethod = 'full'
+		return self.finish(self.fullSolve())
+
+	"""
+	Variables of the last solution that have to be reassigned: those violating a constraint added
+	since it was found, and those whose value has since been pruned from the root domains.
+	"""
+	def conflicts(self):
+		solution = self.solution
+		region = set([])
+		for constraint in self.added:
+			if isinstance(constraint, UnaryConstraint):
+				if not constraint.isSatisfied(solution[constraint.var]):
+					region.add(constraint.var)
+			elif not constraint.isSatisfied(solution[constraint.var1], solution[constraint.var2]):
+				region.add(constraint.var1)
+				region.add(constraint.var2)
+		if self.root is not None and self.root.isConsistent():
+			for var in self.changed:
+				if solution[var] not in self.root.domains[var]:
+					region.add(var)
+		return region
+
+	"""
+	Searches for new values for the variables in region with every other variable fixed to its
+	value in the last solution. Returns the solution, or None if the region has none within
+	repairNodeLimit nodes.
+	"""
+	def repair(self, region):
+		csp = self.csp
+		assignment = Assignment(csp, self.root)
+		for var in self.solution:
+			if var not in region:
+				assignment.assignedValues[var] = self.solution[var]
+		for var in region:
+			for cons in csp.constraintsOf(var):
+				other = cons.otherVariable(var)
+				if assignment.isAssigned(other):
+					value = assignment.assignedValues[other]
+					failed = [candidate for candidate in assignment.varDomains[var] if not cons.isSatisfied(candidate, value)]
+					if failed:
+						assignment.writableDomain(var).difference_update(failed)
+			if not assignment.varDomains[var]:
+				return None
+		assignment.limits = SearchLimits(maxNodes=self.repairNodeLimit)
+		select = lambda assignment, csp: self.selectFromRegion(assignment, csp, region)
+		try:
+			if self.inferenceMethod is None or self.inferenceMethod == BinaryCSP.noInferences:
+				assignment = BinaryCSP.recursiveBacktracking(assignment, csp, self.orderValuesMethod, select)
+			else:
+				assignment = BinaryCSP.recursiveBacktrackingWithInferences(assignment, csp, self.orderValuesMethod, select, self.inferenceMethod)
+		except SearchLimitExceeded:
+			return None
+		if assignment == None:
+			return None
+		return assignment.extractSolution()
+
+	"""
+	Minimum remaining values over the unassigned variables of region only, so that a repair does
+	not scan the whole problem for its next variable. Ties go to the higher degree.
+	"""
+	def selectFromRegion(self, assignment, csp, region):
+		nextVar = None
+		best = None
+		for var in region:
+			if not assignment.isAssigned(var):
+				key = (len(assignment.varDomains[var]), -len(csp.constraintsOf(var)))
+				if best is None or key < best:
+					best = key
+					nextVar = var
+		return nextVar
+
+	"""
+	The region together with every variable sharing a binary constraint with it.
+	"""
+	def neighbours(self, region):
+		grown = set(region)
+		for var in region:
+			for cons in self.csp.constraintsOf(var):
+				grown.add(cons.otherVariable(var))
+		return grown
+
+	"""
+	Solves from scratch with fresh root domains.
+	"""
+	def fullSolve(self):
+		self.root = self.csp.rootState(self.useAC3)
+		return BinaryCSP.solve(self.csp, self.orderValuesMethod, BinaryCSP.minimumRemainingValuesHeuristic, self.inferenceMethod, self.useAC3, reuseRootState=True)
+
+	def finish(self, solution):
+		if solution is not None:
+			solution = dict(solution)
+		self.solution = solution
+		self.added = []
+		self.changed = set([])
+		if solution is None:
+			return None
+		return dict(solution)
+
+	"""
+	Copies the domains of the changed variables from an assignment created from the root into
+	the root domains. The csp no longer caches the root once a constraint is added, so the
+	domains are updated in place.
+	"""
+	def updateRoot(self, assignment, changed):
+		for var in changed:
+			self.root.domains[var] = frozenset(assignment.varDomains[var])
+		self.changed.update(changed)
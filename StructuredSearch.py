@@ -0,0 +1,283 @@
+from collections import deque
+import BinaryCSP
+from BinaryCSP import notifyListeners
+
+"""
+	Search methods for solve that exploit the shape of the constraint graph. Pass one as the
+	searchMethod argument of solve.
+
+	A connected component whose constraint graph is a tree is solved without backtracking: directed
+	arc consistency from the leaves up to a root leaves every value of a parent with a supporting
+	value in each of its children, after which one pass from the root down assigns every variable.
+	A component that is nearly a tree is solved by cutset conditioning: each consistent assignment
+	of a small cycle cutset is forward checked into its neighbours and the forest that remains is
+	solved as above.
+"""
+
+DEFAULT_MAX_CUTSET = 4
+
+
+"""
+	The constraint graph over the unassigned variables of an assignment.
+
+	Returns:
+		dictionary<string, dictionary<string, list<BinaryConstraint>>>
+		for each unassigned variable, its unassigned neighbours and the constraints shared with each
+"""
+def constraintGraph(assignment, csp):
+	graph = {}
+	for var in assignment.varDomains:
+		if not assignment.isAssigned(var):
+			graph[var] = {}
+	for cons in csp.binaryConstraints:
+		if cons.var1 != cons.var2 and cons.var1 in graph and cons.var2 in graph:
+			graph[cons.var1].setdefault(cons.var2, []).append(cons)
+			graph[cons.var2].setdefault(cons.var1, []).append(cons)
+	return graph
+
+
+"""
+	Splits the variables of a graph, or of the given subset of it, into connected components.
+	Each component is listed in breadth first order from its first variable.
+"""
+def connectedComponents(graph, variables=None):
+	if variables is None:
+		variables = graph
+	inside = set(variables)
+	seen = set([])
+	components = []
+	for start in variables:
+		if start in seen:
+			continue
+		seen.add(start)
+		component = [start]
+		queue = deque([start])
+		while queue:
+			var = queue.popleft()
+			for other in graph[var]:
+				if other in inside and other not in seen:
+					seen.add(other)
+					component.append(other)
+					queue.append(other)
+		components.append(component)
+	return components
+
+
+"""
+	Whether the given variables induce a forest in the graph.
+"""
+def isForest(graph, variables):
+	inside = set(variables)
+	parent = dict((var, var) for var in inside)
+	def find(var):
+		while parent[var] != var:
+			parent[var] = parent[parent[var]]
+			var = parent[var]
+		return var
+	for var in inside:
+		for other in graph[var]:
+			if other in inside and var < other:
+				root1 = find(var)
+				root2 = find(other)
+				if root1 == root2:
+					return False
+				parent[root1] = root2
+	return True
+
+
+"""
+	Finds a cycle cutset of a connected component: variables whose removal leaves a forest.
+	Leaves are stripped repeatedly and the variable of highest remaining degree is moved to the
+	cutset until nothing is left, then cutset variables that are not needed are dropped again.
+
+	Args:
+		graph: the constraint graph, see constraintGraph
+		variables (list<string>): the variables of the component
+	Returns:
+		list<string>
+		the cutset, empty if the component is a tree
+"""
+def findCycleCutset(graph, variables):
+	remaining = set(variables)
+	degree = dict((var, sum(1 for other in graph[var] if other in remaining)) for var in variables)
+	cutset = []
+	while True:
+		leaves = [var for var in remaining if degree[var] <= 1]
+		while leaves:
+			var = leaves.pop()
+			if var not in remaining:
+				continue
+			remaining.discard(var)
+			for other in graph[var]:
+				if other in remaining:
+					degree[other] -= 1
+					if degree[other] == 1:
+						leaves.append(other)
+		if not remaining:
+			break
+		var = max(remaining, key=lambda var: (degree[var], var))
+		cutset.append(var)
+		remaining.discard(var)
+		for other in graph[var]:
+			if other in remaining:
+				degree[other] -= 1
+	for var in list(reversed(cutset)):
+		kept = set(cutset)
+		kept.discard(var)
+		if isForest(graph, [other for other in variables if other not in kept]):
+			cutset.remove(var)
+	return cutset
+
+
+"""
+	Solves the forest the given variables induce in the graph, with the assigned variables of the
+	assignment fixed, by directed arc consistency and a backtrack-free pass per tree. Values are
+	written to the assignment only if every tree has a solution.
+
+	Args:
+		assignment (Assignment): the assignment; the variables must be unassigned
+		csp (ConstraintSatisfactionProblem): the problem definition
+		graph: the constraint graph, see constraintGraph
+		variables (list<string>): unassigned variables that induce a forest
+	Returns:
+		boolean
+		True if the forest was solved and assigned
+"""
+def solveForest(assignment, csp, graph, variables):
+	stats = assignment.stats
+	listeners = assignment.listeners
+	limits = assignment.limits
+	domains = {}
+	for var in variables:
+		domains[var] = [value for value in assignment.varDomains[var] if BinaryCSP.consistent(assignment, csp, var, value)]
+		if not domains[var]:
+			return False
+	values = {}
+	for tree in connectedComponents(graph, variables):
+		parents = {tree[0]: None}
+		for var in tree:
+			for other in graph[var]:
+				if other in domains and other not in parents:
+					parents[other] = var
+		for child in reversed(tree[1:]):
+			if limits is not None:
+				limits.checkWork()
+			parent = parents[child]
+			constraints = graph[child][parent]
+			childDomain = domains[child]
+			if stats is not None:
+				stats.revisions += 1
+				stats.constraintChecks += len(domains[parent]) * len(childDomain)
+			supported = [value for value in domains[parent] if any(satisfiesAll(constraints, parent, value, childValue) for childValue in childDomain)]
+			if stats is not None:
+				stats.valuesPruned += len(domains[parent]) - len(supported)
+			if not supported:
+				if listeners is not None:
+					notifyListeners(listeners, 'onWipeout', parent)
+				return False
+			domains[parent] = supported
+		values[tree[0]] = domains[tree[0]][0]
+		for child in tree[1:]:
+			parent = parents[child]
+			constraints = graph[child][parent]
+			for childValue in domains[child]:
+				if satisfiesAll(constraints, parent, values[parent], childValue):
+					values[child] = childValue
+					break
+	for var in variables:
+		assignment.assignedValues[var] = values[var]
+		if stats is not None:
+			stats.nodes += 1
+		if listeners is not None:
+			notifyListeners(listeners, 'onAssign', var, values[var])
+	return True
+
+"""
+	Whether value for var and otherValue for the other variable satisfy all the constraints between them.
+"""
+def satisfiesAll(constraints, var, value, otherValue):
+	for cons in constraints:
+		if cons.var1 == var:
+			if not cons.isSatisfied(value, otherValue):
+				return False
+		elif not cons.isSatisfied(otherValue, value):
+			return False
+	return True
+
+
+"""
+	Cutset conditioning over one connected component: backtracks over the cutset variables with
+	forward checking and solves the remaining forest for each consistent cutset assignment.
+	Returns True once the component is assigned.
+"""
+def conditionOnCutset(assignment, csp, graph, cutset, forest, orderValuesMethod, i=0):
+	if i == len(cutset):
+		return solveForest(assignment, csp, graph, forest)
+	stats = assignment.stats
+	listeners = assignment.listeners
+	limits = assignment.limits
+	var = cutset[i]
+	for value in orderValuesMethod(assignment, csp, var):
+		if not BinaryCSP.consistent(assignment, csp, var, value):
+			continue
+		assignment.assignedValues[var] = value
+		if stats is not None:
+			stats.nodes += 1
+		if listeners is not None:
+			notifyListeners(listeners, 'onAssign', var, value)
+		if limits is not None:
+			limits.enterNode(assignment)
+		inference = BinaryCSP.forwardChecking(assignment, csp, var, value)
+		if inference is not None:
+			if conditionOnCutset(assignment, csp, graph, cutset, forest, orderValuesMethod, i + 1):
+				return True
+			BinaryCSP.restoreInferences(assignment, inference)
+		if listeners is not None:
+			notifyListeners(listeners, 'onUnassign', var, value)
+		if limits is not None:
+			limits.leaveNode()
+	assignment.assignedValues[var] = None
+	if stats is not None:
+		stats.backtracks += 1
+	return False
+
+
+"""
+	Search method for solve that solves each connected component of the constraint graph by its
+	structure: tree components directly, components with a cycle cutset of at most maxCutset
+	variables by cutset conditioning, and the rest by backtrackingSearch with the given methods.
+	Components are independent, so the first one without a solution ends the search.
+
+	Args:
+		assignment (Assignment): the prepared assignment
+		csp (ConstraintSatisfactionProblem): the problem definition
+		orderValuesMethod (function<assignment, csp, variable> returns list<value>): value ordering,
+				used for the cutset variables and by the fallback search
+		selectVariableMethod, inferenceMethod: used by the fallback search only
+		maxCutset (int): the largest cutset to condition on; 0 solves only tree components directly
+	Returns:
+		Assignment
+		A completed and consistent assignment. None if no solution exists.
+"""
+def structuredSearch(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod, maxCutset=DEFAULT_MAX_CUTSET):
+	graph = constraintGraph(assignment, csp)
+	for component in connectedComponents(graph):
+		cutset = findCycleCutset(graph, component)
+		if len(cutset) > maxCutset:
+			continue
+		inCutset = set(cutset)
+		forest = [var for var in component if var not in inCutset]
+		if not conditionOnCutset(assignment, csp, graph, cutset, forest, orderValuesMethod):
+			return None
+	if assignment.isComplete():
+		return assignment
+	return BinaryCSP.backtrackingSearch(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod)
+
+
+"""
+	Makes a structuredSearch with a different cutset bound, for the searchMethod argument of solve.
+"""
+def cutsetSearch(maxCutset):
+	def search(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod):
+		return structuredSearch(assignment, csp, orderValuesMethod, selectVariableMethod, inferenceMethod, maxCutset)
+	return search
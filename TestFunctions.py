@@ -0,0 +1,669 @@
+import gzip
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import urllib2
+import BinaryCSP
+import BranchAndBound
+import BucketElimination
+import ColumnarCSP
+import ConflictExplanation
+import CooperativeSolve
+import DomainCache
+import LocalSearch
+import SolverSession
+import StructuredSearch
+import Testing
+import autograder
+import benchmark
+import server
+from SearchListeners import PhaseTimer, SearchTraceListener
+
+""" Functions that .test files call through the autograder (for example
+    'TestFunctions.forbidden_pair_counts') to exercise the solver extensions. Each one runs a
+    scenario and returns a plain value, such as a list or a dictionary, that the .solution file
+    compares with the expected one. """
+
+
+""" The number of ordered value pairs each constraint of a model B instance forbids. """
+def forbidden_pair_counts(n, d, p1, p2, seed):
+    csp = benchmark.model_b(n, d, p1, p2, seed)
+    values = sorted(csp.varDomains['X0'])
+    counts = []
+    for cons in csp.binaryConstraints:
+        counts.append(len([(a, b) for a in values for b in values if not cons.isSatisfied(a, b)]))
+    return counts
+
+
+class EventCounter(BinaryCSP.SearchListener):
+    """ Counts the listener events of a solve. """
+    def __init__(self):
+        self.counts = {}
+
+    def count(self, event):
+        self.counts[event] = self.counts.get(event, 0) + 1
+
+    def onAssign(self, var, value):
+        self.count('onAssign')
+
+    def onUnassign(self, var, value):
+        self.count('onUnassign')
+
+    def onPrune(self, var, value):
+        self.count('onPrune')
+
+    def onWipeout(self, var):
+        self.count('onWipeout')
+
+    def onSolution(self, assignment):
+        self.count('onSolution')
+
+
+""" Solves a problem with forward checking and AC3 and returns its SearchStatistics counters,
+    the phases it timed, and the assignments and prunings its listener events report. """
+def search_statistics(csp):
+    stats = BinaryCSP.SearchStatistics()
+    events = EventCounter()
+    BinaryCSP.solve(csp, BinaryCSP.orderValues, BinaryCSP.chooseFirstVariable, BinaryCSP.forwardChecking, True, stats, [events])
+    counters = stats.asDict()
+    counters['phaseTimes'] = sorted(counters['phaseTimes'])
+    counters['assignEvents'] = events.counts.get('onAssign', 0)
+    counters['pruneEvents'] = events.counts.get('onPrune', 0)
+    return counters
+
+
+""" Solves a problem with a node limit of 20 under a profiling PhaseTimer and a gzipped
+    SearchTraceListener, and reports how the solve ended and what the listeners were left with:
+    whether a profiler is still installed, the phases still started and the phases timed, whether
+    the trace file is closed and the assignments it holds. """
+def limited_solve_listeners(csp):
+    handle, trace_name = tempfile.mkstemp(suffix='.gz')
+    os.close(handle)
+    timer = PhaseTimer(profile=True)
+    trace = SearchTraceListener(trace_name)
+    try:
+        result = BinaryCSP.solve(csp, BinaryCSP.orderValues, BinaryCSP.chooseFirstVariable, None, False,
+            listeners=[timer, trace], limits=BinaryCSP.SearchLimits(maxNodes=20))
+        profiling = sys.getprofile() is not None
+        trace_open = trace.traceFile is not None
+    finally:
+        sys.setprofile(None)
+        trace.close()
+    with gzip.open(trace_name) as trace_file:
+        assigned = len([line for line in trace_file if line.startswith('a')])
+    os.remove(trace_name)
+    return {
+        'reason': getattr(result, 'reason', None),
+        'profiling': profiling,
+        'started': sorted(timer.started),
+        'timed': sorted(timer.phaseTimes),
+        'traceOpen': trace_open,
+        'tracedAssignments': assigned
+    }
+
+
+""" The values of var from least to most constraining, counted from scratch: for each value, the
+    values of the neighbouring domains it conflicts with. Ties keep domain order. """
+def reference_value_order(assignment, csp, var):
+    domains = assignment.varDomains
+    counts = {}
+    for value in domains[var]:
+        counts[value] = 0
+        for cons in csp.constraintsOf(var):
+            other = cons.otherVariable(var)
+            for other_value in domains[other]:
+                if cons.var1 == var:
+                    satisfied = cons.isSatisfied(value, other_value)
+                else:
+                    satisfied = cons.isSatisfied(other_value, value)
+                if not satisfied:
+                    counts[value] += 1
+    values = list(domains[var])
+    values.sort(key=lambda value: counts[value])
+    return values
+
+
+""" Solves a problem with forward checking and the named BinaryCSP value ordering, checking
+    every value it hands the search, as the search takes it, against reference_value_order at
+    the time of the call. Returns whether the problem was solved, how many orderings were
+    checked and how many values differed from the reference. """
+def audited_value_ordering(csp, ordering_name):
+    ordering = getattr(BinaryCSP, ordering_name)
+    audit = {'orderings': 0, 'mismatches': 0}
+    def audited(assignment, csp, var):
+        expected = reference_value_order(assignment, csp, var)
+        audit['orderings'] += 1
+        for i, value in enumerate(ordering(assignment, csp, var)):
+            if i >= len(expected) or value != expected[i]:
+                audit['mismatches'] += 1
+            yield value
+    solution = BinaryCSP.solve(csp, audited, BinaryCSP.minimumRemainingValuesHeuristic, BinaryCSP.forwardChecking, False)
+    audit['solved'] = solution is not None
+    return audit
+
+
+""" The domains unary elimination leaves, as sorted lists, or None if it wipes out a domain. """
+def eliminated_domains(csp):
+    assignment = BinaryCSP.Assignment(csp)
+    if BinaryCSP.eliminateUnaryConstraints(assignment, csp) is None:
+        return None
+    return dict((var, sorted(assignment.varDomains[var])) for var in assignment.varDomains)
+
+
+""" The domains each unary constraint allows by itself, intersected per variable. """
+def reference_unary_domains(csp):
+    domains = {}
+    for var in csp.varDomains:
+        allowed = [value for value in csp.varDomains[var]
+            if all(cons.isSatisfied(value) for cons in csp.unaryConstraints if cons.var == var)]
+        if not allowed:
+            return None
+        domains[var] = sorted(allowed)
+    return domains
+
+
+""" Unary elimination of a problem, then again after a BadValueConstraint and a
+    GoodValueConstraint are added with addConstraint, and after the GoodValueConstraint is removed
+    again. Returns the domains of each step, and whether each step matches checking every unary
+    constraint directly. """
+def unary_elimination_steps(csp, var1, bad_value, var2, good_value):
+    steps = [eliminated_domains(csp)]
+    matches = [steps[-1] == reference_unary_domains(csp)]
+    good = BinaryCSP.GoodValueConstraint(var2, good_value)
+    for change in (BinaryCSP.BadValueConstraint(var1, bad_value), good):
+        csp.addConstraint(change)
+        steps.append(eliminated_domains(csp))
+        matches.append(steps[-1] == reference_unary_domains(csp))
+    csp.removeConstraint(good)
+    steps.append(eliminated_domains(csp))
+    matches.append(steps[-1] == reference_unary_domains(csp))
+    return {'domains': steps, 'matches': matches}
+
+
+class LabelledNotEqualConstraint(BinaryCSP.NotEqualConstraint):
+    """ A constraint subclass without __slots__, which gets a __dict__ for its own attributes. """
+    def __init__(self, var1, var2, label):
+        BinaryCSP.NotEqualConstraint.__init__(self, var1, var2)
+        self.label = label
+
+
+""" Whether instances of a class get a __dict__, that is whether some class in its hierarchy
+    does not declare __slots__. """
+def has_instance_dict(cls):
+    return any('__slots__' not in vars(base) for base in cls.__mro__[:-1])
+
+
+""" The constraint and search state classes of BinaryCSP whose instances still get a __dict__,
+    and whether a problem whose NotEqualConstraints are replaced by a subclass without __slots__
+    solves to the same solution. """
+def slotted_classes(csp):
+    classes = [BinaryCSP.Assignment, BinaryCSP.RootState, BinaryCSP.PairwiseConstraints]
+    for name in dir(BinaryCSP):
+        cls = getattr(BinaryCSP, name)
+        if isinstance(cls, type) and issubclass(cls, (BinaryCSP.UnaryConstraint, BinaryCSP.BinaryConstraint)):
+            classes.append(cls)
+    expected = BinaryCSP.solve(csp, BinaryCSP.orderValues, BinaryCSP.chooseFirstVariable, BinaryCSP.forwardChecking, True)
+    labelled = [LabelledNotEqualConstraint(cons.var1, cons.var2, str(i)) for i, cons in enumerate(csp.binaryConstraints)]
+    relabelled = BinaryCSP.ConstraintSatisfactionProblem(list(csp.varDomains), list(csp.varDomains.values()), labelled, list(csp.unaryConstraints))
+    solution = BinaryCSP.solve(relabelled, BinaryCSP.orderValues, BinaryCSP.chooseFirstVariable, BinaryCSP.forwardChecking, True)
+    return {
+        'withDict': sorted(cls.__name__ for cls in classes if has_instance_dict(cls)),
+        'subclassHasDict': hasattr(labelled[0], '__dict__'),
+        'sameSolution': solution is not None and solution == expected
+    }
+
+
+""" Solves a problem with forward checking, AC3 and the given extra solve arguments. """
+def solve_with(csp, **kwargs):
+    return BinaryCSP.solve(csp, BinaryCSP.orderValues, BinaryCSP.chooseFirstVariable, BinaryCSP.forwardChecking, True, **kwargs)
+
+
+""" Solves a problem twice from its cached RootState and once more with an extra
+    GoodValueConstraint, comparing each with a solve from scratch. Also reports whether the
+    searches left the cached root domains as they were. """
+def root_state_reuse(csp, var, value):
+    fresh = solve_with(csp)
+    first = solve_with(csp, reuseRootState=True)
+    root = csp.rootState(True)
+    domains = dict((other, set(root.domains[other])) for other in root.domains)
+    second = solve_with(csp, reuseRootState=True)
+    extra = BinaryCSP.GoodValueConstraint(var, value)
+    with_extra = solve_with(csp, reuseRootState=True, extraUnaryConstraints=[extra])
+    constrained = BinaryCSP.ConstraintSatisfactionProblem(list(csp.varDomains), list(csp.varDomains.values()),
+        list(csp.binaryConstraints), list(csp.unaryConstraints) + [extra])
+    return {
+        'sameAsFresh': fresh is not None and first == fresh and second == fresh,
+        'rootUnchanged': csp.rootState(True) is root and dict((other, set(root.domains[other])) for other in root.domains) == domains,
+        'extraSameAsFresh': with_extra == solve_with(constrained),
+        'extraValue': with_extra[var] if with_extra else None
+    }
+
+
+""" Whether a solution satisfies every unary and binary constraint of a problem. """
+def satisfies(csp, solution):
+    for cons in csp.unaryConstraints:
+        if not cons.isSatisfied(solution[cons.var]):
+            return False
+    for cons in csp.binaryConstraints:
+        if not cons.isSatisfied(solution[cons.var1], solution[cons.var2]):
+            return False
+    return sorted(solution) == sorted(csp.varDomains)
+
+
+""" Edits and re-solves a problem through a SolverSession: solves it, forbids the value var got,
+    removes that constraint again, then forces var and other to the same value across their
+    NotEqualConstraint. Returns, per solve, how the session solved it, whether the solution is
+    valid for the problem as edited so far (None when there is none), and for the repair, the
+    variables whose values changed. """
+def session_edits(csp, var, other):
+    session = SolverSession.SolverSession(csp)
+    steps = []
+    def record():
+        solution = session.solve()
+        steps.append([session.lastMethod, None if solution is None else satisfies(csp, solution)])
+        return solution
+    first = record()
+    forbid = BinaryCSP.BadValueConstraint(var, first[var])
+    session.addConstraint(forbid)
+    repaired = record()
+    steps[-1].append(sorted(name for name in first if first[name] != repaired[name]))
+    session.removeConstraint(forbid)
+    record()
+    session.addConstraint(BinaryCSP.GoodValueConstraint(var, repaired[var]))
+    session.addConstraint(BinaryCSP.GoodValueConstraint(other, repaired[var]))
+    record()
+    return steps
+
+
+""" Posts solve requests naming the given method and constraint class to a solver server with no
+    workers, which answers requests it rejects without dispatching them. Returns, per request,
+    the HTTP status code and the status in the response. """
+def server_rejections(csp_file, order, unary_name):
+    with open(csp_file) as csp_handle:
+        text = csp_handle.read()
+    httpd = server.SolverServer(('127.0.0.1', 0), server.SolverService(0, 4))
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d/solve' % httpd.server_address[1]
+    results = []
+    try:
+        for request in [{'csp': text, 'order': order}, {'csp': text, 'unary': [[unary_name, 'A', 'R']]},
+                {'csp': text, 'select': 'solve'}]:
+            try:
+                response = urllib2.urlopen(urllib2.Request(url, json.dumps(request)))
+            except urllib2.HTTPError, e:
+                response = e
+            results.append([response.getcode(), json.loads(response.read())['status']])
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    accepted = server.solve_request(server.LRUCache(1), 'ref', text, {'order': 'orderValues',
+        'unary': [['BadValueConstraint', 'A', 'R']]})
+    results.append([accepted['status'], accepted['solution']['A'] != 'R'])
+    return results
+
+
+""" Solves each problem with solve, with SteppedSolves run together by runCooperatively in slices of
+    step_nodes nodes, and with BackgroundSolves, all with the same methods. Returns, per problem,
+    whether the stepped and background results and search node counts match solve's and how many
+    slices the stepped solve took, then the reason a BackgroundSolve cancelled before it starts
+    gives. """
+def cooperative_solves(step_nodes, *csp_files):
+    methods = (BinaryCSP.orderValues, BinaryCSP.chooseFirstVariable, BinaryCSP.forwardChecking)
+    csps = [Testing.csp_parse(Testing.get_lines(csp_file)) for csp_file in csp_files]
+    expected = []
+    for csp in csps:
+        stats = BinaryCSP.SearchStatistics()
+        expected.append((BinaryCSP.solve(csp, *methods, stats=stats), stats.nodes))
+    slices = [0] * len(csps)
+    def counter(index):
+        def progress(stats):
+            slices[index] += 1
+        return progress
+    stepped = [CooperativeSolve.SteppedSolve(csp, *methods, stepNodes=step_nodes, progress=counter(index))
+        for index, csp in enumerate(csps)]
+    CooperativeSolve.runCooperatively(stepped)
+    background = [CooperativeSolve.BackgroundSolve(csp, *methods) for csp in csps]
+    results = []
+    for index in range(len(csps)):
+        solution, nodes = expected[index]
+        results.append([stepped[index].result == solution, stepped[index].stats.nodes == nodes,
+            background[index].wait(60) == solution, background[index].stats.nodes == nodes, slices[index]])
+    token = BinaryCSP.CancellationToken()
+    token.cancel()
+    cancelled = CooperativeSolve.BackgroundSolve(csps[0], *methods, limits=BinaryCSP.SearchLimits(cancelToken=token))
+    results.append(cancelled.wait(60).reason)
+    return results
+
+
+""" The least total weight of soft constraints violated by a solution of a problem, found by trying
+    every complete assignment; None if no assignment satisfies the hard constraints. """
+def brute_force_optimum(csp, soft_constraints):
+    variables = sorted(csp.varDomains)
+    best = None
+    for values in itertools.product(*[sorted(csp.varDomains[var]) for var in variables]):
+        solution = dict(zip(variables, values))
+        if not satisfies(csp, solution):
+            continue
+        cost = 0
+        for soft in soft_constraints:
+            if soft.isUnary():
+                cost += soft.cost(solution[soft.constraint.var])
+            else:
+                cost += soft.cost(solution[soft.constraint.var1], solution[soft.constraint.var2])
+        if best is None or cost < best:
+            best = cost
+    return best
+
+
+""" Solves a problem with solveOptimal, preferring value for every variable and, with half the
+    weight, different values for each pair of variables in alphabetical order. Reports the optimum
+    against brute force, then solves again with the optimum and one more as upper bounds, and
+    the unsatisfiable problem in infeasible_file with and without a bound. Each solve is reported
+    as [cost, optimal, infeasible]. """
+def optimal_costs(csp, value, infeasible_file):
+    variables = sorted(csp.varDomains)
+    soft = [BranchAndBound.SoftConstraint(BinaryCSP.GoodValueConstraint(var, value), 2) for var in variables]
+    soft += [BranchAndBound.SoftConstraint(BinaryCSP.NotEqualConstraint(var1, var2))
+        for var1, var2 in zip(variables, variables[1:])]
+    expected = brute_force_optimum(csp, soft)
+    def report(problem, upper_bound=None):
+        optimum = BranchAndBound.solveOptimal(problem, soft, upperBound=upper_bound)
+        return [optimum.cost, optimum.optimal, optimum.infeasible]
+    unsatisfiable = Testing.csp_parse(Testing.get_lines(infeasible_file))
+    return {
+        'bruteForce': expected,
+        'unbounded': report(csp),
+        'boundAtOptimum': report(csp, expected),
+        'boundAboveOptimum': report(csp, expected + 1),
+        'infeasible': report(unsatisfiable),
+        'infeasibleBounded': report(unsatisfiable, 100)
+    }
+
+
+""" Solves each problem with and without breakValueSymmetry. Returns, per problem, the classes of
+    interchangeable values found after unary elimination, whether both solves agree on
+    satisfiability, whether the symmetry broken solution is valid, and the search nodes of
+    both solves. """
+def symmetry_breaking(*csp_files):
+    results = []
+    for csp_file in csp_files:
+        csp = Testing.csp_parse(Testing.get_lines(csp_file))
+        assignment = BinaryCSP.Assignment(csp)
+        BinaryCSP.eliminateUnaryConstraints(assignment, csp)
+        classes = BinaryCSP.interchangeableValues(assignment, csp)
+        plain_stats = BinaryCSP.SearchStatistics()
+        plain = solve_with(csp, stats=plain_stats)
+        broken_stats = BinaryCSP.SearchStatistics()
+        broken = solve_with(csp, stats=broken_stats, breakValueSymmetry=True)
+        results.append([classes, (plain is None) == (broken is None), broken is None or satisfies(csp, broken),
+            plain_stats.nodes, broken_stats.nodes])
+    return results
+
+
+""" Takes a problem and an assignment for it twice from one autograder ParseCache, adds a
+    constraint to the first problem and assigns a variable in the first assignment. Returns
+    whether the second problem and assignment are separate objects left unchanged. """
+def parse_cache_isolation(csp_file, assignment_file, var, value):
+    cache = autograder.ParseCache()
+    first = cache.csp(csp_file)
+    constraints = len(first.binaryConstraints) + len(first.unaryConstraints)
+    first.addConstraint(BinaryCSP.BadValueConstraint(var, value))
+    second = cache.csp(csp_file)
+    first_assignment = cache.assignment(assignment_file)
+    first_assignment.assignedValues[var] = value
+    second_assignment = cache.assignment(assignment_file)
+    return {
+        'separateCsps': first is not second,
+        'cspUnchanged': len(second.binaryConstraints) + len(second.unaryConstraints) == constraints,
+        'separateAssignments': first_assignment is not second_assignment,
+        'assignmentUnchanged': second_assignment.assignedValues[var] is None
+    }
+
+
+""" Parses a compact problem whose @pairwise groups should match the constraints of an expanded
+    one. Returns the number of groups left unexpanded after parsing, the number of constraints
+    after the first read, whether they cover the same unordered pairs as the expanded problem
+    without duplicates, and whether both problems give the same solution. """
+def lazy_pairwise_groups(compact_file, expanded_file):
+    compact = Testing.csp_parse(Testing.get_lines(compact_file))
+    expanded = Testing.csp_parse(Testing.get_lines(expanded_file))
+    pending = len(compact.pendingGroups)
+    def pairs(csp):
+        return [tuple(sorted((cons.var1, cons.var2))) for cons in csp.binaryConstraints]
+    compact_pairs = pairs(compact)
+    return {
+        'pendingGroups': pending,
+        'constraints': len(compact_pairs),
+        'samePairs': sorted(compact_pairs) == sorted(set(pairs(expanded))),
+        'sameSolution': solve_with(compact) == solve_with(expanded)
+    }
+
+
+""" The variables with their domains, the constrained pairs with their constraint type and the
+    unary constraints of a columnar instance, decoded to names. """
+def decode_columnar(instance):
+    names = instance.variableNames
+    values = instance.valueNames
+    domains = dict((names[var], sorted(values[value] for value in instance.domain(var)))
+        for var in xrange(instance.numVariables))
+    constraints = sorted((tuple(sorted((names[instance.constraintVar1[i]], names[instance.constraintVar2[i]]))),
+        instance.constraintType[i]) for i in xrange(instance.numConstraints))
+    unary = sorted((names[instance.unaryVar[i]], instance.unaryType[i], values[instance.unaryParameter[i]])
+        for i in xrange(len(instance.unaryVar)))
+    return domains, constraints, unary
+
+
+""" Writes each problem in the columnar format, both from the parsed problem and by converting its
+    file, maps them back and solves them with columnarSolve. Returns, per problem and file, whether
+    it decodes to the same variables, domains and constraints as the problem, whether its
+    columnar solution agrees with solve on satisfiability and is valid, and the reason a solve
+    limited to max_nodes nodes stops. """
+def columnar_round_trip(max_nodes, *csp_files):
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        for index, csp_file in enumerate(csp_files):
+            csp = Testing.csp_parse(Testing.get_lines(csp_file))
+            reference = solve_with(csp)
+            expected_domains = dict((var, sorted(csp.varDomains[var])) for var in csp.varDomains)
+            expected_pairs = sorted(set(tuple(sorted((cons.var1, cons.var2))) for cons in csp.binaryConstraints))
+            written = os.path.join(directory, '%d.written' % index)
+            converted = os.path.join(directory, '%d.converted' % index)
+            ColumnarCSP.writeColumnar(csp, written)
+            ColumnarCSP.convertCspFile(csp_file, converted)
+            for path in [written, converted]:
+                instance = ColumnarCSP.ColumnarInstance(path)
+                try:
+                    domains, constraints, unary = decode_columnar(instance)
+                    solution = ColumnarCSP.columnarSolve(instance)
+                    limited = ColumnarCSP.columnarSolve(instance, limits=BinaryCSP.SearchLimits(maxNodes=max_nodes))
+                finally:
+                    instance.close()
+                results.append([domains == expected_domains and [pair for pair, kind in constraints] == expected_pairs
+                    and len(unary) == len(csp.unaryConstraints), (solution is None) == (reference is None),
+                    solution is None or satisfies(csp, solution), limited.reason])
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+
+""" Solves each problem by backtracking and with structuredSearch for cutset bounds 0, 1 and the
+    default. Returns, per problem, the sizes of the cycle cutsets of its components and whether
+    it has a solution, then per bound whether structuredSearch agrees with backtracking on
+    satisfiability and its solution is valid. """
+def structured_solves(*csp_files):
+    results = []
+    for csp_file in csp_files:
+        csp = Testing.csp_parse(Testing.get_lines(csp_file))
+        assignment = BinaryCSP.Assignment(csp)
+        graph = StructuredSearch.constraintGraph(assignment, csp)
+        cutsets = sorted(len(StructuredSearch.findCycleCutset(graph, component))
+            for component in StructuredSearch.connectedComponents(graph))
+        reference = solve_with(csp)
+        solves = []
+        for max_cutset in [0, 1, StructuredSearch.DEFAULT_MAX_CUTSET]:
+            solution = solve_with(csp, searchMethod=StructuredSearch.cutsetSearch(max_cutset))
+            solves.append([(solution is None) == (reference is None), solution is None or satisfies(csp, solution)])
+        results.append([cutsets, reference is not None, solves])
+    return results
+
+
+""" Solves each problem file, and model B problems with 12 variables of 4 values and half of each
+    constraint's value pairs forbidden for seeds 0 .. seeds - 1, by backtracking and by
+    bucketElimination with a table bound of 1 tuple, which leaves every component with constraints
+    to backtracking, and with the default bound. Returns, per file, the width of the widest
+    elimination bag, whether it has a solution and, per bound, whether bucketElimination agrees
+    with backtracking and its solution is valid; then the same agreement and validity over all
+    model B problems and how many of them have a solution. """
+def elimination_solves(seeds, *csp_files):
+    bounds = [1, BucketElimination.DEFAULT_MAX_TABLE_SIZE]
+    def check(csp):
+        reference = solve_with(csp)
+        solves = []
+        for bound in bounds:
+            solution = solve_with(csp, searchMethod=BucketElimination.eliminationSearch(bound))
+            solves.append([(solution is None) == (reference is None), solution is None or satisfies(csp, solution)])
+        return reference is not None, solves
+    results = []
+    for csp_file in csp_files:
+        csp = Testing.csp_parse(Testing.get_lines(csp_file))
+        graph = StructuredSearch.constraintGraph(BinaryCSP.Assignment(csp), csp)
+        width = 0
+        for component in StructuredSearch.connectedComponents(graph):
+            order, bags = BucketElimination.minFillOrder(graph, component)
+            width = max([width] + [len(bags[var]) for var in order])
+        satisfiable, solves = check(csp)
+        results.append([width, satisfiable, solves])
+    random_solves = [check(benchmark.model_b(12, 4, 0.3, 0.5, seed)) for seed in xrange(seeds)]
+    results.append([all(all(solve) for satisfiable, solves in random_solves for solve in solves),
+        sum(1 for satisfiable, solves in random_solves if satisfiable)])
+    return results
+
+
+""" Runs minConflicts with max_restarts restarts and compares its best assignment with the best
+    violation count of runs with fewer restarts, then runs it with a limit of max_steps moves in
+    all. Returns whether a solution was found, the restarts made, whether the best assignment is
+    the best over all restarts and violates as many constraints as reported, and how the limited
+    run stopped with the steps its limits counted. """
+def min_conflicts_restarts(csp, max_steps, max_restarts, walk_probability, tabu_tenure, seed):
+    result = LocalSearch.minConflicts(csp, max_steps, max_restarts, walk_probability, tabu_tenure, seed)
+    seen = [LocalSearch.minConflicts(csp, max_steps, restarts, walk_probability, tabu_tenure, seed).violations
+        for restarts in xrange(max_restarts + 1)]
+    violated = sum(1 for cons in csp.binaryConstraints
+        if not cons.isSatisfied(result.best[cons.var1], result.best[cons.var2]))
+    limits = BinaryCSP.SearchLimits(maxNodes=max_steps)
+    limited = LocalSearch.minConflicts(csp, max_steps, max_restarts, walk_probability, tabu_tenure, seed, limits=limits)
+    return {
+        'solved': result.solution is not None,
+        'restarts': result.restarts,
+        'bestOverRestarts': result.violations == min(seen),
+        'violationsReported': violated == result.violations,
+        'limited': [limited.reason, limits.nodes]
+    }
+
+
+""" A problem over the variables and domains of csp with only the given constraints. """
+def with_constraints(csp, constraints):
+    variables = sorted(csp.varDomains)
+    return BinaryCSP.ConstraintSatisfactionProblem(variables, [set(csp.varDomains[var]) for var in variables],
+        [cons for cons in constraints if isinstance(cons, BinaryCSP.BinaryConstraint)],
+        [cons for cons in constraints if isinstance(cons, BinaryCSP.UnaryConstraint)])
+
+
+""" Finds an unsatisfiable core of each problem with unsatisfiableCore and checks it by solving the
+    problem restricted to the core and to the core minus each of its constraints. Returns, per
+    problem, None if it has a solution, otherwise the size of its core, whether it is a subset of
+    the problem's constraints, whether the core alone has no solution and whether dropping any one
+    constraint gives one. """
+def core_minimality(*csp_files):
+    results = []
+    for csp_file in csp_files:
+        csp = Testing.csp_parse(Testing.get_lines(csp_file))
+        core = ConflictExplanation.unsatisfiableCore(csp)
+        if core is None:
+            results.append(None)
+            continue
+        constraints = set(id(cons) for cons in list(csp.binaryConstraints) + list(csp.unaryConstraints))
+        results.append([len(core), all(id(cons) in constraints for cons in core),
+            solve_with(with_constraints(csp, core)) is None,
+            all(solve_with(with_constraints(csp, core[:i] + core[i + 1:])) is not None for i in xrange(len(core)))])
+    return results
+
+
+""" Solves a problem, then a separately parsed copy of it in which var may not take value, with
+    phases saved on each problem (phaseSaving=True) and with one phase map passed to both solves.
+    Returns, per way, the search nodes of the second solve and whether its solution is valid, then
+    whether the phase map holds the second solution. """
+def phase_map_reuse(csp_file, var, value):
+    def solve_pair(phase_saving):
+        first = Testing.csp_parse(Testing.get_lines(csp_file))
+        solve_with(first, phaseSaving=phase_saving)
+        second = Testing.csp_parse(Testing.get_lines(csp_file))
+        second.addConstraint(BinaryCSP.BadValueConstraint(var, value))
+        stats = BinaryCSP.SearchStatistics()
+        solution = solve_with(second, stats=stats, phaseSaving=phase_saving)
+        return [stats.nodes, satisfies(second, solution)], solution
+    per_problem, ignored = solve_pair(True)
+    phases = {}
+    shared, solution = solve_pair(phases)
+    return {'perProblem': per_problem, 'phaseMap': shared, 'mapHoldsSolution': phases == solution}
+
+
+""" The names of the entries in a DomainCache directory, without the fingerprints. """
+def cache_entries(directory):
+    return sorted(name.split('-')[0] + '-' + name.split('-')[-1] for name in os.listdir(directory) if name.endswith('.root'))
+
+
+""" Solves problems through DomainCaches in a fresh directory: a first solve, a solve of a reparsed
+    copy through a new cache on the same directory, one after a version change, and the first
+    problem, then other_file's, in a cache that only has room for the larger entry. Also tries to
+    open a cache on a directory others can write to. Returns the hits, misses, entries and
+    whether the solution matches a solve without cache after each step, and which problems keep
+    an entry after the eviction. """
+def domain_cache_behaviour(csp_file, other_file):
+    directory = tempfile.mkdtemp()
+    steps = {}
+    def problem(path):
+        return Testing.csp_parse(Testing.get_lines(path))
+    def record(step, cache, solution, reference):
+        steps[step] = [cache.hits, cache.misses, cache_entries(directory), solution == reference]
+    try:
+        reference = solve_with(problem(csp_file))
+        cache = DomainCache.DomainCache(directory)
+        record('miss', cache, solve_with(problem(csp_file), domainCache=cache), reference)
+        cache = DomainCache.DomainCache(directory)
+        record('hit', cache, solve_with(problem(csp_file), domainCache=cache), reference)
+        version = DomainCache.CACHE_VERSION
+        DomainCache.CACHE_VERSION = version + 1
+        try:
+            cache = DomainCache.DomainCache(directory)
+            record('newVersion', cache, solve_with(problem(csp_file), domainCache=cache), reference)
+        finally:
+            DomainCache.CACHE_VERSION = version
+        cache.clear()
+        paths = [cache.path(problem(path).fingerprint(), True) for path in [csp_file, other_file]]
+        for path in [csp_file, other_file]:
+            solve_with(problem(path), domainCache=cache)
+        largest = max(os.path.getsize(path) for path in paths)
+        cache.clear()
+        cache = DomainCache.DomainCache(directory, maxBytes=largest)
+        solve_with(problem(csp_file), domainCache=cache)
+        os.utime(paths[0], (0, 0))
+        other = solve_with(problem(other_file), domainCache=cache)
+        record('eviction', cache, other, solve_with(problem(other_file)))
+        steps['kept'] = [os.path.exists(path) for path in paths]
+        os.chmod(directory, 0777)
+        try:
+            DomainCache.DomainCache(directory)
+            steps['sharedDirectory'] = 'accepted'
+        except ValueError:
+            steps['sharedDirectory'] = 'rejected'
+    finally:
+        shutil.rmtree(directory)
+    return steps
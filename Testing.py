@@ -8,6 +8,32 @@ def get_lines(fileName):
     return lines
 
 
+""" Expands the brace patterns of a name: {a,b,c} lists alternatives and {1..9} or {a..g} a
+    range of numbers or letters. Several braces expand to every combination, in order, so
+    '{a,b}{1..2}' gives a1 a2 b1 b2. A name without braces is returned as is. """
+def expand_pattern(pattern):
+    start = pattern.find('{')
+    if start < 0:
+        return [pattern]
+    end = pattern.index('}', start)
+    body = pattern[start + 1:end]
+    if '..' in body:
+        first, last = body.split('..')
+        if first.isdigit() and last.isdigit():
+            alternatives = [str(i) for i in xrange(int(first), int(last) + 1)]
+        else:
+            alternatives = [chr(i) for i in xrange(ord(first), ord(last) + 1)]
+    else:
+        alternatives = body.split(',')
+    return [pattern[:start] + alternative + rest
+        for alternative in alternatives for rest in expand_pattern(pattern[end + 1:])]
+
+def expand_patterns(patterns):
+    names = []
+    for pattern in patterns:
+        names.extend(expand_pattern(pattern))
+    return names
+
 """ Takes a list of lines and creates a CSP representation.
     Format:
     variable values ...
@@ -17,31 +43,52 @@ def get_lines(fileName):
     ...
     0
     unary_constraint_type inputs ... 
-    ... """
+    ...
+    Variable names and values may use brace patterns (see expand_pattern), and these directives
+    keep large instances compact:
+    @domain values ...                          shared domain of the variables declared after
+                                                it without values
+    @pairwise binary_constraint_type variables ...  the constraint between every pair of the
+                                                variables, expanded lazily by the CSP """
 def csp_parse(csp_lines):
     i = 0
     variables = []
     domains = []
+    shared_domain = []
     while csp_lines[i].strip() != '0':
         line = csp_lines[i].split()
-        variables.append(line[0])
-        domains.append(set(line[1:]))
         i += 1
+        if not line:
+            continue
+        if line[0] == '@domain':
+            shared_domain = expand_patterns(line[1:])
+            continue
+        values = expand_patterns(line[1:]) if len(line) > 1 else shared_domain
+        for variable in expand_pattern(line[0]):
+            variables.append(variable)
+            domains.append(set(values))
     i += 1
 
     binary_constraints = []
+    constraint_groups = []
     while csp_lines[i].strip() != '0':
         line = csp_lines[i].split()
-        binary_constraints.append(getattr(BinaryCSP, line[0])(*line[1:]))
         i += 1
+        if not line:
+            continue
+        if line[0] == '@pairwise':
+            constraint_groups.append(BinaryCSP.PairwiseConstraints(getattr(BinaryCSP, line[1]), expand_patterns(line[2:])))
+        else:
+            binary_constraints.append(getattr(BinaryCSP, line[0])(*line[1:]))
     i += 1
 
     unary_constraints = []
     while i < len(csp_lines):
         line = csp_lines[i].split()
-        unary_constraints.append(getattr(BinaryCSP, line[0])(*line[1:]))
         i += 1
-    return BinaryCSP.ConstraintSatisfactionProblem(variables, domains, binary_constraints, unary_constraints)
+        if line:
+            unary_constraints.append(getattr(BinaryCSP, line[0])(*line[1:]))
+    return BinaryCSP.ConstraintSatisfactionProblem(variables, domains, binary_constraints, unary_constraints, constraint_groups)
 
 """ Takes a list of lines and creates an Assignment representation.
     Format:
@@ -50,11 +97,12 @@ def csp_parse(csp_lines):
     ...
     0
     variable assigned_value
-    ... """
-def assignment_parse(assignment_lines):
-    csp = None
-    with open(assignment_lines[0].strip()) as csp_file:
-        csp = csp_parse(csp_file.readlines())
+    ...
+    The CSP is read from csp_filename unless an already parsed csp is passed in. """
+def assignment_parse(assignment_lines, csp=None):
+    if csp is None:
+        with open(assignment_lines[0].strip()) as csp_file:
+            csp = csp_parse(csp_file.readlines())
     assignment = BinaryCSP.Assignment(csp)
 
     i = 1
@@ -1,7 +1,14 @@
 # import sys
 import argparse
 import BinaryCSP
+import importlib
+import inspect
+import json
+import multiprocessing
+import sys
+import time
 import traceback
+from StringIO import StringIO
 from os import listdir
 from Testing import get_lines, csp_parse, assignment_parse
 
@@ -49,31 +56,72 @@ questionValues = {
     'q3': 2,
     'q4': 4,
     'q5': 4,
-    'q6': 2
+    'q6': 2,
+    'q7': 4
 }
 
+""" File lines by file name, kept for a whole run. CSPs and assignments are parsed afresh for
+    every test from the cached lines, since test functions modify them (SolverSession adds
+    constraints, reuseRootState stores a root state on the CSP). """
+class ParseCache:
+    def __init__(self):
+        self.lines = {}
+
+    def get_lines(self, file_name):
+        if file_name not in self.lines:
+            self.lines[file_name] = get_lines(file_name)
+        return self.lines[file_name]
+
+    def csp(self, file_name):
+        return csp_parse(self.get_lines(file_name))
+
+    def assignment(self, file_name):
+        lines = self.get_lines(file_name)
+        return assignment_parse(lines, self.csp(lines[0].strip()))
+
+""" Options of a timed run, set by main. With a cache, file lines are reused between tests;
+    records collects one timing record per test; precomputed holds the results of tests already
+    run by a process pool. """
+class RunSettings:
+    def __init__(self):
+        self.cache = None
+        self.count_nodes = False
+        self.records = None
+        self.precomputed = {}
+
+settings = RunSettings()
+
 """ Runs a single test. Either prints correct or a failure message.
-    Returns True if the test passes. ValueError if test does not exist. """
-def run_test(test_file_name):
+    Returns True if the test passes. ValueError if test does not exist.
+    With a record dictionary, the status, the seconds spent in the tested function and, with
+    count_nodes, its search nodes and constraint checks are stored in it. """
+def run_test(test_file_name, cache=None, record=None, count_nodes=False):
     result = None
     args = []
     hint = None
+    budgets = {}
     
     fnMonitor = FunctionInvokeMonitor()  # CHANGED
 
     try:
         with open(test_file_name) as test_file:
-            test_function = getattr(BinaryCSP, test_file.readline().strip())
+            test_function = resolve_function(test_file.readline().strip())
             for line in test_file:
                 line = line.split()
                 line_type = line[0]
 
                 if line_type == 'csp':
-                    with open(line[1]) as csp_file:
-                        args.append(csp_parse(csp_file.readlines()))
+                    if cache is not None:
+                        args.append(cache.csp(line[1]))
+                    else:
+                        with open(line[1]) as csp_file:
+                            args.append(csp_parse(csp_file.readlines()))
                 elif line_type == 'assignment':
-                    with open(line[1]) as assignment_file:
-                        args.append(assignment_parse(assignment_file.readlines()))
+                    if cache is not None:
+                        args.append(cache.assignment(line[1]))
+                    else:
+                        with open(line[1]) as assignment_file:
+                            args.append(assignment_parse(assignment_file.readlines()))
                 elif line_type == 'function':
                     if line[1]=='noInferences':
                         args.append(None)
@@ -83,8 +131,12 @@ def run_test(test_file_name):
                     args.append(getattr(BinaryCSP, line[1])(*line[2:]))
                 elif line_type == 'boolean':
                     args.append(line[1] == 'True')
+                elif line_type == 'number':
+                    args.append(float(line[1]) if '.' in line[1] else int(line[1]))
                 elif line_type == 'hint':
                     hint = ' '.join(line[1:])
+                elif line_type in budget_directives:
+                    budgets[line_type] = float(line[1])
                 else:
                     args.append(line[1])
     except IOError:
@@ -93,13 +145,67 @@ def run_test(test_file_name):
         print 'An error occured within the autograder: '
         print e
 
+    stats = None
+    limits = None
+    kwargs = {}
+    if count_nodes or budgets:
+        stats = BinaryCSP.SearchStatistics()
+    if budgets:
+        maxNodes = budgets.get('maxNodes')
+        maxChecks = budgets.get('maxChecks')
+        limits = BinaryCSP.SearchLimits(timeLimit=budgets.get('maxSeconds'), maxNodes=None if maxNodes is None else int(maxNodes),
+            maxChecks=None if maxChecks is None else int(maxChecks))
+        limits.start(stats)
+    if stats is not None:
+        assignments = [arg for arg in args if isinstance(arg, BinaryCSP.Assignment)]
+        for assignment in assignments:
+            assignment.stats = stats
+            assignment.limits = limits
+        if not assignments:
+            if accepts_argument(test_function, 'stats'):
+                kwargs['stats'] = stats
+            if limits is not None and accepts_argument(test_function, 'limits'):
+                kwargs['limits'] = limits
+    if record is not None:
+        record['status'] = 'fail'
+
+    start = time.time()
     try:
-        result = test_function(*args)
+        result = test_function(*args, **kwargs)
+    except BinaryCSP.SearchLimitExceeded, e:
+        print
+        print 'FAIL:', test_file_name
+        print 'Performance budget exceeded (%s limit): %s' % (e.reason, measured(stats, time.time() - start))
+        print
+        if record is not None:
+            record['status'] = 'budget'
+        return False
     except Exception, e:
         print
         print 'FAIL:', test_file_name
         print 'Something broke:'
         print traceback.format_exc()
+        if record is not None:
+            record['status'] = 'error'
+        return False
+    finally:
+        if record is not None:
+            record['seconds'] = time.time() - start
+            if stats is not None:
+                record['nodes'] = stats.nodes
+                record['constraintChecks'] = stats.constraintChecks
+
+    elapsed = time.time() - start
+    exceeded = budget_violations(budgets, stats, elapsed)
+    if isinstance(result, BinaryCSP.LimitReached):
+        exceeded.insert(0, '%s limit reached' % result.reason)
+    if exceeded:
+        print
+        print 'FAIL:', test_file_name
+        print 'Performance budget exceeded (%s): %s' % (', '.join(exceeded), measured(stats, elapsed))
+        print
+        if record is not None:
+            record['status'] = 'budget'
         return False
 
     try:
@@ -135,10 +241,106 @@ def run_test(test_file_name):
             print 'Hint:', hint
         print
 
-
+    if record is not None and success and len(namesNotInvoked)==0:
+        record['status'] = 'pass'
 
     return success
 
+""" The function a test calls: a name in BinaryCSP, or module.name for another module of the
+    project, such as TestFunctions.forbidden_pair_counts. """
+def resolve_function(name):
+    module, _, function = name.rpartition('.')
+    if not module:
+        return getattr(BinaryCSP, name)
+    return getattr(importlib.import_module(module), function)
+
+""" .test directives that set performance budgets: seconds spent in the tested function, and
+    the search nodes and constraint checks it counts in its SearchStatistics. Functions that take
+    SearchLimits are stopped as soon as they go over one; the totals are checked again once the
+    function returns, for functions that do not and for the checkInterval a limit may overshoot. """
+budget_directives = ('maxSeconds', 'maxNodes', 'maxChecks')
+
+""" Lists the budgets a finished test went over. """
+def budget_violations(budgets, stats, elapsed):
+    exceeded = []
+    if 'maxSeconds' in budgets and elapsed > budgets['maxSeconds']:
+        exceeded.append('maxSeconds %g' % budgets['maxSeconds'])
+    if 'maxNodes' in budgets and stats.nodes > budgets['maxNodes']:
+        exceeded.append('maxNodes %d' % budgets['maxNodes'])
+    if 'maxChecks' in budgets and stats.constraintChecks > budgets['maxChecks']:
+        exceeded.append('maxChecks %d' % budgets['maxChecks'])
+    return exceeded
+
+""" The measured time, nodes and constraint checks of a test, for budget failure messages. """
+def measured(stats, elapsed):
+    return '%.4f seconds, %d nodes, %d constraint checks' % (elapsed, stats.nodes, stats.constraintChecks)
+
+""" Whether a function takes a parameter of the given name. """
+def accepts_argument(function, name):
+    try:
+        return name in inspect.getargspec(function).args
+    except TypeError:
+        return False
+
+""" Runs a test with the run settings. The output and result of a test run by the process
+    pool are replayed instead, so that the report reads the same as a serial run. """
+def execute_test(test_file_name):
+    if test_file_name in settings.precomputed:
+        success, output, record, error = settings.precomputed.pop(test_file_name)
+        sys.stdout.write(output)
+        if settings.records is not None:
+            settings.records.append(record)
+        if error is not None:
+            raise ValueError(error)
+        return success
+    record = None
+    if settings.records is not None:
+        record = {'test': test_file_name, 'status': 'error'}
+        settings.records.append(record)
+    return run_test(test_file_name, settings.cache, record, settings.count_nodes)
+
+worker_cache = None
+
+def init_worker():
+    global worker_cache
+    worker_cache = ParseCache()
+
+""" Runs one test in a pool process, capturing what it prints. """
+def run_test_in_worker(task):
+    test_file_name, count_nodes = task
+    record = {'test': test_file_name}
+    error = None
+    success = False
+    stdout = sys.stdout
+    sys.stdout = output = StringIO()
+    try:
+        success = run_test(test_file_name, worker_cache, record, count_nodes)
+    except Exception, e:
+        error = str(e)
+        record['status'] = 'error'
+    finally:
+        sys.stdout = stdout
+    return test_file_name, (success, output.getvalue(), record, error)
+
+""" Runs tests across a process pool, each process with its own parse cache, and keeps the
+    results for execute_test. """
+def precompute_tests(tests, jobs, count_nodes):
+    pool = multiprocessing.Pool(jobs, init_worker)
+    try:
+        for test_file_name, outcome in pool.imap_unordered(run_test_in_worker, [(test, count_nodes) for test in tests]):
+            settings.precomputed[test_file_name] = outcome
+    finally:
+        pool.close()
+        pool.join()
+
+""" Prints the tests of a timed run, slowest first. """
+def print_timing_report(records):
+    print '%-60s %-6s %10s %10s %12s' % ('Test', 'Status', 'Seconds', 'Nodes', 'Checks')
+    for record in sorted(records, key=lambda record: -record.get('seconds', 0)):
+        print '%-60s %-6s %10.4f %10s %12s' % (record['test'], record.get('status', ''), record.get('seconds', 0),
+            record.get('nodes', ''), record.get('constraintChecks', ''))
+    print 'Total %.4fs in %d tests' % (sum(record.get('seconds', 0) for record in records), len(records))
+
 
 """ Runs every test in a list of tests.
     Prints an error message for invalid tests. """
@@ -148,7 +350,7 @@ def run_tests(tests):
     all_pass = True
     for test in tests:
         try:
-            all_pass = run_test(test) and all_pass
+            all_pass = execute_test(test) and all_pass
         except ValueError, e:
             print e
     if all_pass:
@@ -175,9 +377,9 @@ def eval_question(question):
     print 'Testing question: %s' % question
     print '--------------------------------------------------------------------'
     all_correct = True
-    for file_name in [name for name in listdir('test_cases/' + question) if 'test' in name]:
+    for test in question_tests(question):
         try:
-            all_correct = run_test('test_cases/' + question + '/' + file_name) and all_correct
+            all_correct = execute_test(test) and all_correct
         except Exception, e:
             print e
             print 
@@ -194,6 +396,11 @@ def eval_question(question):
     return 0, questionValues[question]
 
 
+""" The test files of a question. """
+def question_tests(question):
+    return ['test_cases/' + question + '/' + file_name for file_name in listdir('test_cases/' + question) if 'test' in file_name]
+
+
 """ Runs every question in a list of questions. Sums possible and earned points.
     Prints an error message for invalid questions."""
 def run_questions(questions):
@@ -216,8 +423,27 @@ def main():
     parser = argparse.ArgumentParser(description='Constraint satisfaction problem autograder')
     parser.add_argument('-q', '--question', action='append', dest='questions')
     parser.add_argument('-t', '--test', action='append', dest='tests')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='run tests across a pool of this many processes')
+    parser.add_argument('--timing', action='store_true', help='print the tests sorted by time')
+    parser.add_argument('--nodes', action='store_true', help='also count search nodes and constraint checks')
+    parser.add_argument('--json', dest='json_file', help='write the per-test timings to this file')
     args = vars(parser.parse_args())
 
+    timed = args['jobs'] > 1 or args['timing'] or args['nodes'] or args['json_file'] is not None
+    if timed:
+        settings.cache = ParseCache()
+        settings.count_nodes = args['nodes']
+        settings.records = []
+    if args['jobs'] > 1:
+        tests = list(args['tests'] or [])
+        questions = args['questions']
+        if args['tests'] is None and questions is None:
+            questions = questionValues.keys()
+        for question in questions or []:
+            if question in questionValues:
+                tests.extend(question_tests(question))
+        precompute_tests(tests, args['jobs'], args['nodes'])
+
     if args['tests'] is not None:
         run_tests(args['tests'])
     if args['questions'] is not None:
@@ -230,5 +456,13 @@ def main():
         print 'Autograder finished. Final score %d/%d' % (points, possible)
         print '--------------------------------------------------------------------'
 
+    if timed:
+        if args['timing'] or args['jobs'] > 1:
+            print
+            print_timing_report(settings.records)
+        if args['json_file'] is not None:
+            with open(args['json_file'], 'w') as json_file:
+                json.dump({'timestamp': time.time(), 'jobs': args['jobs'], 'tests': settings.records}, json_file, indent=1, sort_keys=True)
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,338 @@
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+import BinaryCSP
+from Testing import get_lines, csp_parse
+
+SUDOKU_LABELS = 'abcdefgjk'
+
+""" Random binary CSP in model B: n variables with d values, round(p1 * n(n-1)/2) constraints
+    and round(p2 * d^2) forbidden value pairs per constraint. When p2 is not given it is put at
+    the predicted phase transition, p2 = 1 - d^(-2 / (p1 (n - 1))). """
+def model_b(n=20, d=8, p1=0.3, p2=None, seed=0):
+    rng = random.Random(seed)
+    if p2 is None:
+        p2 = 1 - d ** (-2.0 / (p1 * (n - 1)))
+    variables = ['X%d' % i for i in xrange(n)]
+    values = [str(v) for v in xrange(d)]
+    pairs = [(a, b) for i, a in enumerate(variables) for b in variables[i + 1:]]
+    binary = []
+    for var1, var2 in rng.sample(pairs, int(round(p1 * len(pairs)))):
+        forbidden = forbidden_value_pairs(rng, values, int(round(p2 * d * d)))
+        binary.append(BinaryCSP.ForbiddenPairsConstraint(var1, var2, *forbidden))
+    return BinaryCSP.ConstraintSatisfactionProblem(variables, [set(values) for v in variables], binary, [])
+
+""" Random unordered value pairs that forbid exactly count ordered pairs once
+    ForbiddenPairsConstraint adds the reverse of each: (a, b) forbids two ordered pairs and
+    (a, a) one. """
+def forbidden_value_pairs(rng, values, count):
+    pairs = [(a, b) for i, a in enumerate(values) for b in values[i:]]
+    rng.shuffle(pairs)
+    chosen = []
+    left = []
+    size = 0
+    for a, b in pairs:
+        weight = 1 if a == b else 2
+        if size + weight <= count:
+            chosen.append((a, b))
+            size += weight
+        else:
+            left.append((a, b))
+    if size < count:
+        # Every (a, a) pair was taken and one ordered pair is still missing, so trade one of them
+        # for an (a, b) pair; the pairs left over are all of that kind
+        chosen.remove(next(pair for pair in chosen if pair[0] == pair[1]))
+        chosen.append(left[0])
+    return chosen
+
+""" Random graph coloring like csps/csp7.csp: n nodes, k colors, each edge present with
+    probability density. """
+def graph_coloring(n=30, k=3, density=0.15, seed=0):
+    rng = random.Random(seed)
+    variables = ['N%d' % i for i in xrange(n)]
+    colors = 'RGBYCMKW'[:k]
+    binary = []
+    for i, a in enumerate(variables):
+        for b in variables[i + 1:]:
+            if rng.random() < density:
+                binary.append(BinaryCSP.NotEqualConstraint(a, b))
+    return BinaryCSP.ConstraintSatisfactionProblem(variables, [set(colors) for v in variables], binary, [])
+
+""" Sudoku in the layout of csps/sudoku.csp with the given number of clues left from a
+    shuffled complete grid. Fewer clues make harder instances. """
+def sudoku(clues=30, seed=0):
+    rng = random.Random(seed)
+    def shuffled_groups():
+        bands = range(3)
+        rng.shuffle(bands)
+        order = []
+        for band in bands:
+            inner = range(3)
+            rng.shuffle(inner)
+            order.extend(band * 3 + i for i in inner)
+        return order
+    rows = shuffled_groups()
+    cols = shuffled_groups()
+    digits = range(1, 10)
+    rng.shuffle(digits)
+    grid = {}
+    for r in xrange(9):
+        for c in xrange(9):
+            grid[(r, c)] = digits[(3 * (rows[r] % 3) + rows[r] // 3 + cols[c]) % 9]
+
+    name = lambda r, c: SUDOKU_LABELS[r] + SUDOKU_LABELS[c]
+    variables = [name(r, c) for r in xrange(9) for c in xrange(9)]
+    binary = []
+    for r1 in xrange(9):
+        for c1 in xrange(9):
+            for r2 in xrange(9):
+                for c2 in xrange(9):
+                    if (r1, c1) >= (r2, c2):
+                        continue
+                    if r1 == r2 or c1 == c2 or (r1 // 3 == r2 // 3 and c1 // 3 == c2 // 3):
+                        binary.append(BinaryCSP.NotEqualConstraint(name(r1, c1), name(r2, c2)))
+    cells = sorted(grid)
+    unary = [BinaryCSP.GoodValueConstraint(name(r, c), str(grid[(r, c)])) for r, c in rng.sample(cells, clues)]
+    domain = [str(v) for v in xrange(1, 10)]
+    return BinaryCSP.ConstraintSatisfactionProblem(variables, [set(domain) for v in variables], binary, unary)
+
+""" N-queens with one variable per row and column numbers as values. """
+def n_queens(n=8):
+    variables = ['Q%d' % i for i in xrange(n)]
+    binary = []
+    for i in xrange(n):
+        for j in xrange(i + 1, n):
+            binary.append(BinaryCSP.QueensConstraint(variables[i], variables[j], j - i))
+    columns = [str(c) for c in xrange(n)]
+    return BinaryCSP.ConstraintSatisfactionProblem(variables, [set(columns) for v in variables], binary, [])
+
+""" Class schedule like Extra/classSchedule.csp: each class has a few random sections of the
+    form M9,10 or T9.5,11, all classes must not overlap and some classes are LazySchedule. """
+def class_schedule(classes=12, sections=5, lazy=0.5, seed=0):
+    rng = random.Random(seed)
+    variables = ['C%d' % i for i in xrange(classes)]
+    domains = []
+    for var in variables:
+        domain = set([])
+        while len(domain) < sections:
+            day = rng.choice('MT')
+            start = rng.choice(range(16, 34)) / 2.0
+            length = 1 if day == 'M' else 1.5
+            domain.add('%s%g,%g' % (day, start, start + length))
+        domains.append(domain)
+    binary = []
+    for i, a in enumerate(variables):
+        for b in variables[i + 1:]:
+            binary.append(BinaryCSP.NotOverlapConstraint(a, b))
+    unary = [BinaryCSP.LazySchedule(var) for var in variables if rng.random() < lazy]
+    return BinaryCSP.ConstraintSatisfactionProblem(variables, domains, binary, unary)
+
+""" Loads a problem from a .csp file so existing instances can be benchmarked too. """
+def csp_file(path):
+    return csp_parse(get_lines(path))
+
+generators = {
+    'modelB': model_b,
+    'coloring': graph_coloring,
+    'sudoku': sudoku,
+    'queens': n_queens,
+    'schedule': class_schedule,
+    'file': csp_file
+}
+
+suites = {
+    'small': [
+        'modelB:n=12,d=5,p1=0.4,seed=1',
+        'coloring:n=15,k=3,density=0.2,seed=1',
+        'sudoku:clues=50,seed=1',
+        'queens:n=6',
+        'schedule:classes=6,sections=4,seed=1'
+    ],
+    'default': [
+        'modelB:n=20,d=8,p1=0.3,seed=1',
+        'modelB:n=20,d=8,p1=0.3,seed=2',
+        'coloring:n=40,k=3,density=0.1,seed=1',
+        'coloring:n=30,k=4,density=0.2,seed=1',
+        'sudoku:clues=40,seed=1',
+        'sudoku:clues=30,seed=1',
+        'sudoku:clues=25,seed=1',
+        'queens:n=8',
+        'queens:n=12',
+        'schedule:classes=12,sections=5,seed=1',
+        'file:path=csps/csp7.csp',
+        'file:path=csps/sudoku1.csp'
+    ]
+}
+
+orderValuesMethods = ['orderValues', 'leastConstrainingValuesHeuristic', 'lazyLeastConstrainingValuesHeuristic']
+selectVariableMethods = ['chooseFirstVariable', 'minimumRemainingValuesHeuristic']
+inferenceMethods = ['noInferences', 'forwardChecking', 'maintainArcConsistency']
+
+""" Parses an instance spec such as 'sudoku:clues=30,seed=2' into a generator name and
+    keyword arguments. Numeric arguments are converted. """
+def parse_spec(spec):
+    name, _, rest = spec.partition(':')
+    if name not in generators:
+        raise ValueError('Unknown instance generator: %s' % name)
+    params = {}
+    for item in [item for item in rest.split(',') if item]:
+        key, _, value = item.partition('=')
+        for convert in (int, float):
+            try:
+                value = convert(value)
+                break
+            except ValueError:
+                pass
+        params[key] = value
+    return name, params
+
+def build_instance(spec):
+    name, params = parse_spec(spec)
+    return generators[name](**params)
+
+""" Every heuristic/inference combination solve accepts. """
+def all_combinations():
+    return [{'orderValuesMethod': o, 'selectVariableMethod': s, 'inferenceMethod': i, 'useAC3': a}
+        for o in orderValuesMethods for s in selectVariableMethods for i in inferenceMethods for a in (False, True)]
+
+""" Solves one instance with one combination. Runs inside a child process so that the peak
+    memory reported belongs to this run only. """
+def run_one(spec, combo, repeat, queue):
+    try:
+        order = getattr(BinaryCSP, combo['orderValuesMethod'])
+        select = getattr(BinaryCSP, combo['selectVariableMethod'])
+        inference = getattr(BinaryCSP, combo['inferenceMethod'])
+        best = None
+        for i in xrange(repeat):
+            csp = build_instance(spec)
+            stats = BinaryCSP.SearchStatistics()
+            start = time.time()
+            solution = BinaryCSP.solve(csp, order, select, inference, combo['useAC3'], stats)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        record = {'status': 'solved' if solution is not None else 'unsatisfiable', 'seconds': best}
+        record.update(stats.asDict())
+        record['peakMemoryKB'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        queue.put(record)
+    except Exception, e:
+        queue.put({'status': 'error', 'error': '%s: %s' % (type(e).__name__, e)})
+
+""" Runs one instance/combination pair in a fresh process with a timeout. """
+def measure(spec, combo, repeat, timeout):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=run_one, args=(spec, combo, repeat, queue))
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+        record = {'status': 'timeout', 'seconds': timeout}
+    else:
+        record = queue.get() if not queue.empty() else {'status': 'error', 'error': 'no result'}
+    result = {'instance': spec}
+    result.update(combo)
+    result.update(record)
+    return result
+
+def run_benchmarks(specs, combos, repeat, timeout):
+    results = []
+    for spec in specs:
+        for combo in combos:
+            result = measure(spec, combo, repeat, timeout)
+            print >> sys.stderr, '%-45s %-35s %-32s %-24s AC3=%-5s %-13s %s' % (spec, combo['orderValuesMethod'],
+                combo['selectVariableMethod'], combo['inferenceMethod'], combo['useAC3'], result['status'],
+                '%.4fs' % result['seconds'] if 'seconds' in result else '')
+            results.append(result)
+    return {
+        'version': 1,
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+
+def result_key(result):
+    return (result['instance'], result['orderValuesMethod'], result['selectVariableMethod'],
+        result['inferenceMethod'], result['useAC3'])
+
+""" Compares two benchmark runs. A result is a regression when it is slower by more than the
+    threshold ratio and by more than minSeconds, when it does more nodes, backtracks or constraint checks,
+    or when its status changed. Returns the list of regression messages. """
+def compare_runs(old, new, threshold, minSeconds):
+    oldResults = dict((result_key(r), r) for r in old['results'])
+    regressions = []
+    for result in new['results']:
+        key = result_key(result)
+        if key not in oldResults:
+            continue
+        before = oldResults[key]
+        name = '%s [%s/%s/%s/AC3=%s]' % key
+        if before['status'] != result['status']:
+            regressions.append('%s: status %s -> %s' % (name, before['status'], result['status']))
+            continue
+        if 'seconds' in before and 'seconds' in result:
+            delta = result['seconds'] - before['seconds']
+            if delta > minSeconds and result['seconds'] > before['seconds'] * (1 + threshold):
+                regressions.append('%s: %.4fs -> %.4fs' % (name, before['seconds'], result['seconds']))
+        for counter in ('nodes', 'backtracks', 'constraintChecks'):
+            if counter in before and counter in result and result[counter] > before[counter]:
+                regressions.append('%s: %s %d -> %d' % (name, counter, before[counter], result[counter]))
+    return regressions
+
+""" Parses command line arguments. Runs a benchmark suite and writes JSON, or compares two
+    previously written runs and exits with status 1 on regressions. """
+def main():
+    parser = argparse.ArgumentParser(description='Constraint satisfaction problem benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run = subparsers.add_parser('run', help='run a benchmark suite')
+    run.add_argument('-s', '--suite', default='default', choices=sorted(suites))
+    run.add_argument('-i', '--instance', action='append', dest='instances',
+        help='instance spec such as sudoku:clues=30,seed=2 (replaces the suite)')
+    run.add_argument('--order', action='append', choices=orderValuesMethods)
+    run.add_argument('--select', action='append', choices=selectVariableMethods)
+    run.add_argument('--inference', action='append', choices=inferenceMethods)
+    run.add_argument('-r', '--repeat', type=int, default=3)
+    run.add_argument('--timeout', type=float, default=30.0)
+    run.add_argument('-o', '--output', default='-')
+
+    compare = subparsers.add_parser('compare', help='compare two benchmark runs')
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=0.10)
+    compare.add_argument('--min-seconds', type=float, default=0.005, dest='minSeconds')
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        specs = args.instances or suites[args.suite]
+        combos = [c for c in all_combinations()
+            if (not args.order or c['orderValuesMethod'] in args.order)
+            and (not args.select or c['selectVariableMethod'] in args.select)
+            and (not args.inference or c['inferenceMethod'] in args.inference)]
+        report = run_benchmarks(specs, combos, args.repeat, args.timeout)
+        if args.output == '-':
+            json.dump(report, sys.stdout, indent=1, sort_keys=True)
+            print
+        else:
+            with open(args.output, 'w') as outFile:
+                json.dump(report, outFile, indent=1, sort_keys=True)
+    else:
+        with open(args.old) as oldFile:
+            old = json.load(oldFile)
+        with open(args.new) as newFile:
+            new = json.load(newFile)
+        regressions = compare_runs(old, new, args.threshold, args.minSeconds)
+        for regression in regressions:
+            print 'REGRESSION:', regression
+        if regressions:
+            print '%d regressions' % len(regressions)
+            sys.exit(1)
+        print 'No regressions'
+
+if __name__ == '__main__':
+    main()
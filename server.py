@@ -0,0 +1,281 @@
+import BaseHTTPServer
+import SocketServer
+import argparse
+import hashlib
+import json
+import multiprocessing
+import sys
+import threading
+import time
+import urllib2
+from collections import OrderedDict
+import BinaryCSP
+from Testing import csp_parse
+
+""" Local solver service. Keeps worker processes warm and caches parsed CSPs so that a solve
+    request pays neither interpreter startup nor parsing.
+
+    POST /load   {"csp": "<.csp file text>"}                      -> {"ref": "<sha1>"}
+    POST /solve  {"csp": "<.csp file text>"} or {"ref": "<sha1>"}, with optional
+                 "unary": [["BadValueConstraint", "A", "1"], ...]  extra unary constraints
+                 "order", "select", "inference": names from ORDER_METHODS, SELECT_METHODS
+                     and INFERENCE_METHODS
+                 "useAC3": true/false, "timeLimit": seconds
+                 -> {"ref", "status", "solution", "seconds"}
+    GET  /stats                                                   -> cache and request counters
+
+    Requests for the same CSP always go to the same worker, which keeps the parsed problem and
+    its root state (see ConstraintSatisfactionProblem.rootState) in its own LRU cache. The
+    server keeps the CSP text in an LRU cache keyed by content hash, so later requests can send
+    only the ref. A ref that has been evicted gets status 'unknown-ref' and has to be sent again
+    in full. A request naming a function or constraint class outside those whitelists gets
+    status 'bad-request' and HTTP 400. """
+
+class LRUCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key not in self.items:
+            self.misses += 1
+            return None
+        self.hits += 1
+        value = self.items.pop(key)
+        self.items[key] = value
+        return value
+
+    def put(self, key, value):
+        if key in self.items:
+            self.items.pop(key)
+        elif len(self.items) >= self.capacity:
+            self.items.popitem(last=False)
+        self.items[key] = value
+
+    def __len__(self):
+        return len(self.items)
+
+def content_hash(text):
+    return hashlib.sha1(text).hexdigest()
+
+""" Functions and constraint classes a request may name. Only these are looked up, so a request
+    cannot reach any other attribute of BinaryCSP. """
+ORDER_METHODS = dict((method.__name__, method) for method in [BinaryCSP.orderValues,
+    BinaryCSP.leastConstrainingValuesHeuristic, BinaryCSP.lazyLeastConstrainingValuesHeuristic])
+SELECT_METHODS = dict((method.__name__, method) for method in [BinaryCSP.chooseFirstVariable,
+    BinaryCSP.minimumRemainingValuesHeuristic])
+INFERENCE_METHODS = dict((method.__name__, method) for method in [BinaryCSP.noInferences,
+    BinaryCSP.forwardChecking, BinaryCSP.maintainArcConsistency])
+UNARY_CONSTRAINTS = dict((cls.__name__, cls) for cls in [BinaryCSP.BadValueConstraint,
+    BinaryCSP.GoodValueConstraint])
+
+""" Checks the names and unary constraint specs in a solve request against the whitelists above.
+    Returns an error message, or None if the request is acceptable. """
+def request_error(request):
+    for key, methods in [('order', ORDER_METHODS), ('select', SELECT_METHODS), ('inference', INFERENCE_METHODS)]:
+        if key in request and request[key] not in methods:
+            return 'unknown %s method %r' % (key, request[key])
+    unary = request.get('unary', [])
+    if not isinstance(unary, list):
+        return 'unary must be a list'
+    for spec in unary:
+        if not isinstance(spec, list) or len(spec) != 3:
+            return 'unary constraint %r should be [name, variable, value]' % (spec,)
+        if spec[0] not in UNARY_CONSTRAINTS:
+            return 'unknown unary constraint %r' % (spec[0],)
+    return None
+
+""" Builds extra unary constraints from [name, variable, value] lists, the way csp_parse reads
+    constraint lines. """
+def build_unary(specs):
+    return [UNARY_CONSTRAINTS[spec[0]](*spec[1:]) for spec in specs]
+
+""" Solves one request inside a worker. The parsed CSP comes from the worker's cache when it
+    has it, and extra unary constraints are applied to the cached root state. """
+def solve_request(cache, ref, text, request):
+    csp = cache.get(ref)
+    if csp is None:
+        csp = csp_parse(text.splitlines(True))
+        cache.put(ref, csp)
+    order = ORDER_METHODS[request.get('order', 'leastConstrainingValuesHeuristic')]
+    select = SELECT_METHODS[request.get('select', 'minimumRemainingValuesHeuristic')]
+    inference = INFERENCE_METHODS[request.get('inference', 'forwardChecking')]
+    limits = None
+    if request.get('timeLimit') is not None:
+        limits = BinaryCSP.SearchLimits(timeLimit=float(request['timeLimit']))
+    start = time.time()
+    solution = BinaryCSP.solve(csp, order, select, inference, request.get('useAC3', True), limits=limits,
+        extraUnaryConstraints=build_unary(request.get('unary', [])), reuseRootState=True)
+    response = {'ref': ref, 'seconds': time.time() - start}
+    if isinstance(solution, BinaryCSP.LimitReached):
+        response['status'] = 'limit'
+        response['reason'] = solution.reason
+    elif solution is None:
+        response['status'] = 'unsatisfiable'
+    else:
+        response['status'] = 'solved'
+        response['solution'] = dict(solution)
+    return response
+
+""" Main loop of a worker process: reads (ref, text, request) from its end of the pipe and
+    writes back a response dictionary. """
+def worker_loop(connection, cacheSize):
+    cache = LRUCache(cacheSize)
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            return
+        if message is None:
+            return
+        ref, text, request = message
+        try:
+            response = solve_request(cache, ref, text, request)
+        except Exception, e:
+            response = {'ref': ref, 'status': 'error', 'error': '%s: %s' % (type(e).__name__, e)}
+        connection.send(response)
+
+class Worker:
+    def __init__(self, cacheSize):
+        self.cacheSize = cacheSize
+        self.lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker_loop, args=(child, self.cacheSize))
+        self.process.daemon = True
+        self.process.start()
+
+    """ Sends one request and waits for its response. A worker that died is restarted and the
+        request reported as an error. """
+    def call(self, ref, text, request):
+        with self.lock:
+            try:
+                self.connection.send((ref, text, request))
+                return self.connection.recv()
+            except (EOFError, IOError):
+                self.process.join(0)
+                self.start()
+                return {'ref': ref, 'status': 'error', 'error': 'worker died'}
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except IOError:
+            pass
+        self.process.join(1)
+
+class SolverService:
+    def __init__(self, workers, cacheSize):
+        self.workers = [Worker(cacheSize) for i in xrange(workers)]
+        self.texts = LRUCache(cacheSize)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def load(self, text):
+        ref = content_hash(text)
+        with self.lock:
+            self.texts.put(ref, text)
+        return ref
+
+    def solve(self, request):
+        error = request_error(request)
+        if error is not None:
+            return {'ref': request.get('ref'), 'status': 'bad-request', 'error': error}
+        if 'csp' in request:
+            ref = self.load(request['csp'])
+            text = request['csp']
+        else:
+            ref = request['ref']
+            with self.lock:
+                text = self.texts.get(ref)
+            if text is None:
+                return {'ref': ref, 'status': 'unknown-ref'}
+        with self.lock:
+            self.requests += 1
+        return self.workers[int(ref, 16) % len(self.workers)].call(ref, text, request)
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'workers': len(self.workers), 'cached': len(self.texts),
+                'cacheHits': self.texts.hits, 'cacheMisses': self.texts.misses}
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+class RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def reply(self, code, body):
+        data = json.dumps(body)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self.reply(200, self.server.service.stats())
+        else:
+            self.reply(404, {'status': 'error', 'error': 'unknown path %s' % self.path})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+        except ValueError, e:
+            self.reply(400, {'status': 'error', 'error': 'bad JSON: %s' % e})
+            return
+        if self.path == '/load' and 'csp' in request:
+            self.reply(200, {'ref': self.server.service.load(request['csp'])})
+        elif self.path == '/solve' and ('csp' in request or 'ref' in request):
+            response = self.server.service.solve(request)
+            self.reply({'unknown-ref': 404, 'bad-request': 400}.get(response['status'], 200), response)
+        else:
+            self.reply(400, {'status': 'error', 'error': 'bad request for %s' % self.path})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class SolverServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service, verbose=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, RequestHandler)
+        self.service = service
+        self.verbose = verbose
+
+""" Client helper: posts a request to a running server and returns the decoded response.
+    Responses with an error status code are returned as well. """
+def post(url, path, request):
+    try:
+        response = urllib2.urlopen(urllib2.Request(url + path, json.dumps(request), {'Content-Type': 'application/json'}))
+    except urllib2.HTTPError, e:
+        response = e
+    return json.loads(response.read())
+
+def main():
+    parser = argparse.ArgumentParser(description='Local constraint satisfaction solver service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('-p', '--port', type=int, default=8765)
+    parser.add_argument('-w', '--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('-c', '--cache', type=int, default=64, help='CSPs kept per cache')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    service = SolverService(args.workers, args.cache)
+    server = SolverServer((args.host, args.port), service, args.verbose)
+    print >> sys.stderr, 'Serving on http://%s:%d with %d workers' % (args.host, args.port, args.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+if __name__ == '__main__':
+    main()